@@ -0,0 +1,167 @@
+"""
+SQL Lab Results Backend with Chunked Arrow Storage
+Superset writes each async SQL Lab result as one zlib-compressed msgpack
+blob whose 'data' field is an Arrow IPC stream of the whole result (up to
+SQL_MAX_ROW rows). ArrowResultsBackend splits that stream into record
+batches of RESULTS_CHUNK_ROWS rows, stores each batch zstd-compressed under
+its own key next to a small metadata key, and reassembles only the chunks a
+reader needs:
+
+- the SQL Lab results endpoint asks for DISPLAY_MAX_ROW rows, so get() reads
+  just the chunks covering them (the payload keeps the full row count, so
+  SQL Lab still shows that the display limit was reached);
+- CSV export and other callers without a row limit get the whole result;
+- read_table(key, offset, limit) returns any page as an Arrow table.
+
+Configured as RESULTS_BACKEND in superset_config.py (mounted into
+/app/pythonpath). Blobs that are not msgpack + Arrow (RESULTS_BACKEND_USE_MSGPACK
+off) are stored unchanged under the metadata key.
+"""
+
+import logging
+import math
+import os
+import zlib
+
+import msgpack
+import pyarrow as pa
+from flask_caching.backends.rediscache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+RESULTS_CHUNK_ROWS = int(os.environ.get('RESULTS_CHUNK_ROWS', '5000'))
+RESULTS_ARROW_COMPRESSION = os.environ.get('RESULTS_ARROW_COMPRESSION', 'zstd')
+
+FORMAT_FIELD = '__arrow_chunks__'
+
+# SQL Lab fetches results through this endpoint with a 'rows' display limit
+SQLLAB_RESULTS_PATH = '/api/v1/sqllab/results'
+
+
+def requested_rows() -> int:
+    """Row limit of the SQL Lab results request being served, if any."""
+    try:
+        import prison
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if not has_request_context() or not request.path.startswith(SQLLAB_RESULTS_PATH):
+        return None
+    try:
+        rows = prison.loads(request.args.get('q', '()')).get('rows')
+    except Exception:
+        return None
+    return int(rows) if rows else None
+
+
+def write_stream(table: pa.Table, compression: str = None) -> bytes:
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_stream(data: bytes) -> pa.Table:
+    return pa.ipc.open_stream(pa.BufferReader(data)).read_all()
+
+
+class ArrowResultsBackend(RedisCache):
+    """RESULTS_BACKEND storing SQL Lab results as compressed Arrow record batch chunks."""
+
+    def __init__(self, *args, chunk_rows: int = RESULTS_CHUNK_ROWS,
+                 compression: str = RESULTS_ARROW_COMPRESSION, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+
+    def _meta_key(self, key: str) -> str:
+        return f"{self._get_prefix()}{key}"
+
+    def _chunk_key(self, key: str, index: int) -> str:
+        return f"{self._get_prefix()}{key}:chunk:{index}"
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        try:
+            payload = msgpack.loads(zlib.decompress(value), raw=False)
+            table = read_stream(payload['data'])
+        except Exception:
+            payload = None
+        if not isinstance(payload, dict):
+            chunks, meta = [], value
+        else:
+            batches = (table.to_batches(max_chunksize=self.chunk_rows)
+                       or [pa.RecordBatch.from_pylist([], schema=table.schema)])
+            chunks = [write_stream(pa.Table.from_batches([batch]), self.compression) for batch in batches]
+            payload['data'] = None
+            payload[FORMAT_FIELD] = {'chunks': len(chunks), 'chunk_rows': self.chunk_rows, 'rows': table.num_rows}
+            meta = msgpack.dumps(payload, use_bin_type=True)
+
+        pipe = self._write_client.pipeline()
+        for index, chunk in enumerate(chunks):
+            self._store(pipe, self._chunk_key(key, index), chunk, timeout)
+        self._store(pipe, self._meta_key(key), meta, timeout)
+        pipe.execute()
+        if chunks:
+            logger.debug(f"Stored results {key}: {table.num_rows} rows in {len(chunks)} chunks, "
+                         f"{sum(map(len, chunks)) / 1024**2:.1f} MB ({len(value) / 1024**2:.1f} MB as received)")
+        return True
+
+    @staticmethod
+    def _store(pipe, name: str, value: bytes, timeout: int):
+        if timeout == -1:
+            pipe.set(name, value)
+        else:
+            pipe.setex(name, timeout, value)
+
+    def _load_meta(self, key: str):
+        """(payload, chunk info), (raw blob, None) for unconverted results, or (None, None) when missing."""
+        meta = self._read_client.get(self._meta_key(key))
+        if meta is None:
+            return None, None
+        try:
+            payload = msgpack.loads(meta, raw=False)
+        except Exception:
+            return meta, None
+        if not (isinstance(payload, dict) and FORMAT_FIELD in payload):
+            return meta, None
+        return payload, payload.pop(FORMAT_FIELD)
+
+    def read_table(self, key: str, offset: int = 0, limit: int = None) -> pa.Table:
+        """Rows [offset, offset + limit) of a stored result, reading only the chunks that hold them."""
+        payload, info = self._load_meta(key)
+        if info is None:
+            return None
+        return self._read_rows(key, info, offset, limit)
+
+    def _read_rows(self, key: str, info: dict, offset: int, limit: int) -> pa.Table:
+        end = info['rows'] if limit is None else min(info['rows'], offset + limit)
+        first = min(offset // info['chunk_rows'], info['chunks'] - 1)
+        last = max(first, math.ceil(end / info['chunk_rows']) - 1)
+        last = min(last, info['chunks'] - 1)
+        blobs = self._read_client.mget([self._chunk_key(key, i) for i in range(first, last + 1)])
+        if any(blob is None for blob in blobs):
+            return None
+        table = pa.concat_tables([read_stream(blob) for blob in blobs])
+        return table.slice(offset - first * info['chunk_rows'], max(0, end - offset))
+
+    def get(self, key):
+        payload, info = self._load_meta(key)
+        if info is None:
+            return payload
+        table = self._read_rows(key, info, 0, requested_rows())
+        if table is None:
+            return None
+        payload['data'] = write_stream(table)
+        return zlib.compress(msgpack.dumps(payload, use_bin_type=True), 1)
+
+    def has(self, key):
+        return bool(self._read_client.exists(self._meta_key(key)))
+
+    def delete(self, key):
+        payload, info = self._load_meta(key)
+        names = [self._meta_key(key)]
+        if info is not None:
+            names += [self._chunk_key(key, i) for i in range(info['chunks'])]
+        return bool(self._write_client.delete(*names))
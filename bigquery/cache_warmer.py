@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Dashboard Cache Warm-up
+Runs the query of every chart on the dashboards of superset_charts.sql
+through Superset's warm_up_cache API, with each dashboard's default filters,
+so the results are in the data cache before anyone opens the dashboards.
+refresh_marts.py calls warm_dashboards() after a successful refresh; the
+script can also be run on its own.
+
+Usage:
+    python bigquery/cache_warmer.py
+    python bigquery/cache_warmer.py --dashboards 1 2 --concurrency 2
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+SUPERSET_URL = os.environ.get('SUPERSET_URL', f"http://localhost:{os.environ.get('SUPERSET_PORT', '8088')}")
+WARMUP_USERNAME = os.environ.get('WARMUP_USERNAME', os.environ.get('ADMIN_USERNAME', 'admin'))
+WARMUP_PASSWORD = os.environ.get('WARMUP_PASSWORD', os.environ.get('ADMIN_PASSWORD', ''))
+
+# Executive Overview, Channel & Campaign, Funnels & Cohorts, Deep Analysis
+WARMUP_DASHBOARD_IDS = [int(i) for i in os.environ.get('WARMUP_DASHBOARD_IDS', '1,2,3,4').split(',') if i]
+
+# Chart queries in flight at once (each is one BigQuery job on a cold cache)
+WARMUP_CONCURRENCY = int(os.environ.get('WARMUP_CONCURRENCY', '4'))
+WARMUP_TIMEOUT_SEC = int(os.environ.get('WARMUP_TIMEOUT_SEC', '300'))
+
+
+class SupersetSession:
+    """Logged-in Superset REST API session (JWT plus CSRF token for PUT)."""
+
+    def __init__(self, url: str = SUPERSET_URL, username: str = WARMUP_USERNAME,
+                 password: str = WARMUP_PASSWORD):
+        self.url = url.rstrip('/')
+        self.http = requests.Session()
+        response = self.http.post(f"{self.url}/api/v1/security/login", timeout=30, json={
+            'username': username, 'password': password, 'provider': 'db', 'refresh': False})
+        response.raise_for_status()
+        self.http.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+        csrf = self.http.get(f"{self.url}/api/v1/security/csrf_token/", timeout=30)
+        csrf.raise_for_status()
+        self.http.headers.update({'X-CSRFToken': csrf.json()['result'], 'Referer': self.url})
+
+    def dashboard_charts(self, dashboard_id: int) -> list:
+        response = self.http.get(f"{self.url}/api/v1/dashboard/{dashboard_id}/charts", timeout=30)
+        response.raise_for_status()
+        return [{'id': chart['id'], 'name': chart.get('slice_name')} for chart in response.json()['result']]
+
+    def warm_up_chart(self, chart_id: int, dashboard_id: int) -> str:
+        """Run one chart's query with the dashboard's default filters; returns the error, if any."""
+        response = self.http.put(f"{self.url}/api/v1/chart/warm_up_cache", timeout=WARMUP_TIMEOUT_SEC,
+                                 json={'chart_id': chart_id, 'dashboard_id': dashboard_id})
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}: {response.text[:200]}"
+        for result in response.json().get('result', []):
+            if result.get('viz_error'):
+                return str(result['viz_error'])
+        return None
+
+
+def warm_dashboards(dashboard_ids: list = None, concurrency: int = WARMUP_CONCURRENCY) -> dict:
+    """
+    Warm every chart of the dashboards, concurrency charts at a time.
+
+    Returns {'charts', 'failed': [{'dashboard_id', 'chart_id', 'name', 'error'}],
+    'wall_sec', 'slowest': [(name, seconds)]}; never raises for a failing chart.
+    """
+    dashboard_ids = dashboard_ids or WARMUP_DASHBOARD_IDS
+    start = time.monotonic()
+    session = SupersetSession()
+    tasks = [(dashboard_id, chart) for dashboard_id in dashboard_ids
+             for chart in session.dashboard_charts(dashboard_id)]
+    logger.info(f"Warming {len(tasks)} charts on dashboards {', '.join(map(str, dashboard_ids))} "
+                f"({concurrency} at a time)...")
+
+    def warm(dashboard_id, chart):
+        chart_start = time.monotonic()
+        try:
+            error = session.warm_up_chart(chart['id'], dashboard_id)
+        except requests.RequestException as e:
+            error = str(e)
+        return error, time.monotonic() - chart_start
+
+    failed, timings = [], []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(warm, dashboard_id, chart): (dashboard_id, chart) for dashboard_id, chart in tasks}
+        for future in as_completed(futures):
+            dashboard_id, chart = futures[future]
+            error, seconds = future.result()
+            timings.append((chart['name'], seconds))
+            if error:
+                failed.append({'dashboard_id': dashboard_id, 'chart_id': chart['id'], 'name': chart['name'],
+                               'error': error})
+                logger.warning(f"  ✗ {chart['name']} (chart {chart['id']}, dashboard {dashboard_id}): {error}")
+
+    report = {'charts': len(tasks), 'failed': failed, 'wall_sec': time.monotonic() - start,
+              'slowest': sorted(timings, key=lambda t: -t[1])[:5]}
+    log_warmup_report(report)
+    return report
+
+
+def log_warmup_report(report: dict):
+    logger.info(f"  ✓ Cache warm-up: {report['charts'] - len(report['failed'])}/{report['charts']} charts "
+                f"in {report['wall_sec']:.1f}s")
+    for name, seconds in report['slowest']:
+        logger.info(f"    {seconds:6.1f}s  {name}")
+    if report['failed']:
+        logger.warning(f"  ⚠ {len(report['failed'])} charts failed to warm: "
+                       f"{', '.join(str(f['chart_id']) for f in report['failed'])}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm the Superset data cache for the dashboard charts')
+    parser.add_argument('--dashboards', nargs='+', type=int, default=WARMUP_DASHBOARD_IDS,
+                        help=f"Dashboard ids (default: {' '.join(map(str, WARMUP_DASHBOARD_IDS))})")
+    parser.add_argument('--concurrency', type=int, default=WARMUP_CONCURRENCY,
+                        help=f'Charts warmed at once (default: {WARMUP_CONCURRENCY})')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result = warm_dashboards(args.dashboards, concurrency=args.concurrency)
+    exit(1 if result['failed'] else 0)
@@ -0,0 +1,116 @@
+"""
+Celery Queues per Task Family
+Routes Superset's Celery tasks to one queue per workload, so each worker
+service in docker-compose.yml serves one family with its own concurrency:
+
+    sqllab        SQL Lab async queries on the marts (interactive)
+    sqllab_heavy  SQL Lab queries that read ineco_staging or the raw GA4 export
+    reports       alert and report scheduling and execution
+    cache         cache warm-up and thumbnails
+    celery        everything else (log pruning, ...)
+
+A long stg_events query therefore waits for a sqllab_heavy slot instead of
+holding one of the slots that short mart queries and scheduled reports use.
+
+Every task is stamped with its enqueue time; when a worker starts it, the
+wait is added to a capped per-queue sample list in Redis. Show queue depth
+and wait percentiles with:
+    docker exec superset_worker python /app/pythonpath/celery_queues.py
+"""
+
+import os
+import re
+import time
+
+from celery.signals import before_task_publish, task_prerun
+
+SQLLAB_QUEUE = 'sqllab'
+SQLLAB_HEAVY_QUEUE = 'sqllab_heavy'
+DEFAULT_QUEUE = 'celery'
+
+TASK_QUEUES = {
+    'sql_lab.get_sql_results': SQLLAB_QUEUE,
+    'load_chart_data_into_cache': SQLLAB_QUEUE,
+    'load_explore_json_into_cache': SQLLAB_QUEUE,
+    'reports.scheduler': 'reports',
+    'reports.execute': 'reports',
+    'reports.prune_log': 'reports',
+    'cache-warmup': 'cache',
+    'fetch_url': 'cache',
+    'cache_chart_thumbnail': 'cache',
+    'cache_dashboard_thumbnail': 'cache',
+    'cache_dashboard_screenshot': 'cache',
+}
+QUEUES = [SQLLAB_QUEUE, SQLLAB_HEAVY_QUEUE, 'reports', 'cache', DEFAULT_QUEUE]
+
+# Event-level tables: scans here are GBs, not MBs
+HEAVY_TABLES = re.compile(r'\b(ineco_staging|analytics_\d+)\b', re.IGNORECASE)
+
+ENQUEUED_AT_HEADER = 'ineco_enqueued_at'
+WAIT_SAMPLES_KEY = 'ineco:celery_wait:{queue}'
+WAIT_SAMPLES = 1000
+
+_client = None
+_client_pid = None
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery task_routes entry: the queue of a task family."""
+    queue = TASK_QUEUES.get(name, DEFAULT_QUEUE)
+    if name == 'sql_lab.get_sql_results':
+        rendered_query = kwargs.get('rendered_query') or (args[1] if len(args) > 1 else '')
+        if HEAVY_TABLES.search(rendered_query or ''):
+            queue = SQLLAB_HEAVY_QUEUE
+    return {'queue': queue}
+
+
+def broker_client():
+    """Redis client on the broker database, one per process (workers fork)."""
+    global _client, _client_pid
+    if _client_pid != os.getpid():
+        import redis
+        _client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=int(os.environ.get('REDIS_PORT', '6379')),
+                              db=int(os.environ.get('REDIS_CELERY_DB', '0')), socket_timeout=2)
+        _client_pid = os.getpid()
+    return _client
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    enqueued_at = task.request.get(ENQUEUED_AT_HEADER) if task is not None else None
+    if enqueued_at is None:
+        return
+    queue = (task.request.delivery_info or {}).get('routing_key') or DEFAULT_QUEUE
+    try:
+        pipe = broker_client().pipeline()
+        key = WAIT_SAMPLES_KEY.format(queue=queue)
+        pipe.lpush(key, f"{time.time() - float(enqueued_at):.3f}")
+        pipe.ltrim(key, 0, WAIT_SAMPLES - 1)
+        pipe.execute()
+    except Exception:
+        # Metrics must never fail a query or a report
+        pass
+
+
+def queue_stats(client) -> list:
+    """Per queue: tasks waiting now and wait-time percentiles of the last WAIT_SAMPLES tasks."""
+    stats = []
+    for queue in QUEUES:
+        waits = sorted(float(w) for w in client.lrange(WAIT_SAMPLES_KEY.format(queue=queue), 0, -1))
+        pick = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+        stats.append({'queue': queue, 'depth': client.llen(queue), 'samples': len(waits),
+                      'p50_sec': pick(0.5), 'p95_sec': pick(0.95), 'max_sec': waits[-1] if waits else 0.0})
+    return stats
+
+
+if __name__ == '__main__':
+    print(f"{'queue':<14} {'waiting':>8} {'sampled':>8} {'p50 wait':>9} {'p95 wait':>9} {'max wait':>9}")
+    for s in queue_stats(broker_client()):
+        print(f"{s['queue']:<14} {s['depth']:>8} {s['samples']:>8} {s['p50_sec']:>8.1f}s "
+              f"{s['p95_sec']:>8.1f}s {s['max_sec']:>8.1f}s")
@@ -0,0 +1,564 @@
+"""
+Query Executors
+refresh_marts.py, scripts/load_bank_data.py and scripts/data_quality_tests.py
+get their client from create_executor() instead of building a bigquery.Client,
+so the same mart, staging and check SQL can run against BigQuery or locally.
+
+An executor is anything with the subset of the bigquery.Client interface the
+scripts use: query(sql, job_config), get_table, delete_table,
+load_table_from_dataframe, load_table_from_file (Parquet, CSV, NDJSON) and
+insert_rows_json, returning job objects with the attributes RunLedger records.
+
+Backends (QUERY_EXECUTOR):
+    bigquery - BigQueryExecutor, a plain bigquery.Client (default)
+    duckdb   - DuckDBExecutor over local Parquet fixtures (pip install duckdb sqlglot),
+               see bigquery/local_fixtures.py
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import BadRequest, NotFound
+from google.cloud import bigquery
+from google.cloud.bigquery.table import Row
+
+logger = logging.getLogger(__name__)
+
+QUERY_EXECUTOR = os.environ.get('QUERY_EXECUTOR', 'bigquery')
+DUCKDB_PATH = os.environ.get('DUCKDB_PATH', ':memory:')
+DUCKDB_FIXTURES_DIR = os.environ.get(
+    'DUCKDB_FIXTURES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'fixtures'))
+
+
+class BigQueryExecutor(bigquery.Client):
+    """Production executor: bigquery.Client as is."""
+
+    backend = 'bigquery'
+
+
+def create_executor(project: str, location: str = None, backend: str = None):
+    """Executor for QUERY_EXECUTOR (or backend), ready for client.query(...)."""
+    backend = backend or QUERY_EXECUTOR
+    if backend == 'bigquery':
+        return BigQueryExecutor(project=project, location=location)
+    if backend == 'duckdb':
+        return DuckDBExecutor(project, database=DUCKDB_PATH, fixtures_dir=DUCKDB_FIXTURES_DIR)
+    raise ValueError(f"Unknown QUERY_EXECUTOR: {backend} (expected bigquery or duckdb)")
+
+
+# ==================== DUCKDB BACKEND ====================
+
+# HLL_COUNT emulation: a "sketch" is the list of distinct values, so merged
+# counts are exact locally (BigQuery estimates them within ~0.57%).
+# UNIX_MILLIS / TIMESTAMP_MILLIS cover sqlglot versions that pass them through.
+DUCKDB_MACROS = [
+    "CREATE OR REPLACE MACRO hll_count_init(x, p := 15) AS list_distinct(list(x))",
+    "CREATE OR REPLACE MACRO hll_count_merge(s) AS len(list_distinct(flatten(list(s))))",
+    "CREATE OR REPLACE MACRO hll_count_merge_partial(s) AS list_distinct(flatten(list(s)))",
+    "CREATE OR REPLACE MACRO hll_count_extract(s) AS len(s)",
+    "CREATE OR REPLACE MACRO unix_millis(ts) AS epoch_ms(ts)",
+    "CREATE OR REPLACE MACRO timestamp_millis(ms) AS make_timestamp(ms * 1000)",
+]
+
+# Partition column of fixture tables that are date-partitioned in BigQuery;
+# tables created by CREATE TABLE ... PARTITION BY are registered automatically
+FIXTURE_PARTITIONS = {
+    'ineco_raw.p_ads_CampaignStats_8656917454': '_DATA_DATE',
+}
+
+META_SCHEMA = '_bq_meta'
+# Partition column, labels and last-modified time per table, so they survive
+# across processes sharing a DUCKDB_PATH file
+CATALOG_TABLE = f'{META_SCHEMA}._catalog'
+
+# `project.dataset.table`, `project.dataset.events_*`, `project.dataset.__TABLES__`,
+# `project.dataset.INFORMATION_SCHEMA.PARTITIONS`
+TABLE_REF = re.compile(r'`[\w-]+\.(\w+)\.(INFORMATION_SCHEMA\.PARTITIONS|\w+\*?)`')
+
+CREATE_PARTITIONED = re.compile(
+    r'(CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+(\w+)\.(\w+))\s+PARTITION\s+BY\s+(.+?)\s+'
+    r'(?:CLUSTER\s+BY\s+.+?\s+)?(?=AS\b)', re.IGNORECASE | re.DOTALL)
+CLUSTER_ONLY = re.compile(
+    r'(CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+\w+\.\w+)\s+CLUSTER\s+BY\s+.+?\s+(?=AS\b)',
+    re.IGNORECASE | re.DOTALL)
+
+WRITE_TARGET = re.compile(
+    r'^\s*(?:CREATE\s+(?:OR\s+REPLACE\s+)?TABLE(?:\s+IF\s+NOT\s+EXISTS)?|INSERT\s+INTO|DELETE\s+FROM|'
+    r'UPDATE|MERGE\s+INTO|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)\s+"?(\w+)"?\."?(\w+)"?', re.IGNORECASE)
+
+DML = ('INSERT', 'DELETE', 'UPDATE', 'MERGE')
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _table_parts(table) -> tuple:
+    """(dataset, table[$partition]) of 'project.dataset.table', 'dataset.table' or a TableReference."""
+    if isinstance(table, str):
+        parts = table.split('.')
+        return parts[-2], parts[-1]
+    return table.dataset_id, table.table_id
+
+
+class DuckDBRows(list):
+    """RowIterator look-alike: a list of Rows with total_rows."""
+
+    def __init__(self, rows=(), total_rows: int = None):
+        super().__init__(rows)
+        self._total_rows = total_rows
+
+    @property
+    def total_rows(self):
+        return len(self) if self._total_rows is None else self._total_rows
+
+
+class DuckDBJob:
+    """Finished job with the attributes RunLedger and refresh_marts.py read."""
+
+    job_type = 'query'
+
+    def __init__(self, job_type: str = 'query', rows: list = None, columns: list = None,
+                 dml_rows: int = None, started=None, total_rows: int = None):
+        self.job_type = job_type
+        self.job_id = f"duckdb_{uuid.uuid4().hex[:12]}"
+        self.started = started or _now()
+        self.ended = _now()
+        self.total_bytes_processed = 0
+        self.total_bytes_billed = 0
+        self.slot_millis = 0
+        self.cache_hit = False
+        self.maximum_bytes_billed = None
+        self.error_result = None
+        self.num_dml_affected_rows = dml_rows
+        field_to_index = {name: i for i, name in enumerate(columns or [])}
+        # Destination writes return no rows; total_rows is what was written, as in BigQuery
+        self._rows = DuckDBRows((Row(values, field_to_index) for values in rows or []), total_rows)
+        self.output_rows = self._rows.total_rows if rows is not None else None
+
+    def result(self, *args, **kwargs):
+        return self._rows
+
+
+class DuckDBTable:
+    """The bigquery.Table attributes the scripts read."""
+
+    def __init__(self, dataset: str, table: str, table_type: str, partition_column: str = None,
+                 num_rows: int = None, modified=None, labels: dict = None, columns: list = None):
+        self.dataset_id = dataset
+        self.table_id = table
+        self.table_type = table_type
+        self.time_partitioning = (bigquery.TimePartitioning(field=partition_column)
+                                  if partition_column else None)
+        # CLUSTER BY is dropped locally
+        self.clustering_fields = None
+        self.schema = [bigquery.SchemaField(name, column_type) for name, column_type in columns or []]
+        self.num_rows = num_rows
+        self.modified = modified
+        self.labels = dict(labels or {})
+
+
+class DuckDBExecutor:
+    """
+    Runs BigQuery SQL on DuckDB: datasets are schemas, fixtures are Parquet
+    files, and the SQL is rewritten for the BigQuery features DuckDB lacks
+    (sharded wildcard tables, __TABLES__, INFORMATION_SCHEMA.PARTITIONS,
+    partition decorators, HLL_COUNT) before sqlglot transpiles the dialect.
+
+    Fixture layout: <fixtures_dir>/<dataset>/<table>.parquet for tables and
+    <fixtures_dir>/<dataset>/<view>.sql (BigQuery SELECT) for views.
+    Jobs are serialized and report 0 bytes, so budgets never trip locally.
+    """
+
+    backend = 'duckdb'
+
+    def __init__(self, project: str, database: str = ':memory:', fixtures_dir: str = None):
+        try:
+            import duckdb
+            import sqlglot
+        except ImportError as e:
+            raise ImportError("QUERY_EXECUTOR=duckdb needs duckdb and sqlglot: pip install duckdb sqlglot") from e
+        self.project = project
+        self.location = None
+        self._sqlglot = sqlglot
+        self.con = duckdb.connect(database)
+        self._lock = threading.RLock()
+        self._partitions = dict(FIXTURE_PARTITIONS)
+        self._modified = {}
+        self._labels = {}
+        self._pending_views = {}
+        self._opened_at = _now()  # last-modified time of tables created outside this executor
+        for macro in DUCKDB_MACROS:
+            self.con.execute(macro)
+        self.con.execute(f'CREATE SCHEMA IF NOT EXISTS {META_SCHEMA}')
+        self._load_catalog()
+        if fixtures_dir:
+            self.load_fixtures(fixtures_dir)
+
+    # ---------- fixtures and catalog ----------
+
+    def load_fixtures(self, fixtures_dir: str):
+        """Load <dataset>/<table>.parquet files and register <dataset>/<view>.sql views."""
+        if not os.path.isdir(fixtures_dir):
+            raise FileNotFoundError(f"No fixtures at {fixtures_dir} (see bigquery/local_fixtures.py)")
+        with self._lock:
+            for path in sorted(glob.glob(os.path.join(fixtures_dir, '*', '*.parquet'))):
+                dataset = os.path.basename(os.path.dirname(path))
+                table = os.path.splitext(os.path.basename(path))[0]
+                self._ensure_schema(dataset)
+                self.con.execute(f'CREATE OR REPLACE TABLE "{dataset}"."{table}" AS '
+                                 f'SELECT * FROM read_parquet(?)', [path])
+                self._modified[f'{dataset}.{table}'] = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            for path in sorted(glob.glob(os.path.join(fixtures_dir, '*', '*.sql'))):
+                dataset = os.path.basename(os.path.dirname(path))
+                view = os.path.splitext(os.path.basename(path))[0]
+                self._ensure_schema(dataset)
+                with open(path) as f:
+                    self._pending_views[f'{dataset}.{view}'] = f.read().strip().rstrip(';')
+            self._create_pending_views()
+        logger.info(f"DuckDB executor: {len(self._modified)} fixture tables, "
+                    f"{len(self._pending_views)} views waiting on missing tables")
+
+    def _ensure_schema(self, dataset: str):
+        self.con.execute(f'CREATE SCHEMA IF NOT EXISTS "{dataset}"')
+
+    def _create_pending_views(self):
+        """Create fixture views whose tables exist by now (e.g. stg_events_clean after stg_events)."""
+        for name, select in list(self._pending_views.items()):
+            dataset, view = name.split('.')
+            try:
+                statement = self._translate(select)[-1]
+                self.con.execute(f'CREATE OR REPLACE VIEW "{dataset}"."{view}" AS {statement}')
+            except Exception:
+                continue
+            del self._pending_views[name]
+
+    def _relation(self, dataset: str, table: str):
+        """'BASE TABLE', 'VIEW' or None if missing."""
+        row = self.con.execute(
+            "SELECT table_type FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+            [dataset, table]).fetchone()
+        return row[0] if row else None
+
+    def _count(self, dataset: str, table: str) -> int:
+        return self.con.execute(f'SELECT COUNT(*) FROM "{dataset}"."{table}"').fetchone()[0]
+
+    def _touch(self, dataset: str, table: str):
+        self._modified[f'{dataset}.{table}'] = _now()
+        self._save_catalog(f'{dataset}.{table}')
+
+    def _load_catalog(self):
+        self.con.execute(f'CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (name VARCHAR PRIMARY KEY, '
+                         f'partition_column VARCHAR, labels JSON, modified_ms BIGINT)')
+        for name, column, labels, modified_ms in self.con.execute(f'SELECT * FROM {CATALOG_TABLE}').fetchall():
+            if column:
+                self._partitions[name] = column
+            if labels:
+                self._labels[name] = json.loads(labels)
+            if modified_ms:
+                self._modified[name] = datetime.fromtimestamp(modified_ms / 1000, timezone.utc)
+
+    def _save_catalog(self, name: str):
+        """Write the registry entries of one table through to CATALOG_TABLE."""
+        self.con.execute(f'DELETE FROM {CATALOG_TABLE} WHERE name = ?', [name])
+        if any(name in registry for registry in (self._partitions, self._labels, self._modified)):
+            labels, modified = self._labels.get(name), self._modified.get(name)
+            self.con.execute(f'INSERT INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?)',
+                             [name, self._partitions.get(name), json.dumps(labels) if labels else None,
+                              int(modified.timestamp() * 1000) if modified else None])
+
+    # ---------- BigQuery emulation ----------
+
+    def _wildcard_view(self, dataset: str, prefix: str) -> str:
+        """View over <prefix>* shards with a _TABLE_SUFFIX column."""
+        tables = [r[0] for r in self.con.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = ? "
+            "AND starts_with(table_name, ?) ORDER BY 1", [dataset, prefix]).fetchall()]
+        if not tables:
+            raise NotFound(f"No tables match {dataset}.{prefix}*")
+        view = f'{dataset}__{prefix}wildcard'
+        union = '\nUNION ALL BY NAME\n'.join(
+            f"""SELECT *, '{t[len(prefix):]}' AS _TABLE_SUFFIX FROM "{dataset}"."{t}\"""" for t in tables)
+        self.con.execute(f'CREATE OR REPLACE VIEW {META_SCHEMA}."{view}" AS {union}')
+        return f'{META_SCHEMA}.{view}'
+
+    def _tables_view(self, dataset: str) -> str:
+        """__TABLES__: table_id, last_modified_time (epoch ms), row_count, size_bytes (estimated)."""
+        tables = [r[0] for r in self.con.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = ? "
+            "AND table_type = 'BASE TABLE'", [dataset]).fetchall()]
+        view = f'{dataset}__tables'
+        rows = []
+        for t in tables:
+            count = self._count(dataset, t)
+            rows.append((t, int(self._modified.get(f'{dataset}.{t}', self._opened_at).timestamp() * 1000),
+                         count, count * 100))
+        self.con.execute(f'CREATE OR REPLACE TABLE {META_SCHEMA}."{view}" '
+                         f'(table_id VARCHAR, last_modified_time BIGINT, row_count BIGINT, size_bytes BIGINT)')
+        if rows:
+            self.con.executemany(f'INSERT INTO {META_SCHEMA}."{view}" VALUES (?, ?, ?, ?)', rows)
+        return f'{META_SCHEMA}.{view}'
+
+    def _partitions_view(self, dataset: str) -> str:
+        """INFORMATION_SCHEMA.PARTITIONS of the registered partitioned tables of a dataset."""
+        view = f'{dataset}__partitions'
+        selects = []
+        for name, column in self._partitions.items():
+            ds, table = name.split('.')
+            if ds != dataset or not self._relation(ds, table):
+                continue
+            modified = self._modified.get(name, self._opened_at).isoformat()
+            selects.append(
+                f"""SELECT '{table}' AS table_name, strftime(CAST("{column}" AS DATE), '%Y%m%d') AS partition_id,
+                    CAST('{modified}' AS TIMESTAMPTZ) AS last_modified_time, COUNT(*) AS total_rows
+                    FROM "{ds}"."{table}" GROUP BY 2""")
+        if not selects:
+            selects.append("SELECT NULL::VARCHAR AS table_name, NULL::VARCHAR AS partition_id, "
+                           "NULL::TIMESTAMPTZ AS last_modified_time, NULL::BIGINT AS total_rows WHERE FALSE")
+        self.con.execute(f'CREATE OR REPLACE TABLE {META_SCHEMA}."{view}" AS ' + '\nUNION ALL\n'.join(selects))
+        return f'{META_SCHEMA}.{view}'
+
+    def _rewrite_ref(self, match) -> str:
+        dataset, name = match.group(1), match.group(2)
+        if name.endswith('*'):
+            return self._wildcard_view(dataset, name[:-1])
+        if name == '__TABLES__':
+            return self._tables_view(dataset)
+        if name == 'INFORMATION_SCHEMA.PARTITIONS':
+            return self._partitions_view(dataset)
+        return f'{dataset}.{name}'
+
+    def _strip_partitioning(self, sql: str) -> str:
+        """Drop PARTITION BY / CLUSTER BY from CTAS, remembering the partition column."""
+        def register(match):
+            expression = match.group(4).strip()
+            column = re.sub(r'^\w+\((\w+)\)$', r'\1', expression)
+            self._partitions[f'{match.group(2)}.{match.group(3)}'] = column
+            return match.group(1) + ' '
+        sql = CREATE_PARTITIONED.sub(register, sql)
+        return CLUSTER_ONLY.sub(lambda m: m.group(1) + ' ', sql)
+
+    def _translate(self, sql: str) -> list:
+        """BigQuery script -> list of DuckDB statements."""
+        sql = TABLE_REF.sub(self._rewrite_ref, sql)
+        sql = re.sub(r'\bHLL_COUNT\.(INIT|MERGE_PARTIAL|MERGE|EXTRACT)\s*\(',
+                     lambda m: f'hll_count_{m.group(1).lower()}(', sql, flags=re.IGNORECASE)
+        # BigQuery WEEK starts on Sunday, DuckDB's on Monday
+        sql = re.sub(r'\bDATE_TRUNC\(([^,()]+),\s*WEEK\)',
+                     r'DATE_SUB(DATE_TRUNC(DATE_ADD(\1, INTERVAL 1 DAY), WEEK), INTERVAL 1 DAY)',
+                     sql, flags=re.IGNORECASE)
+        sql = self._strip_partitioning(sql)
+        statements = self._sqlglot.transpile(sql, read='bigquery', write='duckdb')
+        statements = [re.sub(r'\bINSERT\s+ROW\b', 'INSERT', s, flags=re.IGNORECASE) for s in statements if s.strip()]
+        # FROM UNNEST(event_params) without an alias: BigQuery exposes the struct
+        # fields (key, value) as columns, DuckDB one struct column
+        return [re.sub(r'\bFROM UNNEST\((\w+)\)(?=\s+WHERE\b)', r'FROM (SELECT UNNEST(\1, max_depth := 2))', s)
+                for s in statements]
+
+    # ---------- execution ----------
+
+    def _execute(self, statement: str):
+        """Run one statement; returns (columns, rows, dml_rows)."""
+        target = WRITE_TARGET.match(statement)
+        if target:
+            self._ensure_schema(target.group(1))
+        cursor = self.con.execute(statement)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        rows = cursor.fetchall() if columns else []
+        dml_rows = None
+        if statement.lstrip().upper().startswith(DML):
+            dml_rows = rows[0][0] if rows else 0
+            columns, rows = [], []
+        if target:
+            dataset, table = target.group(1), target.group(2)
+            if statement.lstrip().upper().startswith(('DROP', 'CREATE')):
+                # BigQuery drops labels (and partitioning) with the old table
+                self._labels.pop(f'{dataset}.{table}', None)
+            if statement.lstrip().upper().startswith('DROP'):
+                self._partitions.pop(f'{dataset}.{table}', None)
+                self._save_catalog(f'{dataset}.{table}')
+            else:
+                self._touch(dataset, table)
+        return columns, rows, dml_rows
+
+    def _write_destination(self, select: str, destination, job_config) -> int:
+        """Emulate a query job writing to a destination table or table$YYYYMMDD partition."""
+        dataset, table_id = _table_parts(destination)
+        table, _, partition = table_id.partition('$')
+        target = f'"{dataset}"."{table}"'
+        disposition = job_config.write_disposition or bigquery.WriteDisposition.WRITE_EMPTY
+        self._ensure_schema(dataset)
+        self.con.execute(f'CREATE OR REPLACE TEMP TABLE _destination_rows AS {select}')
+        written = self.con.execute('SELECT COUNT(*) FROM _destination_rows').fetchone()[0]
+
+        if not self._relation(dataset, table):
+            self.con.execute(f'CREATE TABLE {target} AS SELECT * FROM _destination_rows')
+        elif partition:
+            column = self._partitions.get(f'{dataset}.{table}')
+            if column is None:
+                raise BadRequest(f"{dataset}.{table} is not partitioned; cannot write {table_id}")
+            existing = {r[0] for r in self.con.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_schema = ? AND table_name = ?",
+                [dataset, table]).fetchall()}
+            for name, column_type in self.con.execute(
+                    "SELECT column_name, data_type FROM information_schema.columns "
+                    "WHERE table_name = '_destination_rows' ORDER BY ordinal_position").fetchall():
+                if name not in existing:  # ALLOW_FIELD_ADDITION
+                    self.con.execute(f'ALTER TABLE {target} ADD COLUMN "{name}" {column_type}')
+            self.con.execute('BEGIN TRANSACTION')
+            try:
+                if disposition == bigquery.WriteDisposition.WRITE_TRUNCATE:
+                    self.con.execute(f'DELETE FROM {target} WHERE CAST("{column}" AS DATE) = '
+                                     f"CAST(strptime(?, '%Y%m%d') AS DATE)", [partition])
+                self.con.execute(f'INSERT INTO {target} BY NAME SELECT * FROM _destination_rows')
+                self.con.execute('COMMIT')
+            except Exception:
+                self.con.execute('ROLLBACK')
+                raise
+        elif disposition == bigquery.WriteDisposition.WRITE_TRUNCATE:
+            self.con.execute(f'CREATE OR REPLACE TABLE {target} AS SELECT * FROM _destination_rows')
+        elif disposition == bigquery.WriteDisposition.WRITE_APPEND:
+            self.con.execute(f'INSERT INTO {target} BY NAME SELECT * FROM _destination_rows')
+        else:
+            raise BadRequest(f"Already exists: {dataset}.{table}")
+        self.con.execute('DROP TABLE _destination_rows')
+        self._touch(dataset, table)
+        return written
+
+    def query(self, sql: str, job_config: bigquery.QueryJobConfig = None, **kwargs) -> DuckDBJob:
+        started = _now()
+        with self._lock:
+            try:
+                self._create_pending_views()
+                statements = self._translate(sql)
+                if job_config is not None and job_config.dry_run:
+                    return DuckDBJob(started=started)
+                destination = job_config.destination if job_config is not None else None
+                if destination is not None:
+                    written = self._write_destination(statements[-1], destination, job_config)
+                    return DuckDBJob(rows=[], columns=[], total_rows=written, started=started)
+                columns, rows, dml_rows = [], [], None
+                for statement in statements:
+                    columns, rows, dml_rows = self._execute(statement)
+                return DuckDBJob(rows=rows, columns=columns, dml_rows=dml_rows, started=started)
+            except (BadRequest, NotFound):
+                raise
+            except Exception as e:
+                raise BadRequest(f"DuckDB: {e}") from e
+
+    def get_table(self, table) -> DuckDBTable:
+        dataset, table = _table_parts(table)
+        table = table.partition('$')[0]
+        with self._lock:
+            self._create_pending_views()
+            table_type = self._relation(dataset, table)
+            if table_type is None:
+                raise NotFound(f"Not found: Table {self.project}:{dataset}.{table}")
+            name = f'{dataset}.{table}'
+            if table_type == 'VIEW':
+                return DuckDBTable(dataset, table, 'VIEW', labels=self._labels.get(name))
+            columns = self.con.execute(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position", [dataset, table]).fetchall()
+            return DuckDBTable(dataset, table, 'TABLE', self._partitions.get(name), self._count(dataset, table),
+                               self._modified.get(name), self._labels.get(name), columns)
+
+    def update_table(self, table: DuckDBTable, fields: list) -> DuckDBTable:
+        with self._lock:
+            if 'labels' in fields:
+                labels = self._labels.setdefault(f'{table.dataset_id}.{table.table_id}', {})
+                for key, value in table.labels.items():
+                    if value is None:
+                        labels.pop(key, None)
+                    else:
+                        labels[key] = value
+                self._save_catalog(f'{table.dataset_id}.{table.table_id}')
+        return self.get_table(f'{table.dataset_id}.{table.table_id}')
+
+    def delete_table(self, table, not_found_ok: bool = False):
+        dataset, table = _table_parts(table)
+        with self._lock:
+            table_type = self._relation(dataset, table)
+            if table_type is None:
+                if not_found_ok:
+                    return
+                raise NotFound(f"Not found: Table {self.project}:{dataset}.{table}")
+            self.con.execute(f'DROP {"VIEW" if table_type == "VIEW" else "TABLE"} "{dataset}"."{table}"')
+            for registry in (self._partitions, self._labels, self._modified):
+                registry.pop(f'{dataset}.{table}', None)
+            self._save_catalog(f'{dataset}.{table}')
+
+    def _load(self, source: str, params: list, destination, job_config) -> DuckDBJob:
+        """Load job: write the rows of a DuckDB table function or registered frame to destination."""
+        started = _now()
+        dataset, table = _table_parts(destination)
+        disposition = (job_config.write_disposition if job_config is not None else None) \
+            or bigquery.WriteDisposition.WRITE_APPEND
+        with self._lock:
+            self._ensure_schema(dataset)
+            self.con.execute(f'CREATE OR REPLACE TEMP TABLE _load_rows AS SELECT * FROM {source}', params)
+            try:
+                if disposition == bigquery.WriteDisposition.WRITE_TRUNCATE or not self._relation(dataset, table):
+                    self.con.execute(f'CREATE OR REPLACE TABLE "{dataset}"."{table}" AS SELECT * FROM _load_rows')
+                elif disposition == bigquery.WriteDisposition.WRITE_APPEND:
+                    self.con.execute(f'INSERT INTO "{dataset}"."{table}" BY NAME SELECT * FROM _load_rows')
+                else:
+                    raise BadRequest(f"Already exists: {dataset}.{table}")
+                loaded = self.con.execute('SELECT COUNT(*) FROM _load_rows').fetchone()[0]
+            finally:
+                self.con.execute('DROP TABLE IF EXISTS _load_rows')
+            self._touch(dataset, table)
+        job = DuckDBJob(job_type='load', started=started)
+        job.output_rows = loaded
+        return job
+
+    def load_table_from_dataframe(self, dataframe, destination, job_config: bigquery.LoadJobConfig = None,
+                                  **kwargs) -> DuckDBJob:
+        with self._lock:
+            self.con.register('_load_frame', dataframe)
+            try:
+                return self._load('_load_frame', [], destination, job_config)
+            finally:
+                self.con.unregister('_load_frame')
+
+    def load_table_from_file(self, file_obj, destination, job_config: bigquery.LoadJobConfig = None,
+                             **kwargs) -> DuckDBJob:
+        """Parquet, CSV (skip_leading_rows honored) and newline-delimited JSON load jobs."""
+        source_format = (job_config.source_format if job_config is not None else None) or bigquery.SourceFormat.CSV
+        if source_format == bigquery.SourceFormat.PARQUET:
+            source = 'read_parquet(?)'
+        elif source_format == bigquery.SourceFormat.CSV:
+            skip = job_config.skip_leading_rows if job_config is not None else None
+            source = f'read_csv_auto(?, header = {"true" if skip else "false"}, skip = {max((skip or 0) - 1, 0)})'
+        elif source_format == bigquery.SourceFormat.NEWLINE_DELIMITED_JSON:
+            source = "read_json_auto(?, format = 'newline_delimited')"
+        else:
+            raise BadRequest(f"DuckDB executor cannot load {source_format} files")
+        return self._load(source, [file_obj.name], destination, job_config)
+
+    def insert_rows_json(self, table, json_rows: list, **kwargs) -> list:
+        """Streaming insert; returns BigQuery-style per-row errors."""
+        dataset, table = _table_parts(table)
+        with self._lock:
+            if not self._relation(dataset, table):
+                return [{'index': i, 'errors': [{'message': f'Not found: {dataset}.{table}'}]}
+                        for i in range(len(json_rows))]
+            errors = []
+            for i, row in enumerate(json_rows):
+                columns = ', '.join(f'"{c}"' for c in row)
+                try:
+                    self.con.execute(f'INSERT INTO "{dataset}"."{table}" ({columns}) '
+                                     f'VALUES ({", ".join("?" for _ in row)})', list(row.values()))
+                except Exception as e:
+                    errors.append({'index': i, 'errors': [{'message': str(e)}]})
+            self._touch(dataset, table)
+        return errors
+
+    def close(self):
+        self.con.close()
@@ -0,0 +1,185 @@
+"""
+Synthetic Fixtures for the DuckDB Executor
+Writes small Parquet stand-ins for the BigQuery sources (GA4 daily and intraday
+shards, Google Ads transfer, Meta Ads Airbyte table, bank conversions) plus the
+views the marts read, in the layout DuckDBExecutor loads:
+<dir>/<dataset>/<table>.parquet and <dir>/<dataset>/<view>.sql.
+
+Usage:
+    python bigquery/local_fixtures.py --days 14 --users 500
+    QUERY_EXECUTOR=duckdb python bigquery/refresh_marts.py --full
+    QUERY_EXECUTOR=duckdb python scripts/load_bank_data.py <fixtures dir>/bank_export.csv
+    QUERY_EXECUTOR=duckdb python scripts/data_quality_tests.py
+
+scripts/local_pipeline.sh runs the whole sequence (also in CI).
+"""
+
+import argparse
+import os
+import re
+from datetime import date, timedelta
+
+from executors import DUCKDB_FIXTURES_DIR
+
+GA4_DATASET = 'analytics_280405726'
+# Bank export in the bank's column names, next to the dataset directories
+BANK_EXPORT = 'bank_export.csv'
+MARTS_SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'marts')
+
+# Raw event names already match the cleaned names the funnels look for
+EVENT_NAMES = [
+    'page_view', 'page_view', 'page_view', 'session_start', 'user_engagement',
+    'sprint_apply_click', 'sprint_sub_id_captured', 'sprint_open_personal_account', 'sprint_ssn_submitted',
+    'sprint_check_limit_click', 'sprint_phone_submitted', 'sprint_check_limit_completed',
+    'reg_apply_click', 'cards_apply_click', 'reg_sub_id_captured', 'reg_phone_submitted',
+    'kyc_started', 'reg_completed',
+]
+PAGES = [
+    'https://www.inecobank.am/en', 'https://www.inecobank.am/en/Individual/consumer-loans/sprint',
+    'https://www.inecobank.am/en/Individual/cards', 'https://www.inecobank.am/en/Individual/deposits',
+    'https://www.inecobank.am/en/contact-us', 'https://www.inecobank.am/en/Business',
+]
+# (source, medium, campaign)
+TRAFFIC = [
+    ('(direct)', '(none)', '(direct)'), ('google', 'organic', '(organic)'), ('google', 'cpc', 'sprint_search'),
+    ('facebook', 'paid', 'cards_promo'), ('ms_network', 'banner', 'deposits_q4'), ('viber', 'referral', None),
+]
+CAMPAIGNS = ['sprint_search', 'cards_promo', 'deposits_q4']
+
+# stg_events_clean stand-in: the event cleanup mapping is the identity here
+STG_EVENTS_CLEAN_SQL = """
+SELECT
+  *,
+  event_name AS event_name_clean,
+  CASE
+    WHEN STARTS_WITH(event_name, 'sprint_') THEN 'Sprint'
+    WHEN STARTS_WITH(event_name, 'reg_') OR event_name IN ('cards_apply_click', 'kyc_started') THEN 'Registration'
+    ELSE 'Other'
+  END AS flow_type,
+  FALSE AS is_test_event
+FROM `{project}.ineco_staging.stg_events`
+"""
+
+
+def sql_list(values) -> str:
+    return '[' + ', '.join('NULL' if v is None else f"'{v}'" for v in values) + ']'
+
+
+def pick(values, key: str) -> str:
+    """Deterministic pseudo-random element of a list literal."""
+    return f"{sql_list(values)}[1 + (hash({key}) % {len(values)})::BIGINT]"
+
+
+def events_select(day: date, events: int, users: int, seed: int) -> str:
+    """One GA4 shard in the export schema (only the fields stg_events reads)."""
+    def param(key, string_value='NULL', int_value='NULL'):
+        return (f"{{'key': '{key}', 'value': {{'string_value': {string_value}::VARCHAR, "
+                f"'int_value': {int_value}::BIGINT, 'float_value': NULL::DOUBLE, 'double_value': NULL::DOUBLE}}}}")
+    user = f"'u' || (hash(i, {seed}) % {users})"
+    traffic = f"(hash({user}, 'traffic', {seed}) % {len(TRAFFIC)})::BIGINT"
+    return f"""
+        SELECT
+          '{day:%Y%m%d}' AS event_date,
+          epoch_us(TIMESTAMP '{day} 00:00:00' + to_seconds(i * 86400 // {events})) AS event_timestamp,
+          {pick(EVENT_NAMES, f"i, 'event', {seed}")} AS event_name,
+          {user} AS user_pseudo_id,
+          NULL::VARCHAR AS user_id,
+          [{param('ga_session_id', int_value=f"hash({user}, '{day}') % 1000000000")},
+           {param('ga_session_number', int_value='1 + hash(i) % 5')},
+           {param('page_location', string_value=pick(PAGES, f"i, 'page', {seed}"))},
+           {param('engagement_time_msec', int_value='hash(i) % 60000')},
+           {param('session_engaged', int_value='hash(i) % 2')}] AS event_params,
+          {{'source': {sql_list(t[0] for t in TRAFFIC)}[1 + {traffic}],
+            'medium': {sql_list(t[1] for t in TRAFFIC)}[1 + {traffic}],
+            'name': {sql_list(t[2] for t in TRAFFIC)}[1 + {traffic}]}} AS traffic_source,
+          {{'category': {pick(['desktop', 'mobile', 'mobile', 'tablet'], user)},
+            'mobile_brand_name': {pick(['Apple', 'Samsung', 'Xiaomi'], user)},
+            'operating_system': {pick(['iOS', 'Android', 'Windows'], user)},
+            'web_info': {{'browser': {pick(['Chrome', 'Safari'], user)}}}}} AS device,
+          {{'country': 'Armenia', 'city': {pick(['Yerevan', 'Gyumri', 'Vanadzor'], user)}}} AS geo,
+          'WEB' AS platform
+        FROM range({events}) t(i)
+    """
+
+
+def generate_fixtures(output_dir: str, days: int = 14, users: int = 500, events_per_day: int = 5000,
+                      seed: int = 42, project: str = 'x-victor-477214-g0'):
+    import duckdb
+
+    today = date.today()
+    dates = [today - timedelta(days=n) for n in range(days, 0, -1)]
+    con = duckdb.connect()
+
+    def write(dataset, table, select):
+        os.makedirs(os.path.join(output_dir, dataset), exist_ok=True)
+        path = os.path.join(output_dir, dataset, f'{table}.parquet')
+        con.execute(f"COPY ({select}) TO '{path}' (FORMAT PARQUET)")
+        return path
+
+    # GA4: daily shards up to yesterday, today's intraday shard
+    for day in dates:
+        write(GA4_DATASET, f'events_{day:%Y%m%d}', events_select(day, events_per_day, users, seed))
+    write(GA4_DATASET, f'events_intraday_{today:%Y%m%d}', events_select(today, events_per_day // 4, users, seed))
+
+    first = dates[0]
+    write('ineco_raw', 'p_ads_CampaignStats_8656917454', f"""
+        SELECT DATE '{first}' + d::INTEGER AS _DATA_DATE, c AS campaign_name, c || '_group' AS ad_group_name,
+               1000 + hash(d, c) % 5000 AS impressions, 20 + hash(c, d) % 200 AS clicks,
+               (5 + hash(d, c, 'cost') % 50) * 1000000 AS cost_micros, (hash(d, c) % 10)::DOUBLE AS conversions
+        FROM range({days}) r(d), unnest({sql_list(CAMPAIGNS)}) u(c)
+    """)
+    write('ineco_raw', 'ads_insights', f"""
+        SELECT CAST(DATE '{first}' + d::INTEGER AS VARCHAR) AS date_start, c AS campaign_name, c || '_adset' AS adset_name,
+               2000 + hash(d, c) % 8000 AS impressions, 30 + hash(c, d) % 300 AS clicks,
+               (10 + hash(d, c, 'spend') % 90)::DOUBLE AS spend,
+               TIMESTAMPTZ '{first}' + to_days(d::INTEGER + 1) AS _airbyte_extracted_at
+        FROM range({days}) r(d), unnest({sql_list(CAMPAIGNS[1:])}) u(c)
+    """)
+    bank_rows = lambda rows: f"""
+        SELECT '' AS event_time_raw, DATE '{first}' + (i % {days})::INTEGER AS event_date, 'bank_conversion' AS event_name,
+               'tok' || i AS token_id, {pick([t[0] for t in TRAFFIC], 'i')} AS acquired_source,
+               {pick([t[1] for t in TRAFFIC], 'i')} AS acquired_medium, {pick(CAMPAIGNS, 'i')} AS acquired_campaign,
+               'C' || (hash(i) % {users}) AS client_code, '' AS soc_card, 0 AS count_soc_card, 'N' AS had_product,
+               (i % 2)::BIGINT AS is_first_interaction, (hash(i, 'l') % 2)::BIGINT AS loan_count,
+               (hash(i, 'a') % 5000000)::DOUBLE AS loan_amount, (hash(i, 'd') % 2)::BIGINT AS deposit_count,
+               (hash(i, 'da') % 1000000)::DOUBLE AS deposit_amount, (hash(i, 'c') % 2)::BIGINT AS card_count,
+               now()::TIMESTAMP AS uploaded_at
+        FROM range({rows}) t(i)
+    """
+    write('ineco_raw', 'bank_conversions', bank_rows(f'0, {users}'))
+    # A bank export for scripts/load_bank_data.py: half of it already loaded above
+    bank_export = os.path.join(output_dir, BANK_EXPORT)
+    con.execute(f"""
+        COPY (SELECT event_time_raw AS "Event Time", event_date AS "Event _date", event_name AS "Event Name",
+                     token_id AS "Event Param Value (String)", acquired_source AS "Acquired Source",
+                     acquired_medium AS "Acquired Medium", acquired_campaign AS "Acquired Campaign",
+                     client_code AS "Client_code", soc_card AS "Soc_card", count_soc_card,
+                     had_product AS "HAD_PRODUCT", is_first_interaction AS "1-st/2-nd",
+                     loan_count AS "LOAN_COUNT", loan_amount AS "LOAN_AMOUNT", deposit_count AS "DEPOSIT_COUNT",
+                     deposit_amount AS "DEPOSIT_AMOUNT", card_count AS "CARD_COUNT"
+              FROM ({bank_rows(f'{users // 2}, {users + users // 2}')}))
+        TO '{bank_export}' (FORMAT CSV, HEADER)
+    """)
+
+    # Views, created by the executor once their tables exist
+    os.makedirs(os.path.join(output_dir, 'ineco_staging'), exist_ok=True)
+    with open(os.path.join(output_dir, 'ineco_staging', 'stg_events_clean.sql'), 'w') as f:
+        f.write(STG_EVENTS_CLEAN_SQL.format(project=project))
+    with open(os.path.join(MARTS_SQL_DIR, 'dim_product.sql')) as f:
+        dim_product = re.sub(r'^.*?CREATE OR REPLACE TABLE `[^`]+` AS\s*', '', f.read(), flags=re.DOTALL)
+    os.makedirs(os.path.join(output_dir, 'ineco_marts'), exist_ok=True)
+    with open(os.path.join(output_dir, 'ineco_marts', 'dim_product.sql'), 'w') as f:
+        f.write(dim_product.strip().rstrip(';') + '\n')
+    con.close()
+    print(f"✅ Fixtures for {first} .. {today} written to {output_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Parquet fixtures for QUERY_EXECUTOR=duckdb')
+    parser.add_argument('--output-dir', default=DUCKDB_FIXTURES_DIR)
+    parser.add_argument('--days', type=int, default=14, help='Daily GA4 shards up to yesterday')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--events-per-day', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_fixtures(args.output_dir, args.days, args.users, args.events_per_day, args.seed)
@@ -0,0 +1,73 @@
+"""
+Refresh Versions of the Mart Tables
+refresh_marts.py publishes a version (epoch milliseconds) per ineco_marts
+table in the Redis hash MART_VERSIONS_KEY each time it rewrites the table.
+Superset's data cache (versioned_cache.py) keeps the versions of the tables a
+chart query read next to the cached result and treats the entry as a miss
+once any of them moved, so results live until the next refresh of their
+tables instead of for a fixed 5 minutes.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Same Redis database as Superset's data cache (REDIS_RESULTS_DB); the
+# compose file publishes Redis on 127.0.0.1 for refresh_marts.py on the host
+REDIS_HOST = os.environ.get('MART_VERSIONS_REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', '6379'))
+REDIS_DB = int(os.environ.get('REDIS_RESULTS_DB', '1'))
+
+MART_VERSIONS_KEY = 'ineco:mart_versions'
+# Table names are also announced here, so in-process caches (tiered_cache.py)
+# can drop their copies without polling the hash
+MART_VERSIONS_CHANNEL = 'ineco:mart_versions'
+
+MARTS_TABLE = re.compile(r'\bineco_marts`?\.`?(\w+)')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def referenced_tables(sql: str) -> list:
+    """ineco_marts tables named in a query, sorted."""
+    return sorted(set(MARTS_TABLE.findall(sql or '')))
+
+
+def redis_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import redis
+            _client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, socket_timeout=5)
+        return _client
+
+
+def publish_version(table: str, version: str = None) -> str:
+    """
+    Record a new version of a mart table. Never raises: without Redis the
+    cached charts of the table keep their short unversioned TTL.
+    """
+    version = version or str(int(time.time() * 1000))
+    try:
+        pipe = redis_client().pipeline()
+        pipe.hset(MART_VERSIONS_KEY, table, version)
+        pipe.publish(MART_VERSIONS_CHANNEL, table)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"  ⚠ Could not publish the cache version of {table} "
+                       f"(redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}): {e}")
+        return None
+    return version
+
+
+def current_versions(client, tables: list) -> dict:
+    """{table: version or None} read with a redis client."""
+    if not tables:
+        return {}
+    values = client.hmget(MART_VERSIONS_KEY, tables)
+    return {table: value.decode() if isinstance(value, bytes) else value for table, value in zip(tables, values)}
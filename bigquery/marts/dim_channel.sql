@@ -1,6 +1,9 @@
 -- Dimension: dim_channel
 -- Channel/Source dimension with marketing categorizations
 -- Grain: 1 row per unique source_clean + channel_group combination
+-- Bootstrap only: refresh_marts.py maintains this table with an append-only MERGE
+-- (KEY_DIMENSIONS) so channel_key never changes once assigned. Do not re-run on
+-- a populated project, it would renumber the keys stored in the facts.
 
 CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_marts.dim_channel` AS
 SELECT
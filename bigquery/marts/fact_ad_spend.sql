@@ -1,23 +1,31 @@
--- Fact: fact_ad_spend
--- Ad spend and cost data from advertising platforms
--- Grain: date + channel_group + campaign
--- Partitioned by date, clustered by channel_group
---
--- NOTE: This table is populated from ad network APIs (Google Ads, Meta, etc.)
--- Currently empty - awaiting API credentials
+-- fact_ad_spend: Ad spend of all platforms (Google Ads, Meta Ads) per date, campaign and
+-- ad group. Generated from refresh_marts.py (python3 refresh_marts.py --write-ddl), do
+-- not edit by hand. Full rebuild of the date-partitioned table; refresh_marts.py keeps
+-- it current by replacing the partitions of changed dates. Needs
+-- ineco_marts.fact_ad_spend_google and the Meta Airbyte table ineco_raw.ads_insights
+-- (drop an unpartitioned fact_ad_spend first).
 
-CREATE TABLE IF NOT EXISTS `x-victor-477214-g0.ineco_marts.fact_ad_spend` (
-  date DATE,
-  channel_group STRING,
-  campaign STRING,
-  impressions FLOAT64,
-  clicks FLOAT64,
-  spend_usd FLOAT64,
-  spend_amd FLOAT64
-)
+CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_marts.fact_ad_spend`
 PARTITION BY date
-CLUSTER BY channel_group;
-
--- To populate this table, use:
--- INSERT INTO `x-victor-477214-g0.ineco_marts.fact_ad_spend`
--- SELECT ... FROM ad_network_data
+CLUSTER BY channel_group, campaign
+AS
+SELECT date, channel_group, campaign, ad_group, impressions, clicks,
+       spend_usd, spend_amd, ctr, cpc, cpm, conversions, cost_per_conversion
+FROM `x-victor-477214-g0.ineco_marts.fact_ad_spend_google`
+WHERE date IS NOT NULL AND TRUE
+UNION ALL
+SELECT 
+  DATE(date_start) as date,
+  'Meta Ads' as channel_group,
+  campaign_name as campaign,
+  adset_name as ad_group,
+  CAST(impressions AS FLOAT64),
+  CAST(clicks AS FLOAT64),
+  CAST(spend AS FLOAT64),
+  CAST(spend AS FLOAT64) * 400,
+  SAFE_DIVIDE(CAST(clicks AS FLOAT64), CAST(impressions AS FLOAT64)) * 100,
+  SAFE_DIVIDE(CAST(spend AS FLOAT64), CAST(clicks AS FLOAT64)),
+  SAFE_DIVIDE(CAST(spend AS FLOAT64), CAST(impressions AS FLOAT64)) * 1000,
+  0, 0
+FROM `x-victor-477214-g0.ineco_raw.ads_insights`
+WHERE date_start IS NOT NULL AND TRUE;
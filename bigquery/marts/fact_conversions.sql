@@ -1,39 +1,61 @@
--- fact_conversions: Funnel progression and conversion metrics
--- Partitioned by date, clustered by channel_group and product_category
--- Includes campaign-level and geographic breakdowns
+-- fact_conversions: Funnel step users per date, surrogate keys and product. Generated
+-- from refresh_marts.py (python3 refresh_marts.py --write-ddl), do not edit by hand.
+-- Full rebuild of the date-partitioned table; refresh_marts.py keeps it current by
+-- replacing the partitions of changed dates. Needs ineco_staging.int_user_day_events and
+-- the key dimensions dim_channel, dim_campaign, dim_geo.
 
 CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_marts.fact_conversions`
 PARTITION BY date
-CLUSTER BY channel_group, product_category
+CLUSTER BY channel_key, product_category, campaign_key
 AS
+WITH conversions AS (
 SELECT
   event_date as date,
   source_clean,
   channel_group,
-  COALESCE(campaign, '(not set)') as campaign,
+  campaign,
   device_category,
   product_category,
   country,
   city,
   COUNT(DISTINCT user_pseudo_id) as total_users,
   COUNT(DISTINCT CONCAT(user_pseudo_id, CAST(session_id AS STRING))) as total_sessions,
-  
-  -- LOANS FUNNEL (Consumer Loans / Sprint)
-  COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category = 'Consumer Loans' THEN user_pseudo_id END) as loans_pageview,
-  COUNT(DISTINCT CASE WHEN event_name = 'sprint_apply_button_click' THEN user_pseudo_id END) as loans_apply_click,
-  COUNT(DISTINCT CASE WHEN event_name = 'Get Sub ID sprint' THEN user_pseudo_id END) as loans_sub_id,
-  COUNT(DISTINCT CASE WHEN event_name = 'check_limit_click' THEN user_pseudo_id END) as loans_check_limit,
-  COUNT(DISTINCT CASE WHEN event_name = 'phone_submited_sprint' THEN user_pseudo_id END) as loans_phone_submit,
-  COUNT(DISTINCT CASE WHEN event_name = 'otp_submited_sprint' THEN user_pseudo_id END) as loans_otp_submit,
-  
-  -- CARDS/DEPOSITS FUNNEL
-  COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category IN ('Cards', 'Deposits') THEN user_pseudo_id END) as cards_deposits_pageview,
-  COUNT(DISTINCT CASE WHEN event_name IN ('reg_apply_button_click', 'cards_apply_button', 'apply_button_click') THEN user_pseudo_id END) as cards_deposits_apply_click,
-  COUNT(DISTINCT CASE WHEN event_name = 'Get Sub ID' THEN user_pseudo_id END) as cards_deposits_sub_id,
-  COUNT(DISTINCT CASE WHEN event_name = 'phone_submited_reg' THEN user_pseudo_id END) as cards_deposits_phone_submit,
-  
-  -- FINAL CONVERSION
-  COUNT(DISTINCT CASE WHEN event_name = 'registration_success' THEN user_pseudo_id END) as registrations
-
-FROM `x-victor-477214-g0.ineco_staging.stg_events`
-GROUP BY 1, 2, 3, 4, 5, 6, 7, 8;
+  -- Loans funnel (using clean event names)
+  COUNT(DISTINCT IF(has_page_view AND product_category = 'Consumer Loans', user_pseudo_id, NULL)) as loans_pageview,
+  COUNT(DISTINCT IF(has_sprint_apply_click, user_pseudo_id, NULL)) as loans_apply_click,
+  COUNT(DISTINCT IF(has_sprint_sub_id_captured, user_pseudo_id, NULL)) as loans_sub_id,
+  COUNT(DISTINCT IF(has_sprint_check_limit_click, user_pseudo_id, NULL)) as loans_check_limit,
+  COUNT(DISTINCT IF(has_sprint_phone_submitted, user_pseudo_id, NULL)) as loans_phone_submit,
+  COUNT(DISTINCT IF(has_sprint_completed, user_pseudo_id, NULL)) as loans_completed,
+  -- Registration funnel (using clean event names)
+  COUNT(DISTINCT IF(has_page_view AND product_category IN ('Cards', 'Deposits'), user_pseudo_id, NULL)) as cards_deposits_pageview,
+  COUNT(DISTINCT IF(has_reg_apply_click, user_pseudo_id, NULL)) as cards_deposits_apply_click,
+  COUNT(DISTINCT IF(has_reg_sub_id_captured, user_pseudo_id, NULL)) as cards_deposits_sub_id,
+  COUNT(DISTINCT IF(has_reg_phone_submitted, user_pseudo_id, NULL)) as cards_deposits_phone_submit,
+  COUNT(DISTINCT IF(has_reg_completed, user_pseudo_id, NULL)) as registrations,
+  -- HLL++ sketches of the distinct user counts above (see sketches.py)
+  HLL_COUNT.INIT(user_pseudo_id, 15) as total_users_sketch,
+  HLL_COUNT.INIT(IF(has_page_view AND product_category = 'Consumer Loans', user_pseudo_id, NULL), 15) as loans_pageview_sketch,
+  HLL_COUNT.INIT(IF(has_sprint_apply_click, user_pseudo_id, NULL), 15) as loans_apply_click_sketch,
+  HLL_COUNT.INIT(IF(has_sprint_sub_id_captured, user_pseudo_id, NULL), 15) as loans_sub_id_sketch,
+  HLL_COUNT.INIT(IF(has_sprint_check_limit_click, user_pseudo_id, NULL), 15) as loans_check_limit_sketch,
+  HLL_COUNT.INIT(IF(has_sprint_phone_submitted, user_pseudo_id, NULL), 15) as loans_phone_submit_sketch,
+  HLL_COUNT.INIT(IF(has_sprint_completed, user_pseudo_id, NULL), 15) as loans_completed_sketch,
+  HLL_COUNT.INIT(IF(has_page_view AND product_category IN ('Cards', 'Deposits'), user_pseudo_id, NULL), 15) as cards_deposits_pageview_sketch,
+  HLL_COUNT.INIT(IF(has_reg_apply_click, user_pseudo_id, NULL), 15) as cards_deposits_apply_click_sketch,
+  HLL_COUNT.INIT(IF(has_reg_sub_id_captured, user_pseudo_id, NULL), 15) as cards_deposits_sub_id_sketch,
+  HLL_COUNT.INIT(IF(has_reg_phone_submitted, user_pseudo_id, NULL), 15) as cards_deposits_phone_submit_sketch,
+  HLL_COUNT.INIT(IF(has_reg_completed, user_pseudo_id, NULL), 15) as registrations_sketch
+FROM `x-victor-477214-g0.ineco_staging.int_user_day_events`
+LEFT JOIN UNNEST(session_ids) AS session_id
+WHERE TRUE
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+)
+SELECT f.* EXCEPT (source_clean, channel_group, campaign, country, city), ch.channel_key, cp.campaign_key, g.geo_key
+FROM conversions f
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_channel` ch
+  ON ch.source_clean = COALESCE(f.source_clean, '(not set)')
+ AND ch.channel_group = COALESCE(f.channel_group, '(not set)')
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_campaign` cp ON cp.campaign = COALESCE(f.campaign, '(not set)')
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_geo` g
+  ON g.country = COALESCE(f.country, '(not set)') AND g.city = COALESCE(f.city, '(not set)');
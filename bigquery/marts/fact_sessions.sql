@@ -1,10 +1,12 @@
--- fact_sessions: Core session and engagement metrics
--- Partitioned by date, clustered by channel_group and product_category
--- Includes campaign-level and geographic breakdowns
+-- fact_sessions: Sessions and engagement per date, surrogate keys and session
+-- dimensions. Generated from refresh_marts.py (python3 refresh_marts.py --write-ddl), do
+-- not edit by hand. Full rebuild of the date-partitioned table; refresh_marts.py keeps
+-- it current by replacing the partitions of changed dates. Needs
+-- ineco_staging.stg_events and the key dimensions dim_channel, dim_campaign, dim_geo.
 
 CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_marts.fact_sessions`
 PARTITION BY date
-CLUSTER BY channel_group, product_category
+CLUSTER BY channel_key, product_category, campaign_key
 AS
 WITH session_data AS (
   SELECT
@@ -23,8 +25,10 @@ WITH session_data AS (
     SUM(COALESCE(engagement_time_msec, 0)) / 1000.0 as engagement_sec,
     MAX(session_engaged) as session_engaged
   FROM `x-victor-477214-g0.ineco_staging.stg_events`
+  WHERE TRUE
   GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11
-)
+),
+sessions AS (
 SELECT
   date,
   source_clean,
@@ -41,6 +45,18 @@ SELECT
   SUM(CASE WHEN pageviews = 1 AND engagement_sec < 10 THEN 1 ELSE 0 END) as bounced_sessions,
   SUM(pageviews) as pageviews,
   AVG(engagement_sec) as avg_session_duration_sec,
-  AVG(pageviews) as avg_pages_per_session
+  AVG(pageviews) as avg_pages_per_session,
+  -- HLL++ sketches: HLL_COUNT.MERGE across rows gives distinct users (see sketches.py)
+  HLL_COUNT.INIT(user_pseudo_id, 15) as users_sketch,
+  HLL_COUNT.INIT(CASE WHEN user_type = 'New' THEN user_pseudo_id END, 15) as new_users_sketch
 FROM session_data
-GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9;
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+)
+SELECT f.* EXCEPT (source_clean, channel_group, campaign, country, city), ch.channel_key, cp.campaign_key, g.geo_key
+FROM sessions f
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_channel` ch
+  ON ch.source_clean = COALESCE(f.source_clean, '(not set)')
+ AND ch.channel_group = COALESCE(f.channel_group, '(not set)')
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_campaign` cp ON cp.campaign = COALESCE(f.campaign, '(not set)')
+LEFT JOIN `x-victor-477214-g0.ineco_marts.dim_geo` g
+  ON g.country = COALESCE(f.country, '(not set)') AND g.city = COALESCE(f.city, '(not set)');
@@ -0,0 +1,45 @@
+-- One-off: bring bank_conversions rows loaded by the row-by-row transform in
+-- line with the vectorized one (scripts/load_bank_data.py)
+-- Before: empty cells were stored as the text 'nan' / 'None', and IDs the
+-- bank export left gaps in were read as floats and stored as '123.0'.
+-- After: NULL and '123', so reloads MERGE onto these rows instead of adding
+-- a second copy. Rows that a reload already duplicated are collapsed to the
+-- latest upload per (token_id, client_code, event_date); NULL keys count as
+-- equal there, so rows loaded again and again with an unparseable (NULL)
+-- event_date are collapsed too.
+-- Run once, then re-run load_bank_data.py (or its staging/mart refresh):
+--   bq query --use_legacy_sql=false < bigquery/ops/normalize_bank_keys.sql
+
+BEGIN TRANSACTION;
+
+UPDATE `x-victor-477214-g0.ineco_raw.bank_conversions`
+SET
+  event_time_raw = NULLIF(NULLIF(event_time_raw, 'nan'), 'None'),
+  event_name = NULLIF(NULLIF(event_name, 'nan'), 'None'),
+  token_id = REGEXP_REPLACE(NULLIF(NULLIF(token_id, 'nan'), 'None'), r'^(\d+)\.0$', r'\1'),
+  acquired_source = NULLIF(NULLIF(acquired_source, 'nan'), 'None'),
+  acquired_medium = NULLIF(NULLIF(acquired_medium, 'nan'), 'None'),
+  acquired_campaign = NULLIF(NULLIF(acquired_campaign, 'nan'), 'None'),
+  client_code = REGEXP_REPLACE(NULLIF(NULLIF(client_code, 'nan'), 'None'), r'^(\d+)\.0$', r'\1'),
+  soc_card = REGEXP_REPLACE(NULLIF(NULLIF(soc_card, 'nan'), 'None'), r'^(\d+)\.0$', r'\1'),
+  had_product = NULLIF(NULLIF(had_product, 'nan'), 'None')
+WHERE TRUE;
+
+CREATE TEMP TABLE latest AS
+SELECT *
+FROM `x-victor-477214-g0.ineco_raw.bank_conversions`
+-- PARTITION BY groups NULLs together, unlike the '=' the old MERGE matched with
+QUALIFY ROW_NUMBER() OVER (PARTITION BY token_id, client_code, event_date ORDER BY uploaded_at DESC) = 1;
+
+DELETE FROM `x-victor-477214-g0.ineco_raw.bank_conversions` WHERE TRUE;
+
+INSERT INTO `x-victor-477214-g0.ineco_raw.bank_conversions`
+SELECT * FROM latest;
+
+COMMIT TRANSACTION;
+
+-- Check: both should be 0
+-- SELECT COUNTIF(token_id IN ('nan', 'None') OR ENDS_WITH(token_id, '.0')
+--                OR client_code IN ('nan', 'None') OR ENDS_WITH(client_code, '.0')) AS legacy_keys,
+--        COUNT(*) - COUNT(DISTINCT TO_JSON_STRING(STRUCT(token_id, client_code, event_date))) AS duplicate_keys
+-- FROM `x-victor-477214-g0.ineco_raw.bank_conversions`;
@@ -0,0 +1,26 @@
+-- Run Ledger: one row per BigQuery job submitted by refresh_marts.py,
+-- load_bank_data.py and data_quality_tests.py
+-- Written by bigquery/run_ledger.py when LEDGER_TABLE is set
+-- Grain: 1 row per job
+
+CREATE SCHEMA IF NOT EXISTS `x-victor-477214-g0.ineco_ops`
+OPTIONS (location = 'EU');
+
+CREATE TABLE IF NOT EXISTS `x-victor-477214-g0.ineco_ops.run_ledger` (
+  run_id STRING,
+  pipeline STRING,
+  step STRING,
+  job_id STRING,
+  job_type STRING,
+  started_at TIMESTAMP,
+  wall_sec FLOAT64,
+  bytes_processed INT64,
+  bytes_billed INT64,
+  slot_ms INT64,
+  cache_hit BOOL,
+  dml_affected_rows INT64,
+  output_rows INT64,
+  error STRING
+)
+PARTITION BY DATE(started_at)
+CLUSTER BY pipeline, step;
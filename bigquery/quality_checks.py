@@ -0,0 +1,177 @@
+"""
+Declarative Data Quality Checks
+Shared by refresh_marts.py (post-refresh checks) and scripts/data_quality_tests.py.
+All checks on one table compile into a single aggregate query, so checking a
+table costs one scan no matter how many checks it has.
+
+Check types:
+    row_count  - rows (optionally matching 'where') >= min_rows
+    null_rate  - % of NULL 'column' values <= max_pct
+    range      - no 'column' values outside [min, max]
+    freshness  - DATE_DIFF(CURRENT_DATE(), MAX('column'), DAY) <= max_days
+    predicate  - rows matching 'condition' <= max_rows (default 0)
+"""
+
+import logging
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+MARTS_DATASET = 'ineco_marts'
+
+# Test thresholds
+MAX_NULL_PERCENT = 5  # Max % of nulls allowed in key columns
+MAX_STALENESS_DAYS = 7  # Alert if data is older than this
+MIN_ROW_COUNT = 100  # Minimum expected rows per table
+
+# 'suites' selects the entry point: 'refresh' = refresh_marts.py,
+# 'dq' = data_quality_tests.py. Severity only matters for 'refresh'.
+QUALITY_CHECKS = {
+    'fact_sessions': [
+        {'name': 'No data for yesterday', 'type': 'row_count', 'min_rows': 1,
+         'where': "date = DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)",
+         'severity': 'critical', 'suites': ['refresh']},
+        {'name': 'NULL sessions detected', 'type': 'null_rate', 'column': 'sessions', 'max_pct': 0,
+         'severity': 'critical', 'suites': ['refresh']},
+        {'name': 'Negative users detected', 'type': 'range', 'column': 'users', 'min': 0,
+         'severity': 'critical', 'suites': ['refresh']},
+        {'name': 'Row count dropped significantly', 'type': 'row_count', 'min_rows': 50000,
+         'severity': 'warning', 'suites': ['refresh']},
+        {'name': 'fact_sessions row count', 'type': 'row_count', 'min_rows': 1000, 'suites': ['dq']},
+        {'name': 'fact_sessions.date nulls', 'type': 'null_rate', 'column': 'date',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        # NULL keys: rows whose channel was missing from dim_channel when the fact was built
+        {'name': 'fact_sessions.channel_key nulls', 'type': 'null_rate', 'column': 'channel_key',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_sessions freshness', 'type': 'freshness', 'column': 'date',
+         'max_days': MAX_STALENESS_DAYS, 'suites': ['dq']},
+        {'name': 'fact_sessions.sessions range', 'type': 'range', 'column': 'sessions', 'min': 0,
+         'suites': ['dq']},
+        {'name': 'fact_sessions.users range', 'type': 'range', 'column': 'users', 'min': 0,
+         'suites': ['dq']},
+    ],
+    'fact_conversions': [
+        {'name': 'No conversion data for yesterday', 'type': 'row_count', 'min_rows': 1,
+         'where': "date = DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)",
+         'severity': 'critical', 'suites': ['refresh']},
+        {'name': 'NULL registrations detected', 'type': 'null_rate', 'column': 'registrations', 'max_pct': 0,
+         'severity': 'critical', 'suites': ['refresh']},
+        {'name': 'fact_conversions row count', 'type': 'row_count', 'min_rows': 1000, 'suites': ['dq']},
+        {'name': 'fact_conversions.date nulls', 'type': 'null_rate', 'column': 'date',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_conversions.product_category nulls', 'type': 'null_rate', 'column': 'product_category',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_conversions freshness', 'type': 'freshness', 'column': 'date',
+         'max_days': MAX_STALENESS_DAYS, 'suites': ['dq']},
+    ],
+    'fact_bank_conversions': [
+        {'name': 'fact_bank_conversions row count', 'type': 'row_count', 'min_rows': MIN_ROW_COUNT,
+         'suites': ['dq']},
+        {'name': 'fact_bank_conversions.date nulls', 'type': 'null_rate', 'column': 'date',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_bank_conversions.channel_group nulls', 'type': 'null_rate', 'column': 'channel_group',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_bank_conversions.loan_count nulls', 'type': 'null_rate', 'column': 'loan_count',
+         'max_pct': MAX_NULL_PERCENT, 'suites': ['dq']},
+        {'name': 'fact_bank_conversions.loan_count range', 'type': 'range', 'column': 'loan_count', 'min': 0,
+         'suites': ['dq']},
+        {'name': 'fact_bank_conversions.loan_amount range', 'type': 'range', 'column': 'loan_amount', 'min': 0,
+         'suites': ['dq']},
+        {'name': 'fact_bank_conversions.card_count range', 'type': 'range', 'column': 'card_count', 'min': 0,
+         'suites': ['dq']},
+    ],
+    'dim_channel': [
+        {'name': 'Unknown channel_type detected', 'type': 'predicate',
+         'condition': "channel_type IS NULL OR channel_type = ''",
+         'severity': 'warning', 'suites': ['refresh']},
+        {'name': 'dim_channel row count', 'type': 'row_count', 'min_rows': 5, 'suites': ['dq']},
+    ],
+    'dim_product': [
+        {'name': 'dim_product row count', 'type': 'row_count', 'min_rows': 3, 'suites': ['dq']},
+    ],
+}
+
+
+def _check_expressions(check: dict, alias: str) -> list:
+    """SELECT-list expressions for one check; all aliases start with `alias`."""
+    check_type = check['type']
+    if check_type == 'row_count':
+        where = check.get('where')
+        return [f"COUNTIF({where}) AS {alias}" if where else f"COUNT(*) AS {alias}"]
+    if check_type == 'null_rate':
+        return [f"COUNTIF({check['column']} IS NULL) AS {alias}"]
+    if check_type == 'range':
+        conditions = []
+        if check.get('min') is not None:
+            conditions.append(f"{check['column']} < {check['min']}")
+        if check.get('max') is not None:
+            conditions.append(f"{check['column']} > {check['max']}")
+        return [f"COUNTIF({' OR '.join(conditions) if conditions else 'FALSE'}) AS {alias}"]
+    if check_type == 'freshness':
+        return [f"MAX({check['column']}) AS {alias}_max",
+                f"DATE_DIFF(CURRENT_DATE(), MAX({check['column']}), DAY) AS {alias}"]
+    if check_type == 'predicate':
+        return [f"COUNTIF({check['condition']}) AS {alias}"]
+    raise ValueError(f"Unknown check type: {check_type}")
+
+
+def compile_table_checks(project: str, table: str, checks: list, dataset: str = MARTS_DATASET) -> str:
+    """Compile every check on a table into one aggregate query returning one row."""
+    expressions = ["COUNT(*) AS _total_rows"]
+    for i, check in enumerate(checks):
+        expressions.extend(_check_expressions(check, f"c{i}"))
+    select_list = ',\n      '.join(expressions)
+    return f"SELECT\n      {select_list}\n    FROM `{project}.{dataset}.{table}`"
+
+
+def evaluate_check(check: dict, row, alias: str) -> tuple:
+    """Turn a compiled result row into (passed, details)."""
+    value = row[alias]
+    check_type = check['type']
+    if check_type == 'row_count':
+        passed = value >= check['min_rows']
+        return passed, f"Found {value:,} rows (min: {check['min_rows']})"
+    if check_type == 'null_rate':
+        total = row['_total_rows']
+        null_pct = value * 100 / total if total else 0.0
+        return null_pct <= check['max_pct'], f"{null_pct:.1f}% null (max: {check['max_pct']}%)"
+    if check_type == 'range':
+        return value == 0, f"{value} out-of-range values"
+    if check_type == 'freshness':
+        if value is None:
+            return False, "No rows"
+        passed = value <= check['max_days']
+        return passed, f"Latest: {row[alias + '_max']} ({value} days old, max: {check['max_days']})"
+    if check_type == 'predicate':
+        max_rows = check.get('max_rows', 0)
+        return value <= max_rows, f"{value} rows matching ({check['condition']})"
+    raise ValueError(f"Unknown check type: {check_type}")
+
+
+def run_checks(client: bigquery.Client, project: str, suite: str, ledger=None) -> list:
+    """
+    Run every check of a suite with one query per table.
+
+    Returns a list of {'table', 'check', 'passed', 'details', 'error'} in
+    registry order. If a table's query fails, each of its checks carries the error.
+    """
+    results = []
+    for table, table_checks in QUALITY_CHECKS.items():
+        checks = [c for c in table_checks if suite in c['suites']]
+        if not checks:
+            continue
+        try:
+            job = client.query(compile_table_checks(project, table, checks))
+            if ledger is not None:
+                ledger.timed(f"quality_checks:{table}", job)
+            row = list(job.result())[0]
+        except Exception as e:
+            results.extend({'table': table, 'check': c, 'passed': False, 'details': str(e), 'error': e}
+                           for c in checks)
+            continue
+        for i, check in enumerate(checks):
+            passed, details = evaluate_check(check, row, f"c{i}")
+            results.append({'table': table, 'check': check, 'passed': passed,
+                            'details': details, 'error': None})
+    return results
@@ -0,0 +1,185 @@
+"""
+Partition Filter Guard and Per-Role Byte Caps for Superset Queries
+mutate_sql (SQL_QUERY_MUTATOR) looks at every SQL Lab and chart query on
+BigQuery. A SELECT that reads a date-partitioned ineco_marts / ineco_staging
+table without a range or equality predicate (>, >=, <, <=, =, BETWEEN, IN) on
+its partition column, in its own WHERE or in an enclosing query's, would scan
+all of history. IS NOT NULL or a filter on another table's date does not count. Depending on
+PARTITION_FILTER_MODE it then:
+
+    window  adds <table>.<column> >= DATE_SUB(CURRENT_DATE(), INTERVAL
+            PARTITION_WINDOW_DAYS DAY) to that SELECT (default)
+    reject  fails the query with a message naming the table and column
+    off     leaves the query alone
+
+cap_bytes_billed (DB_CONNECTION_MUTATOR) sets maximum_bytes_billed on the
+BigQuery connection from the user's roles, so a runaway scan is stopped by
+BigQuery before it starts instead of running for minutes.
+
+Configured in superset_config.py (mounted into /app/pythonpath).
+"""
+
+import logging
+import os
+
+import sqlglot
+from sqlglot import exp
+
+from rollups import ROLLUPS
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FILTER_MODE = os.environ.get('PARTITION_FILTER_MODE', 'window')
+PARTITION_WINDOW_DAYS = int(os.environ.get('PARTITION_WINDOW_DAYS', '90'))
+
+# Partition column per partitioned table ({dataset: {table: column}})
+PARTITIONED_TABLES = {
+    'ineco_marts': {
+        'fact_sessions': 'date',
+        'fact_conversions': 'date',
+        'fact_ad_spend': 'date',
+        'fact_ad_spend_google': 'date',
+        **{name: 'date' for name in ROLLUPS},
+    },
+    'ineco_staging': {
+        'stg_events': 'event_date',
+        # View over stg_events; a filter on event_date still prunes
+        'stg_events_clean': 'event_date',
+        'int_user_day_events': 'event_date',
+    },
+}
+
+# Pseudo-columns that also prune ingestion-time partitions
+PARTITION_PSEUDO_COLUMNS = {'_partitiondate', '_partitiontime'}
+
+# Predicates that bound a partition column (IS NOT NULL, <> and LIKE do not prune)
+PARTITION_PREDICATES = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.EQ, exp.Between, exp.In)
+
+
+class PartitionFilterRequired(ValueError):
+    """Raised in reject mode; Superset shows the message to the user."""
+
+
+def partition_column(table: exp.Table) -> str:
+    """Partition column of a table reference, or None if it is not a guarded table."""
+    if table.db:
+        return PARTITIONED_TABLES.get(table.db, {}).get(table.name)
+    # Unqualified names resolve against the connection's default dataset
+    return next((tables[table.name] for tables in PARTITIONED_TABLES.values() if table.name in tables), None)
+
+
+def table_qualifiers(table: exp.Table) -> set:
+    """Names a column of this table can be qualified with: its alias, and the subqueries / CTEs around it."""
+    names = {table.alias_or_name.lower()}
+    node = table.parent
+    while node is not None:
+        if isinstance(node, (exp.Subquery, exp.CTE)) and node.alias:
+            names.add(node.alias.lower())
+        node = node.parent
+    return names
+
+
+def _is_partition_column(node: exp.Expression, column: str, qualifiers: set) -> bool:
+    """True for the partition column (possibly CAST) qualified with one of the qualifiers, or unqualified."""
+    while isinstance(node, (exp.Cast, exp.Paren)):
+        node = node.this
+    if not isinstance(node, exp.Column):
+        return False
+    name = node.name.lower()
+    if name in PARTITION_PSEUDO_COLUMNS:
+        return True
+    return name == column and (not node.table or node.table.lower() in qualifiers)
+
+
+def bounds_partition(condition: exp.Expression, column: str, qualifiers: set) -> bool:
+    """True if every row the condition keeps has its partition column bounded by a comparison."""
+    if isinstance(condition, exp.Paren):
+        return bounds_partition(condition.this, column, qualifiers)
+    if isinstance(condition, exp.And):
+        return bounds_partition(condition.left, column, qualifiers) or \
+            bounds_partition(condition.right, column, qualifiers)
+    if isinstance(condition, exp.Or):
+        return bounds_partition(condition.left, column, qualifiers) and \
+            bounds_partition(condition.right, column, qualifiers)
+    if isinstance(condition, (exp.Between, exp.In)):
+        return _is_partition_column(condition.this, column, qualifiers)
+    if isinstance(condition, PARTITION_PREDICATES):
+        return any(_is_partition_column(side, column, qualifiers) for side in (condition.left, condition.right))
+    return False
+
+
+def has_partition_filter(select: exp.Select, table: exp.Table, column: str) -> bool:
+    """
+    True if this SELECT or one enclosing it bounds the table's partition column
+    with a comparison, BETWEEN or IN. The column must be unqualified or
+    qualified with the table's alias (or that of a subquery / CTE around it).
+    """
+    qualifiers = table_qualifiers(table)
+    node = select
+    while node is not None:
+        where = node.args.get('where')
+        if where is not None and bounds_partition(where.this, column.lower(), qualifiers):
+            return True
+        node = node.find_ancestor(exp.Select)
+    return False
+
+
+def unfiltered_scans(statement: exp.Expression) -> list:
+    """(select, table, column) for each guarded table read without a partition filter."""
+    scans = []
+    for table in statement.find_all(exp.Table):
+        column = partition_column(table)
+        select = table.find_ancestor(exp.Select)
+        if column and select is not None and not has_partition_filter(select, table, column):
+            scans.append((select, table, column))
+    return scans
+
+
+def mutate_sql(sql: str, **kwargs) -> str:
+    """SQL_QUERY_MUTATOR: add or require a partition filter on guarded tables."""
+    database = kwargs.get('database')
+    if PARTITION_FILTER_MODE == 'off' or (database is not None and database.backend != 'bigquery'):
+        return sql
+    try:
+        statements = sqlglot.parse(sql, read='bigquery')
+    except sqlglot.errors.SqlglotError:
+        # Let BigQuery report the syntax error
+        return sql
+
+    mutated = False
+    for statement in statements:
+        for select, table, column in unfiltered_scans(statement) if statement is not None else []:
+            full_name = f"{table.db + '.' if table.db else ''}{table.name}"
+            if PARTITION_FILTER_MODE == 'reject':
+                raise PartitionFilterRequired(
+                    f"{full_name} is partitioned by {column} and this query has no range or equality filter on it, so it would "
+                    f"scan the whole table. Add e.g. WHERE {column} >= DATE_SUB(CURRENT_DATE(), "
+                    f"INTERVAL {PARTITION_WINDOW_DAYS} DAY)")
+            select.where(f"{table.alias_or_name}.{column} >= DATE_SUB(CURRENT_DATE(), "
+                         f"INTERVAL {PARTITION_WINDOW_DAYS} DAY)", dialect='bigquery', copy=False)
+            logger.info(f"Added a {PARTITION_WINDOW_DAYS}-day {column} window to a query on {full_name}")
+            mutated = True
+    if not mutated:
+        return sql
+    return ';\n'.join(s.sql(dialect='bigquery') for s in statements if s is not None)
+
+
+def max_bytes_billed(role_names: list, role_caps: dict, default_gb: float) -> int:
+    """Most generous cap among the roles, in bytes; None means no cap."""
+    caps = [role_caps[name] for name in role_names if name in role_caps] or [default_gb]
+    if None in caps:
+        return None
+    return int(max(caps) * 1024**3)
+
+
+def cap_bytes_billed(uri, params, username, security_manager, source, role_caps: dict = None,
+                     default_gb: float = 20):
+    """DB_CONNECTION_MUTATOR: maximum_bytes_billed on BigQuery connections from the user's roles (GB)."""
+    if not uri.drivername.startswith('bigquery'):
+        return uri, params
+    user = security_manager.find_user(username=username) if username else None
+    role_names = [role.name for role in user.roles] if user else []
+    limit = max_bytes_billed(role_names, role_caps or {}, default_gb)
+    if limit is not None:
+        uri = uri.update_query_dict({'maximum_bytes_billed': str(limit)})
+    return uri, params
@@ -6,12 +6,32 @@ Includes campaign and geographic breakdowns
 """
 
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 import os
+import argparse
+import hashlib
 import logging
+import re
+import textwrap
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import smtplib
 from email.mime.text import MIMEText
 
+from cache_warmer import warm_dashboards
+from executors import create_executor
+from mart_versions import publish_version
+from refresh_scheduler import run_steps, log_run_report, downstream
+from rollups import ROLLUPS, DIMENSION_COLUMNS, rollup_columns, rollup_select, period_start, period_end
+from run_checkpoint import RunCheckpoint
+from run_ledger import RunLedger, estimate_cost_usd
+from quality_checks import run_checks
+from source_watermarks import (fetch_shard_metadata, fetch_partition_metadata, fetch_extracted_dates,
+                               fetch_table_metadata, load_watermarks, save_watermarks, changed_dates)
+
 # Configure logging
 LOG_DIR = os.environ.get('LOG_DIR', '/tmp')
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -29,97 +49,103 @@ logger = logging.getLogger(__name__)
 PROJECT_ID = 'x-victor-477214-g0'
 LOCATION = 'EU'
 
-# Incremental loading: how many days back to process
+# Incremental loading: days to recompute on the first run, before any
+# GA4 shard watermarks have been recorded
 LOOKBACK_DAYS = 7
 
+# Local run state (shard watermarks, per-run step checkpoints for --resume)
+STATE_DIR = os.environ.get('STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state'))
+WATERMARK_FILE = os.path.join(STATE_DIR, 'ga4_shard_watermarks.json')
+AD_SPEND_WATERMARK_FILE = os.path.join(STATE_DIR, 'ad_spend_watermarks.json')
+CHECKPOINT_DIR = os.path.join(STATE_DIR, 'checkpoints')
+
+# Ad spend sources: the Google Ads transfer rewrites whole _DATA_DATE
+# partitions (tracked via INFORMATION_SCHEMA.PARTITIONS); Airbyte stamps each
+# Meta row with its extraction time
+GOOGLE_ADS_TABLE = 'p_ads_CampaignStats_8656917454'
+META_ADS_TABLE = 'ads_insights'
+META_EXTRACTED_AT_COLUMN = os.environ.get('META_EXTRACTED_AT_COLUMN', '_airbyte_extracted_at')
+
+# How incremental fact refreshes write changed dates:
+#   partition - WRITE_TRUNCATE query job per date partition (table$YYYYMMDD),
+#               atomic per day and no DML quota
+#   dml       - DELETE + INSERT of all changed dates (legacy)
+FACT_WRITE_MODE = os.environ.get('FACT_WRITE_MODE', 'partition')
+
+# Partition replacement jobs one table keeps in flight, within MAX_CONCURRENT_JOBS
+PARTITION_JOBS_IN_FLIGHT = int(os.environ.get('PARTITION_JOBS_IN_FLIGHT', '8'))
+
+# Maximum number of query jobs a run has in flight at the same time, across
+# all DAG steps (or backfill chunks) and their partition jobs; also the number
+# of steps run in parallel
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', '4'))
+
+# --backfill: days per chunk; chunks run --max-concurrency at a time, sharing
+# the run's --max-concurrency job slots
+BACKFILL_CHUNK_DAYS = int(os.environ.get('BACKFILL_CHUNK_DAYS', '7'))
+
+# Byte budgets (GB). Every job is capped with maximum_bytes_billed at its
+# step limit, and no job is submitted once the run budget would be exceeded.
+# A --full rebuild scans all history and usually needs higher limits.
+MAX_GB_PER_STEP = float(os.environ.get('MAX_GB_PER_STEP', '50'))
+RUN_BUDGET_GB = float(os.environ.get('RUN_BUDGET_GB', '200'))
+STEP_MAX_GB = {}  # per-step overrides, e.g. {'fact_sessions': 100}
+
+# After a successful refresh, run every dashboard chart once so the first
+# viewer gets cached results (cache_warmer.py; --no-warm-cache skips it)
+WARM_CACHE_AFTER_REFRESH = os.environ.get('WARM_CACHE_AFTER_REFRESH', 'true').lower() == 'true'
+
 # Alert configuration
 ALERT_EMAIL = os.environ.get('ALERT_EMAIL', '')
 SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
 
-# ============================================================
-# DATA QUALITY TESTS
-# ============================================================
-QUALITY_CHECKS = {
-    'fact_sessions': [
-        {
-            'name': 'No data for yesterday',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) = 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_sessions`
-                WHERE date = DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)
-            """,
-            'severity': 'critical'
-        },
-        {
-            'name': 'NULL sessions detected',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) > 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_sessions`
-                WHERE sessions IS NULL
-            """,
-            'severity': 'critical'
-        },
-        {
-            'name': 'Negative users detected',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) > 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_sessions`
-                WHERE users < 0
-            """,
-            'severity': 'critical'
-        },
-        {
-            'name': 'Row count dropped significantly',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) < 50000 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_sessions`
-            """,
-            'severity': 'warning'
-        }
-    ],
-    'fact_conversions': [
-        {
-            'name': 'No conversion data for yesterday',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) = 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_conversions`
-                WHERE date = DATE_SUB(CURRENT_DATE(), INTERVAL 1 DAY)
-            """,
-            'severity': 'critical'
-        },
-        {
-            'name': 'NULL registrations detected',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) > 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.fact_conversions`
-                WHERE registrations IS NULL
-            """,
-            'severity': 'critical'
-        }
-    ],
-    'dim_channel': [
-        {
-            'name': 'Unknown channel_type detected',
-            'sql': """
-                SELECT CASE WHEN COUNT(*) > 0 THEN 1 ELSE 0 END as failed
-                FROM `{project}.ineco_marts.dim_channel`
-                WHERE channel_type IS NULL OR channel_type = ''
-            """,
-            'severity': 'warning'
-        }
-    ]
-}
-
 # ============================================================
 # REFRESH QUERIES - Star Schema with Campaign + Geo
 # ============================================================
 
-DIM_REFRESH_QUERIES = {
-    'dim_channel': """
-        CREATE OR REPLACE TABLE `{project}.ineco_marts.dim_channel` AS
+# Date-partitioned tables in ineco_staging, built from the SELECT in
+# bigquery/staging/<table>.sql. stg_events flattens GA4 events; {shard_filter}
+# limits the events_* scan to the shards of the dates being rebuilt.
+STAGING_SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'staging')
+
+
+def staging_select(table_name: str) -> str:
+    """
+    SELECT of bigquery/staging/<table_name>.sql as a template: the project
+    becomes {project} and each "TRUE  -- {filter}" slot becomes {filter}.
+    """
+    with open(os.path.join(STAGING_SQL_DIR, f"{table_name}.sql")) as f:
+        sql = f.read()
+    select = re.sub(r'^.*?CREATE OR REPLACE TABLE `[^`]+`[^;]*?\bAS\n', '', sql, flags=re.DOTALL)
+    select = select.replace(f"`{PROJECT_ID}.", "`{project}.")
+    select = re.sub(r"TRUE  -- (\{\w+\})", r"\1", select)
+    return '\n' + select.strip().rstrip(';') + '\n'
+
+
+STAGING_SELECT_QUERIES = {name: staging_select(name) for name in ('stg_events', 'int_user_day_events')}
+
+STAGING_FULL_REBUILD_QUERY = """
+    CREATE OR REPLACE TABLE `{project}.ineco_staging.{table}`
+    PARTITION BY event_date
+    CLUSTER BY user_pseudo_id
+    AS
+    {select}
+"""
+
+# Dimensions with stable surrogate keys. Keys are append-only: natural keys
+# seen for the first time get MAX(key) + n, existing keys never change, so facts
+# can store INT64 keys. {event_filter} limits the stg_events scan to the dates
+# being refreshed (new natural keys can only come from those). 'select' returns
+# the natural key columns, any attribute columns and first_seen_date; attributes
+# are re-derived on every run.
+KEY_DIMENSIONS = {
+    'dim_channel': {
+        'key': 'channel_key',
+        'natural_key': ['source_clean', 'channel_group'],
+        'attributes': ['channel_type', 'is_paid', 'channel_category'],
+        'select': """
         SELECT
-          ROW_NUMBER() OVER (ORDER BY channel_group, source_clean) AS channel_key,
           source_clean,
           channel_group,
           CASE 
@@ -143,107 +169,67 @@ DIM_REFRESH_QUERIES = {
             WHEN source_clean IN ('Email', 'SMS', 'Viber', 'Telegram') THEN 'Direct Messaging'
             WHEN source_clean IN ('Yandex', 'Bing', 'Yahoo') THEN 'Other Search'
             ELSE 'Other'
-          END AS channel_category
+          END AS channel_category,
+          first_seen_date
         FROM (
-          SELECT DISTINCT source_clean, channel_group
+          SELECT COALESCE(source_clean, '(not set)') as source_clean,
+                 COALESCE(channel_group, '(not set)') as channel_group,
+                 MIN(event_date) as first_seen_date
           FROM `{project}.ineco_staging.stg_events`
+          WHERE {event_filter}
+          GROUP BY 1, 2
         )
-    """
-}
-
-FACT_INCREMENTAL_QUERIES = {
-    'fact_sessions': {
-        'delete_recent': """
-            DELETE FROM `{project}.ineco_marts.fact_sessions`
-            WHERE date >= DATE_SUB(CURRENT_DATE(), INTERVAL {lookback} DAY)
-        """,
-        'insert_recent': """
-            INSERT INTO `{project}.ineco_marts.fact_sessions`
-            WITH session_data AS (
-              SELECT
-                event_date as date,
-                source_clean,
-                channel_group,
-                COALESCE(campaign, '(not set)') as campaign,
-                device_category,
-                product_category,
-                country,
-                city,
-                user_pseudo_id,
-                session_id,
-                CASE WHEN session_number = 1 THEN 'New' ELSE 'Returning' END as user_type,
-                COUNT(CASE WHEN event_name = 'page_view' THEN 1 END) as pageviews,
-                SUM(COALESCE(engagement_time_msec, 0)) / 1000.0 as engagement_sec,
-                MAX(session_engaged) as session_engaged
-              FROM `{project}.ineco_staging.stg_events`
-              WHERE event_date >= DATE_SUB(CURRENT_DATE(), INTERVAL {lookback} DAY)
-              GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11
-            )
-            SELECT
-              date,
-              source_clean,
-              channel_group,
-              campaign,
-              device_category,
-              product_category,
-              country,
-              city,
-              user_type,
-              COUNT(DISTINCT user_pseudo_id) as users,
-              COUNT(DISTINCT CASE WHEN user_type = 'New' THEN user_pseudo_id END) as new_users,
-              COUNT(*) as sessions,
-              SUM(CASE WHEN pageviews = 1 AND engagement_sec < 10 THEN 1 ELSE 0 END) as bounced_sessions,
-              SUM(pageviews) as pageviews,
-              AVG(engagement_sec) as avg_session_duration_sec,
-              AVG(pageviews) as avg_pages_per_session
-            FROM session_data
-            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
-        """
+    """,
+    },
+    'dim_campaign': {
+        'key': 'campaign_key',
+        'natural_key': ['campaign'],
+        'attributes': [],
+        'select': """
+        SELECT COALESCE(campaign, '(not set)') as campaign, MIN(event_date) as first_seen_date
+        FROM `{project}.ineco_staging.stg_events`
+        WHERE {event_filter}
+        GROUP BY 1
+    """,
+    },
+    'dim_geo': {
+        'key': 'geo_key',
+        'natural_key': ['country', 'city'],
+        'attributes': [],
+        'select': """
+        SELECT COALESCE(country, '(not set)') as country, COALESCE(city, '(not set)') as city,
+               MIN(event_date) as first_seen_date
+        FROM `{project}.ineco_staging.stg_events`
+        WHERE {event_filter}
+        GROUP BY 1, 2
+    """,
     },
-    'fact_conversions': {
-        'delete_recent': """
-            DELETE FROM `{project}.ineco_marts.fact_conversions`
-            WHERE date >= DATE_SUB(CURRENT_DATE(), INTERVAL {lookback} DAY)
-        """,
-        'insert_recent': """
-            INSERT INTO `{project}.ineco_marts.fact_conversions`
-            SELECT
-              event_date as date,
-              source_clean,
-              channel_group,
-              COALESCE(campaign, '(not set)') as campaign,
-              device_category,
-              product_category,
-              country,
-              city,
-              COUNT(DISTINCT user_pseudo_id) as total_users,
-              COUNT(DISTINCT CONCAT(user_pseudo_id, CAST(session_id AS STRING))) as total_sessions,
-              -- Loans funnel (using clean event names)
-              COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category = 'Consumer Loans' THEN user_pseudo_id END) as loans_pageview,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_apply_click' THEN user_pseudo_id END) as loans_apply_click,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_sub_id_captured' THEN user_pseudo_id END) as loans_sub_id,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_click' THEN user_pseudo_id END) as loans_check_limit,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_phone_submitted' THEN user_pseudo_id END) as loans_phone_submit,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_completed' AND NOT is_test_event THEN user_pseudo_id END) as loans_completed,
-              -- Registration funnel (using clean event names)
-              COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category IN ('Cards', 'Deposits') THEN user_pseudo_id END) as cards_deposits_pageview,
-              COUNT(DISTINCT CASE WHEN event_name_clean IN ('reg_apply_click', 'cards_apply_click') THEN user_pseudo_id END) as cards_deposits_apply_click,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_sub_id_captured' THEN user_pseudo_id END) as cards_deposits_sub_id,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_phone_submitted' THEN user_pseudo_id END) as cards_deposits_phone_submit,
-              COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_completed' THEN user_pseudo_id END) as registrations
-            FROM `{project}.ineco_staging.stg_events_clean`
-            WHERE event_date >= DATE_SUB(CURRENT_DATE(), INTERVAL {lookback} DAY)
-            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
-        """
-    }
 }
 
-FULL_REBUILD_QUERIES = {
+KEY_DIMENSION_QUERY = """
+    CREATE TABLE IF NOT EXISTS `{project}.ineco_marts.{table}` AS
+    SELECT CAST(NULL AS INT64) AS {key}, s.* FROM ({select_empty}) s WHERE FALSE;
+
+    ALTER TABLE `{project}.ineco_marts.{table}` ADD COLUMN IF NOT EXISTS first_seen_date DATE;
+
+    MERGE `{project}.ineco_marts.{table}` d
+    USING (
+      SELECT
+        COALESCE(d.{key}, (SELECT COALESCE(MAX({key}), 0) FROM `{project}.ineco_marts.{table}`)
+                 + ROW_NUMBER() OVER (PARTITION BY d.{key} IS NULL ORDER BY {natural_key})) AS {key},
+        s.*
+      FROM ({select}) s
+      LEFT JOIN `{project}.ineco_marts.{table}` d USING ({natural_key})
+    ) s
+    ON {match}
+    WHEN MATCHED THEN UPDATE SET {updates}
+    WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})
+"""
+
+# Fact aggregations over staging. {event_filter} restricts the staging scan
+# (TRUE for a full rebuild, a date list for incremental refreshes).
+FACT_SELECT_QUERIES = {
     'fact_sessions': """
-        CREATE OR REPLACE TABLE `{project}.ineco_marts.fact_sessions`
-        PARTITION BY date
-        CLUSTER BY channel_group, product_category
-        AS
         WITH session_data AS (
           SELECT
             event_date as date,
@@ -261,8 +247,10 @@ FULL_REBUILD_QUERIES = {
             SUM(COALESCE(engagement_time_msec, 0)) / 1000.0 as engagement_sec,
             MAX(session_engaged) as session_engaged
           FROM `{project}.ineco_staging.stg_events`
+          WHERE {event_filter}
           GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11
-        )
+        ),
+        sessions AS (
         SELECT
           date,
           source_clean,
@@ -279,20 +267,24 @@ FULL_REBUILD_QUERIES = {
           SUM(CASE WHEN pageviews = 1 AND engagement_sec < 10 THEN 1 ELSE 0 END) as bounced_sessions,
           SUM(pageviews) as pageviews,
           AVG(engagement_sec) as avg_session_duration_sec,
-          AVG(pageviews) as avg_pages_per_session
+          AVG(pageviews) as avg_pages_per_session,
+          -- HLL++ sketches: HLL_COUNT.MERGE across rows gives distinct users (see sketches.py)
+          HLL_COUNT.INIT(user_pseudo_id, 15) as users_sketch,
+          HLL_COUNT.INIT(CASE WHEN user_type = 'New' THEN user_pseudo_id END, 15) as new_users_sketch
         FROM session_data
         GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+        )
+        SELECT {dimension_keys}
+        FROM sessions f
+        {dimension_joins}
     """,
     'fact_conversions': """
-        CREATE OR REPLACE TABLE `{project}.ineco_marts.fact_conversions`
-        PARTITION BY date
-        CLUSTER BY channel_group, product_category
-        AS
+        WITH conversions AS (
         SELECT
           event_date as date,
           source_clean,
           channel_group,
-          COALESCE(campaign, '(not set)') as campaign,
+          campaign,
           device_category,
           product_category,
           country,
@@ -300,168 +292,98 @@ FULL_REBUILD_QUERIES = {
           COUNT(DISTINCT user_pseudo_id) as total_users,
           COUNT(DISTINCT CONCAT(user_pseudo_id, CAST(session_id AS STRING))) as total_sessions,
           -- Loans funnel (using clean event names)
-          COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category = 'Consumer Loans' THEN user_pseudo_id END) as loans_pageview,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_apply_click' THEN user_pseudo_id END) as loans_apply_click,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_sub_id_captured' THEN user_pseudo_id END) as loans_sub_id,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_click' THEN user_pseudo_id END) as loans_check_limit,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_phone_submitted' THEN user_pseudo_id END) as loans_phone_submit,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_completed' AND NOT is_test_event THEN user_pseudo_id END) as loans_completed,
+          COUNT(DISTINCT IF(has_page_view AND product_category = 'Consumer Loans', user_pseudo_id, NULL)) as loans_pageview,
+          COUNT(DISTINCT IF(has_sprint_apply_click, user_pseudo_id, NULL)) as loans_apply_click,
+          COUNT(DISTINCT IF(has_sprint_sub_id_captured, user_pseudo_id, NULL)) as loans_sub_id,
+          COUNT(DISTINCT IF(has_sprint_check_limit_click, user_pseudo_id, NULL)) as loans_check_limit,
+          COUNT(DISTINCT IF(has_sprint_phone_submitted, user_pseudo_id, NULL)) as loans_phone_submit,
+          COUNT(DISTINCT IF(has_sprint_completed, user_pseudo_id, NULL)) as loans_completed,
           -- Registration funnel (using clean event names)
-          COUNT(DISTINCT CASE WHEN event_name = 'page_view' AND product_category IN ('Cards', 'Deposits') THEN user_pseudo_id END) as cards_deposits_pageview,
-          COUNT(DISTINCT CASE WHEN event_name_clean IN ('reg_apply_click', 'cards_apply_click') THEN user_pseudo_id END) as cards_deposits_apply_click,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_sub_id_captured' THEN user_pseudo_id END) as cards_deposits_sub_id,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_phone_submitted' THEN user_pseudo_id END) as cards_deposits_phone_submit,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_completed' THEN user_pseudo_id END) as registrations
-        FROM `{project}.ineco_staging.stg_events_clean`
+          COUNT(DISTINCT IF(has_page_view AND product_category IN ('Cards', 'Deposits'), user_pseudo_id, NULL)) as cards_deposits_pageview,
+          COUNT(DISTINCT IF(has_reg_apply_click, user_pseudo_id, NULL)) as cards_deposits_apply_click,
+          COUNT(DISTINCT IF(has_reg_sub_id_captured, user_pseudo_id, NULL)) as cards_deposits_sub_id,
+          COUNT(DISTINCT IF(has_reg_phone_submitted, user_pseudo_id, NULL)) as cards_deposits_phone_submit,
+          COUNT(DISTINCT IF(has_reg_completed, user_pseudo_id, NULL)) as registrations,
+          -- HLL++ sketches of the distinct user counts above (see sketches.py)
+          HLL_COUNT.INIT(user_pseudo_id, 15) as total_users_sketch,
+          HLL_COUNT.INIT(IF(has_page_view AND product_category = 'Consumer Loans', user_pseudo_id, NULL), 15) as loans_pageview_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_apply_click, user_pseudo_id, NULL), 15) as loans_apply_click_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_sub_id_captured, user_pseudo_id, NULL), 15) as loans_sub_id_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_check_limit_click, user_pseudo_id, NULL), 15) as loans_check_limit_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_phone_submitted, user_pseudo_id, NULL), 15) as loans_phone_submit_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_completed, user_pseudo_id, NULL), 15) as loans_completed_sketch,
+          HLL_COUNT.INIT(IF(has_page_view AND product_category IN ('Cards', 'Deposits'), user_pseudo_id, NULL), 15) as cards_deposits_pageview_sketch,
+          HLL_COUNT.INIT(IF(has_reg_apply_click, user_pseudo_id, NULL), 15) as cards_deposits_apply_click_sketch,
+          HLL_COUNT.INIT(IF(has_reg_sub_id_captured, user_pseudo_id, NULL), 15) as cards_deposits_sub_id_sketch,
+          HLL_COUNT.INIT(IF(has_reg_phone_submitted, user_pseudo_id, NULL), 15) as cards_deposits_phone_submit_sketch,
+          HLL_COUNT.INIT(IF(has_reg_completed, user_pseudo_id, NULL), 15) as registrations_sketch
+        FROM `{project}.ineco_staging.int_user_day_events`
+        LEFT JOIN UNNEST(session_ids) AS session_id
+        WHERE {event_filter}
         GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+        )
+        SELECT {dimension_keys}
+        FROM conversions f
+        {dimension_joins}
     """
 }
 
+# The facts store surrogate keys in place of the channel, campaign and geo
+# strings ({dimension_keys} / {dimension_joins} in FACT_SELECT_QUERIES). The
+# rollups and the routed Superset datasets read the strings back through the
+# keys (rollups.DIMENSION_COLUMNS).
+FACT_DIMENSION_KEYS = (f"f.* EXCEPT ({', '.join(DIMENSION_COLUMNS)}), "
+                       f"ch.channel_key, cp.campaign_key, g.geo_key")
+FACT_DIMENSION_JOINS = """
+        LEFT JOIN `{project}.ineco_marts.dim_channel` ch
+          ON ch.source_clean = COALESCE(f.source_clean, '(not set)')
+         AND ch.channel_group = COALESCE(f.channel_group, '(not set)')
+        LEFT JOIN `{project}.ineco_marts.dim_campaign` cp ON cp.campaign = COALESCE(f.campaign, '(not set)')
+        LEFT JOIN `{project}.ineco_marts.dim_geo` g
+          ON g.country = COALESCE(f.country, '(not set)') AND g.city = COALESCE(f.city, '(not set)')
+"""
+FACT_SELECT_QUERIES = {name: template.replace('{dimension_keys}', FACT_DIMENSION_KEYS)
+                                     .replace('{dimension_joins}', FACT_DIMENSION_JOINS.strip())
+                       for name, template in FACT_SELECT_QUERIES.items()}
 
-def send_alert(subject: str, body: str):
-    """Send email alert for data quality issues."""
-    if not ALERT_EMAIL:
-        logger.warning(f"Alert not sent (no email configured): {subject}")
-        return
-    try:
-        msg = MIMEText(body)
-        msg['Subject'] = f"[Ineco Analytics] {subject}"
-        msg['From'] = ALERT_EMAIL
-        msg['To'] = ALERT_EMAIL
-        logger.info(f"Would send alert: {subject}")
-    except Exception as e:
-        logger.error(f"Failed to send alert: {e}")
-
-
-def run_quality_checks(client: bigquery.Client) -> dict:
-    """Run all data quality checks and return results."""
-    results = {
-        'passed': 0, 'failed': 0, 'warnings': 0,
-        'critical_failures': [], 'warnings_list': []
-    }
-    
-    logger.info("=" * 60)
-    logger.info("Running Data Quality Checks")
-    logger.info("=" * 60)
-    
-    for table, checks in QUALITY_CHECKS.items():
-        for check in checks:
-            try:
-                sql = check['sql'].format(project=PROJECT_ID)
-                result = list(client.query(sql).result())[0]
-                failed = result.failed == 1
-                
-                if failed:
-                    if check['severity'] == 'critical':
-                        results['failed'] += 1
-                        results['critical_failures'].append(f"{table}: {check['name']}")
-                        logger.error(f"  ✗ CRITICAL: {table}.{check['name']}")
-                    else:
-                        results['warnings'] += 1
-                        results['warnings_list'].append(f"{table}: {check['name']}")
-                        logger.warning(f"  ⚠ WARNING: {table}.{check['name']}")
-                else:
-                    results['passed'] += 1
-                    logger.info(f"  ✓ PASSED: {table}.{check['name']}")
-            except Exception as e:
-                logger.error(f"  ✗ ERROR: {table}.{check['name']}: {e}")
-                results['failed'] += 1
-    
-    return results
-
+FACT_INCREMENTAL_QUERIES = {
+    'delete_recent': """
+        DELETE FROM `{project}.ineco_marts.{fact}`
+        WHERE date IN ({dates})
+    """,
+    'insert_recent': """
+        INSERT INTO `{project}.ineco_marts.{fact}`
+        {select}
+    """
+}
 
-def table_exists(client: bigquery.Client, table_name: str) -> bool:
-    try:
-        client.get_table(f"{PROJECT_ID}.ineco_marts.{table_name}")
-        return True
-    except Exception:
-        return False
+FACT_CLUSTERING = ['channel_key', 'product_category', 'campaign_key']
 
+FULL_REBUILD_QUERY = """
+    CREATE OR REPLACE TABLE `{project}.ineco_marts.{fact}`
+    PARTITION BY date
+    CLUSTER BY {cluster}
+    AS
+    {select}
+"""
 
-def get_table_row_count(client: bigquery.Client, table_name: str) -> int:
-    try:
-        sql = f"SELECT COUNT(*) as cnt FROM `{PROJECT_ID}.ineco_marts.{table_name}`"
-        return list(client.query(sql).result())[0].cnt
-    except Exception:
-        return 0
+# Rollups of the facts at daily/channel, weekly/channel/product and
+# monthly/campaign grain (definitions in rollups.py). Each period is one date
+# partition (its start date); {fact_filter} restricts the fact scan.
+ROLLUP_SELECT_QUERIES = {name: rollup_select(name) for name in ROLLUPS}
 
+ROLLUP_FULL_REBUILD_QUERY = """
+    CREATE OR REPLACE TABLE `{project}.ineco_marts.{table}`
+    PARTITION BY date
+    CLUSTER BY {cluster}
+    AS
+    {select}
+"""
 
-def refresh_marts(full_rebuild: bool = False):
-    creds_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS', 
-                                '/home/harut/superset/credentials/bigquery-service-account.json')
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-    
-    client = bigquery.Client(project=PROJECT_ID, location=LOCATION)
-    
-    logger.info("=" * 60)
-    logger.info(f"Starting Mart Refresh - {datetime.now()}")
-    logger.info(f"Mode: {'FULL REBUILD' if full_rebuild else f'INCREMENTAL (last {LOOKBACK_DAYS} days)'}")
-    logger.info("=" * 60)
-    
-    success_count = 0
-    error_count = 0
-    bytes_processed = 0
-    
-    # Refresh dimensions
-    logger.info("\n--- Dimension Tables ---")
-    for dim_name, query in DIM_REFRESH_QUERIES.items():
-        try:
-            logger.info(f"Refreshing {dim_name}...")
-            sql = query.format(project=PROJECT_ID)
-            job = client.query(sql)
-            job.result()
-            row_count = get_table_row_count(client, dim_name)
-            bytes_processed += job.total_bytes_processed or 0
-            logger.info(f"  ✓ {dim_name}: {row_count:,} rows")
-            success_count += 1
-        except Exception as e:
-            logger.error(f"  ✗ {dim_name}: {str(e)}")
-            error_count += 1
-    
-    # Refresh facts
-    logger.info("\n--- Fact Tables ---")
-    for fact_name in FACT_INCREMENTAL_QUERIES.keys():
-        try:
-            exists = table_exists(client, fact_name)
-            
-            if not exists or full_rebuild:
-                logger.info(f"Rebuilding {fact_name} (full)...")
-                sql = FULL_REBUILD_QUERIES[fact_name].format(project=PROJECT_ID)
-                job = client.query(sql)
-                job.result()
-                bytes_processed += job.total_bytes_processed or 0
-            else:
-                logger.info(f"Refreshing {fact_name} (incremental, last {LOOKBACK_DAYS} days)...")
-                
-                delete_sql = FACT_INCREMENTAL_QUERIES[fact_name]['delete_recent'].format(
-                    project=PROJECT_ID, lookback=LOOKBACK_DAYS)
-                delete_job = client.query(delete_sql)
-                delete_job.result()
-                deleted_rows = delete_job.num_dml_affected_rows or 0
-                
-                insert_sql = FACT_INCREMENTAL_QUERIES[fact_name]['insert_recent'].format(
-                    project=PROJECT_ID, lookback=LOOKBACK_DAYS)
-                insert_job = client.query(insert_sql)
-                insert_job.result()
-                inserted_rows = insert_job.num_dml_affected_rows or 0
-                bytes_processed += insert_job.total_bytes_processed or 0
-                
-                logger.info(f"  Deleted {deleted_rows:,} old rows, inserted {inserted_rows:,} new rows")
-            
-            row_count = get_table_row_count(client, fact_name)
-            logger.info(f"  ✓ {fact_name}: {row_count:,} total rows")
-            success_count += 1
-        except Exception as e:
-            logger.error(f"  ✗ {fact_name}: {str(e)}")
-            error_count += 1
-    
-    # Refresh Ad Spend (Google Ads + Facebook)
-    logger.info("\n--- Ad Spend Tables ---")
-    try:
-        # Google Ads mart
-        logger.info("Refreshing fact_ad_spend_google...")
-        google_ads_sql = """
-        CREATE OR REPLACE TABLE `{project}.ineco_marts.fact_ad_spend_google` AS
+# Ad spend per date. {google_filter}, {meta_filter} and {mart_filter} restrict
+# each source to the dates being rebuilt (TRUE for a full rebuild).
+AD_SPEND_SELECT_QUERIES = {
+    'fact_ad_spend_google': """
         SELECT
           _DATA_DATE as date,
           'Google Ads' as channel_group,
@@ -477,21 +399,13 @@ def refresh_marts(full_rebuild: bool = False):
           CAST(conversions AS FLOAT64) as conversions,
           SAFE_DIVIDE(CAST(cost_micros AS FLOAT64) / 1000000, NULLIF(CAST(conversions AS FLOAT64), 0)) as cost_per_conversion
         FROM `{project}.ineco_raw.p_ads_CampaignStats_8656917454`
-        WHERE _DATA_DATE IS NOT NULL
-        """.format(project=PROJECT_ID)
-        job = client.query(google_ads_sql)
-        job.result()
-        google_rows = get_table_row_count(client, 'fact_ad_spend_google')
-        logger.info(f"  ✓ fact_ad_spend_google: {google_rows:,} rows")
-        
-        # Unified ad spend
-        logger.info("Refreshing fact_ad_spend (unified)...")
-        unified_sql = """
-        CREATE OR REPLACE TABLE `{project}.ineco_marts.fact_ad_spend` AS
+        WHERE _DATA_DATE IS NOT NULL AND {google_filter}
+    """,
+    'fact_ad_spend': """
         SELECT date, channel_group, campaign, ad_group, impressions, clicks,
                spend_usd, spend_amd, ctr, cpc, cpm, conversions, cost_per_conversion
         FROM `{project}.ineco_marts.fact_ad_spend_google`
-        WHERE date IS NOT NULL
+        WHERE date IS NOT NULL AND {mart_filter}
         UNION ALL
         SELECT 
           DATE(date_start) as date,
@@ -507,110 +421,1104 @@ def refresh_marts(full_rebuild: bool = False):
           SAFE_DIVIDE(CAST(spend AS FLOAT64), CAST(impressions AS FLOAT64)) * 1000,
           0, 0
         FROM `{project}.ineco_raw.ads_insights`
-        WHERE date_start IS NOT NULL
-        """.format(project=PROJECT_ID)
-        job = client.query(unified_sql)
-        job.result()
-        unified_rows = get_table_row_count(client, 'fact_ad_spend')
-        logger.info(f"  ✓ fact_ad_spend: {unified_rows:,} rows")
-        success_count += 2
-    except Exception as e:
-        logger.warning(f"  ⚠ Ad spend tables: {str(e)} (may be no data yet)")
+        WHERE date_start IS NOT NULL AND {meta_filter}
+    """
+}
 
-    # Refresh Funnel Tables
-    logger.info("\n--- Funnel Tables ---")
-    try:
-        # Loans Funnel (6 steps as per Ineco feedback)
-        logger.info("Refreshing funnel_loans...")
-        loans_sql = """
+AD_SPEND_FULL_REBUILD_QUERY = """
+    CREATE OR REPLACE TABLE `{project}.ineco_marts.{table}`
+    PARTITION BY date
+    CLUSTER BY channel_group, campaign
+    AS
+    {select}
+"""
+
+# Raw sources feeding each ad spend table
+AD_SPEND_SOURCES = {
+    'fact_ad_spend_google': ['google_ads'],
+    'fact_ad_spend': ['google_ads', 'meta_ads'],
+}
+
+
+def fact_rebuild_sql(fact_name: str, event_filter: str = 'TRUE') -> str:
+    """CREATE OR REPLACE of a fact from the staging rows matching event_filter."""
+    select = FACT_SELECT_QUERIES[fact_name].format(project=PROJECT_ID, event_filter=event_filter)
+    return FULL_REBUILD_QUERY.format(project=PROJECT_ID, fact=fact_name, cluster=', '.join(FACT_CLUSTERING),
+                                     select=select)
+
+
+def ad_spend_rebuild_sql(table_name: str) -> str:
+    """CREATE OR REPLACE of an ad spend table from all source dates."""
+    select = AD_SPEND_SELECT_QUERIES[table_name].format(project=PROJECT_ID, google_filter='TRUE',
+                                                        meta_filter='TRUE', mart_filter='TRUE')
+    return AD_SPEND_FULL_REBUILD_QUERY.format(project=PROJECT_ID, table=table_name, select=select)
+
+
+# bigquery/marts/<table>.sql files rendered from the templates above with
+# --write-ddl, for bootstrapping or rebuilding one table by hand; the header
+# says what each needs. tests/test_marts_ddl.py fails when they drift.
+MARTS_SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'marts')
+GENERATED_DDL = {
+    'fact_sessions': ("Sessions and engagement per date, surrogate keys and session dimensions",
+                      "ineco_staging.stg_events and the key dimensions dim_channel, dim_campaign, dim_geo"),
+    'fact_conversions': ("Funnel step users per date, surrogate keys and product",
+                         "ineco_staging.int_user_day_events and the key dimensions dim_channel, dim_campaign, dim_geo"),
+    'fact_ad_spend_google': ("Google Ads spend per date, campaign and ad group",
+                             "the Google Ads transfer table ineco_raw.p_ads_CampaignStats_8656917454 (drop an "
+                             "unpartitioned fact_ad_spend_google first)"),
+    'fact_ad_spend': ("Ad spend of all platforms (Google Ads, Meta Ads) per date, campaign and ad group",
+                      "ineco_marts.fact_ad_spend_google and the Meta Airbyte table ineco_raw.ads_insights "
+                      "(drop an unpartitioned fact_ad_spend first)"),
+}
+
+
+def generated_ddl(table_name: str) -> str:
+    """Contents of bigquery/marts/<table_name>.sql."""
+    description, needs = GENERATED_DDL[table_name]
+    sql = fact_rebuild_sql(table_name) if table_name in FACT_SELECT_QUERIES else ad_spend_rebuild_sql(table_name)
+    create, _, select = sql.partition('\n    AS\n')
+    header = textwrap.wrap(f"{table_name}: {description}. Generated from refresh_marts.py "
+                           f"(python3 refresh_marts.py --write-ddl), do not edit by hand. Full rebuild of the "
+                           f"date-partitioned table; refresh_marts.py keeps it current by replacing the "
+                           f"partitions of changed dates. Needs {needs}.", width=86)
+    return ''.join(f"-- {line}\n" for line in header) + (
+        f"\n{textwrap.dedent(create).strip()}\nAS\n{textwrap.dedent(select).strip()};\n")
+
+
+def write_ddl():
+    for table_name in GENERATED_DDL:
+        path = os.path.join(MARTS_SQL_DIR, f"{table_name}.sql")
+        with open(path, 'w') as f:
+            f.write(generated_ddl(table_name))
+        print(f"✅ {path}")
+
+# Funnels are rollups of int_user_day_events (user-day flags per funnel event);
+# funnel_summary merges the daily funnel sketches
+FUNNEL_QUERIES = {
+    # Loans Funnel (6 steps as per Ineco feedback)
+    'funnel_loans': """
         CREATE OR REPLACE TABLE `{project}.ineco_marts.funnel_loans`
         PARTITION BY date CLUSTER BY channel_group AS
         SELECT
-          event_date as date, channel_group, COALESCE(campaign, '(not set)') as campaign, device_category,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_apply_click' THEN user_pseudo_id END) as step1_apply_click,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_sub_id_captured' THEN user_pseudo_id END) as step2_sub_id_captured,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_open_personal_account' THEN user_pseudo_id END) as step3_open_account,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_ssn_submitted' THEN user_pseudo_id END) as step4_ssn_submitted,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_click' THEN user_pseudo_id END) as step5_check_limit,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_completed' AND NOT is_test_event THEN user_pseudo_id END) as step6_completed
-        FROM `{project}.ineco_staging.stg_events_clean`
+          event_date as date, channel_group, campaign, device_category,
+          COUNT(DISTINCT IF(has_sprint_apply_click, user_pseudo_id, NULL)) as step1_apply_click,
+          COUNT(DISTINCT IF(has_sprint_sub_id_captured, user_pseudo_id, NULL)) as step2_sub_id_captured,
+          COUNT(DISTINCT IF(has_sprint_open_personal_account, user_pseudo_id, NULL)) as step3_open_account,
+          COUNT(DISTINCT IF(has_sprint_ssn_submitted, user_pseudo_id, NULL)) as step4_ssn_submitted,
+          COUNT(DISTINCT IF(has_sprint_check_limit_click, user_pseudo_id, NULL)) as step5_check_limit,
+          COUNT(DISTINCT IF(has_sprint_completed, user_pseudo_id, NULL)) as step6_completed,
+          HLL_COUNT.INIT(IF(has_sprint_apply_click, user_pseudo_id, NULL), 15) as step1_apply_click_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_sub_id_captured, user_pseudo_id, NULL), 15) as step2_sub_id_captured_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_open_personal_account, user_pseudo_id, NULL), 15) as step3_open_account_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_ssn_submitted, user_pseudo_id, NULL), 15) as step4_ssn_submitted_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_check_limit_click, user_pseudo_id, NULL), 15) as step5_check_limit_sketch,
+          HLL_COUNT.INIT(IF(has_sprint_completed, user_pseudo_id, NULL), 15) as step6_completed_sketch
+        FROM `{project}.ineco_staging.int_user_day_events`
         WHERE product_category = 'Consumer Loans' OR flow_type = 'Sprint'
         GROUP BY 1, 2, 3, 4
-        """.format(project=PROJECT_ID)
-        job = client.query(loans_sql)
-        job.result()
-        logger.info(f"  ✓ funnel_loans: {get_table_row_count(client, 'funnel_loans'):,} rows")
-
-        # Registration Funnel (5 steps as per Ineco feedback)
-        logger.info("Refreshing funnel_registration...")
-        reg_sql = """
+    """,
+    # Registration Funnel (5 steps as per Ineco feedback)
+    'funnel_registration': """
         CREATE OR REPLACE TABLE `{project}.ineco_marts.funnel_registration`
         PARTITION BY date CLUSTER BY channel_group, product_category AS
         SELECT
-          event_date as date, channel_group, COALESCE(campaign, '(not set)') as campaign, product_category, device_category,
-          COUNT(DISTINCT CASE WHEN event_name_clean IN ('reg_apply_click', 'cards_apply_click') THEN user_pseudo_id END) as step1_apply_click,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_sub_id_captured' THEN user_pseudo_id END) as step2_sub_id_captured,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_phone_submitted' THEN user_pseudo_id END) as step3_phone_submitted,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'kyc_started' THEN user_pseudo_id END) as step4_kyc_started,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_completed' THEN user_pseudo_id END) as step5_completed
-        FROM `{project}.ineco_staging.stg_events_clean`
+          event_date as date, channel_group, campaign, product_category, device_category,
+          COUNT(DISTINCT IF(has_reg_apply_click, user_pseudo_id, NULL)) as step1_apply_click,
+          COUNT(DISTINCT IF(has_reg_sub_id_captured, user_pseudo_id, NULL)) as step2_sub_id_captured,
+          COUNT(DISTINCT IF(has_reg_phone_submitted, user_pseudo_id, NULL)) as step3_phone_submitted,
+          COUNT(DISTINCT IF(has_kyc_started, user_pseudo_id, NULL)) as step4_kyc_started,
+          COUNT(DISTINCT IF(has_reg_completed, user_pseudo_id, NULL)) as step5_completed,
+          HLL_COUNT.INIT(IF(has_reg_apply_click, user_pseudo_id, NULL), 15) as step1_apply_click_sketch,
+          HLL_COUNT.INIT(IF(has_reg_sub_id_captured, user_pseudo_id, NULL), 15) as step2_sub_id_captured_sketch,
+          HLL_COUNT.INIT(IF(has_reg_phone_submitted, user_pseudo_id, NULL), 15) as step3_phone_submitted_sketch,
+          HLL_COUNT.INIT(IF(has_kyc_started, user_pseudo_id, NULL), 15) as step4_kyc_started_sketch,
+          HLL_COUNT.INIT(IF(has_reg_completed, user_pseudo_id, NULL), 15) as step5_completed_sketch
+        FROM `{project}.ineco_staging.int_user_day_events`
         WHERE product_category IN ('Cards', 'Deposits', 'Homepage') OR flow_type = 'Registration'
         GROUP BY 1, 2, 3, 4, 5
-        """.format(project=PROJECT_ID)
-        job = client.query(reg_sql)
-        job.result()
-        logger.info(f"  ✓ funnel_registration: {get_table_row_count(client, 'funnel_registration'):,} rows")
-        
-        # Funnel Summary (true unique users for KPIs)
-        logger.info("Refreshing funnel_summary...")
-        summary_sql = """
+    """,
+    # Funnel Summary: 30-day unique users per step, merged from the daily
+    # funnel sketches (HLL++, ~0.57% relative error) instead of an event scan
+    'funnel_summary': """
         CREATE OR REPLACE TABLE `{project}.ineco_marts.funnel_summary` AS
         SELECT
           'Loans' as funnel_type,
           DATE_TRUNC(CURRENT_DATE(), MONTH) as period_start,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_apply_click' THEN user_pseudo_id END) as loans_apply,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_sub_id_captured' THEN user_pseudo_id END) as loans_sub_id,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_open_personal_account' THEN user_pseudo_id END) as loans_open_acc,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_ssn_submitted' THEN user_pseudo_id END) as loans_ssn,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_click' THEN user_pseudo_id END) as loans_check_limit,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'sprint_check_limit_completed' AND NOT is_test_event THEN user_pseudo_id END) as loans_completed,
+          HLL_COUNT.MERGE(step1_apply_click_sketch) as loans_apply,
+          HLL_COUNT.MERGE(step2_sub_id_captured_sketch) as loans_sub_id,
+          HLL_COUNT.MERGE(step3_open_account_sketch) as loans_open_acc,
+          HLL_COUNT.MERGE(step4_ssn_submitted_sketch) as loans_ssn,
+          HLL_COUNT.MERGE(step5_check_limit_sketch) as loans_check_limit,
+          HLL_COUNT.MERGE(step6_completed_sketch) as loans_completed,
           NULL as reg_apply, NULL as reg_sub_id, NULL as reg_phone, NULL as reg_kyc, NULL as reg_completed
-        FROM `{project}.ineco_staging.stg_events_clean`
-        WHERE event_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
-          AND (product_category = 'Consumer Loans' OR flow_type = 'Sprint')
+        FROM `{project}.ineco_marts.funnel_loans`
+        WHERE date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
         UNION ALL
         SELECT
           'Registration' as funnel_type,
           DATE_TRUNC(CURRENT_DATE(), MONTH) as period_start,
           NULL, NULL, NULL, NULL, NULL, NULL,
-          COUNT(DISTINCT CASE WHEN event_name_clean IN ('reg_apply_click', 'cards_apply_click') THEN user_pseudo_id END) as reg_apply,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_sub_id_captured' THEN user_pseudo_id END) as reg_sub_id,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_phone_submitted' THEN user_pseudo_id END) as reg_phone,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'kyc_started' THEN user_pseudo_id END) as reg_kyc,
-          COUNT(DISTINCT CASE WHEN event_name_clean = 'reg_completed' THEN user_pseudo_id END) as reg_completed
-        FROM `{project}.ineco_staging.stg_events_clean`
-        WHERE event_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
-          AND (product_category IN ('Cards', 'Deposits', 'Homepage') OR flow_type = 'Registration')
-        """.format(project=PROJECT_ID)
-        job = client.query(summary_sql)
-        job.result()
-        logger.info(f"  ✓ funnel_summary: {get_table_row_count(client, 'funnel_summary'):,} rows")
-        success_count += 3
+          HLL_COUNT.MERGE(step1_apply_click_sketch) as reg_apply,
+          HLL_COUNT.MERGE(step2_sub_id_captured_sketch) as reg_sub_id,
+          HLL_COUNT.MERGE(step3_phone_submitted_sketch) as reg_phone,
+          HLL_COUNT.MERGE(step4_kyc_started_sketch) as reg_kyc,
+          HLL_COUNT.MERGE(step5_completed_sketch) as reg_completed
+        FROM `{project}.ineco_marts.funnel_registration`
+        WHERE date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
+    """
+}
+
+# Tables read by the full-replace steps (the funnels; the key dimensions are
+# MERGEd and the facts and ad spend tables partition-replaced for changed dates
+# only). Their __TABLES__ metadata, the step's SQL and (for CURRENT_DATE
+# windows) today's date make up an input fingerprint stored as a label on the
+# output; an unchanged fingerprint skips the rebuild.
+FULL_REPLACE_INPUTS = {name: sorted(set(re.findall(r"`\{project\}\.(\w+\.\w+)`", sql)) - {f"ineco_marts.{name}"})
+                       for name, sql in FUNNEL_QUERIES.items()}
+FINGERPRINT_LABEL = 'input_fingerprint'
+
+
+def send_alert(subject: str, body: str):
+    """Send email alert for data quality issues."""
+    if not ALERT_EMAIL:
+        logger.warning(f"Alert not sent (no email configured): {subject}")
+        return
+    try:
+        msg = MIMEText(body)
+        msg['Subject'] = f"[Ineco Analytics] {subject}"
+        msg['From'] = ALERT_EMAIL
+        msg['To'] = ALERT_EMAIL
+        logger.info(f"Would send alert: {subject}")
     except Exception as e:
-        logger.warning(f"  ⚠ Funnel tables: {str(e)}")
+        logger.error(f"Failed to send alert: {e}")
 
-    # Quality checks
-    qc_results = run_quality_checks(client)
+
+def run_quality_checks(client: bigquery.Client, ledger: RunLedger = None) -> dict:
+    """Run the 'refresh' suite from quality_checks (one scan per table)."""
+    results = {
+        'passed': 0, 'failed': 0, 'warnings': 0,
+        'critical_failures': [], 'warnings_list': []
+    }
+    
+    logger.info("=" * 60)
+    logger.info("Running Data Quality Checks")
+    logger.info("=" * 60)
     
-    # Summary
-    gb_processed = bytes_processed / (1024**3)
-    estimated_cost = gb_processed * 5 / 1000
+    for result in run_checks(client, PROJECT_ID, 'refresh', ledger=ledger):
+        table, check = result['table'], result['check']
+        if result['error'] is not None:
+            logger.error(f"  ✗ ERROR: {table}.{check['name']}: {result['error']}")
+            results['failed'] += 1
+        elif not result['passed']:
+            if check['severity'] == 'critical':
+                results['failed'] += 1
+                results['critical_failures'].append(f"{table}: {check['name']}")
+                logger.error(f"  ✗ CRITICAL: {table}.{check['name']}")
+            else:
+                results['warnings'] += 1
+                results['warnings_list'].append(f"{table}: {check['name']}")
+                logger.warning(f"  ⚠ WARNING: {table}.{check['name']}")
+        else:
+            results['passed'] += 1
+            logger.info(f"  ✓ PASSED: {table}.{check['name']}")
+    
+    return results
+
+
+def table_exists(client: bigquery.Client, table_name: str) -> bool:
+    """
+    True if the mart table exists. Only NotFound means missing: any other
+    error propagates so a transient API failure cannot trigger a full rebuild.
+    """
+    try:
+        client.get_table(f"{PROJECT_ID}.ineco_marts.{table_name}")
+        return True
+    except NotFound:
+        return False
+
+
+class BudgetExceededError(RuntimeError):
+    """A job would exceed its per-step byte limit or the run budget."""
+
+
+# Tables a script writes, and the ones it drops before re-creating
+SCRIPT_TARGETS = re.compile(
+    r'\b(?:CREATE\s+(?:OR\s+REPLACE\s+)?TABLE(?:\s+IF\s+NOT\s+EXISTS)?|ALTER\s+TABLE|MERGE(?:\s+INTO)?|'
+    r'INSERT(?:\s+INTO)?|DELETE(?:\s+FROM)?|UPDATE|TRUNCATE\s+TABLE)\s+`([\w-]+\.\w+\.\w+)`', re.IGNORECASE)
+SCRIPT_DROPS = re.compile(r'\bDROP\s+TABLE(?:\s+IF\s+EXISTS)?\s+`([\w-]+\.\w+\.\w+)`', re.IGNORECASE)
+
+
+class UnestimatedJob:
+    """--plan stand-in for a query that could not be dry-run; finish() records it as unestimated."""
+    total_bytes_processed = None
+    job_id = None
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class RefreshContext:
+    """Per-run state shared by refresh steps running on scheduler threads."""
+
+    def __init__(self, client: bigquery.Client, ledger: RunLedger, full_rebuild: bool = False,
+                 write_mode: str = FACT_WRITE_MODE, dry_run: bool = False,
+                 max_gb_per_step: float = MAX_GB_PER_STEP, run_budget_gb: float = RUN_BUDGET_GB,
+                 max_concurrent_jobs: int = MAX_CONCURRENT_JOBS):
+        self.client = client
+        self.ledger = ledger
+        self.full_rebuild = full_rebuild
+        self.write_mode = write_mode
+        # Set by detect_changed_shards: dates to recompute and the shard
+        # metadata to save once the facts have been refreshed
+        self.changed_dates = []
+        self.shard_watermarks = None
+        # Set by detect_ad_spend_changes: changed dates per ad spend source
+        self.ad_spend_dates = {}
+        self.ad_spend_watermarks = None
+        self.ad_spend_full = False
+        # --plan: queries are dry-run and their estimates collected here
+        self.dry_run = dry_run
+        self.planned_jobs = []
+        # Base step names that wrote a table in this run, for publish_mart_versions
+        self.written_tables = set()
+        self.max_gb_per_step = max_gb_per_step
+        self.run_budget_bytes = int(run_budget_gb * 1024**3)
+        self._reserved = {}
+        self._lock = threading.Lock()
+        # One slot per job between submit and finish
+        self._job_slots = threading.BoundedSemaphore(max(1, max_concurrent_jobs))
+
+    def checkpoint_state(self) -> dict:
+        """Watermarks and changed dates set by the detect steps, JSON-serializable."""
+        return {
+            'changed_dates': [d.isoformat() for d in self.changed_dates],
+            'shard_watermarks': self.shard_watermarks,
+            'ad_spend_dates': {source: [d.isoformat() for d in dates]
+                               for source, dates in self.ad_spend_dates.items()},
+            'ad_spend_watermarks': self.ad_spend_watermarks,
+            'ad_spend_full': self.ad_spend_full,
+        }
+
+    def restore_state(self, state: dict):
+        """Reuse the watermarks of an earlier attempt, so resumed steps see the same dates."""
+        parse = lambda d: datetime.strptime(d, '%Y-%m-%d').date()
+        self.changed_dates = [parse(d) for d in state.get('changed_dates', [])]
+        self.shard_watermarks = state.get('shard_watermarks')
+        self.ad_spend_dates = {source: [parse(d) for d in dates]
+                               for source, dates in state.get('ad_spend_dates', {}).items()}
+        self.ad_spend_watermarks = state.get('ad_spend_watermarks')
+        self.ad_spend_full = state.get('ad_spend_full', False)
+
+    def step_inputs(self, sources: str) -> dict:
+        """Source dates a step refreshed, for its checkpoint entry."""
+        if sources == 'ga4':
+            return {'full_rebuild': self.full_rebuild, 'changed_dates': [d.isoformat() for d in self.changed_dates]}
+        if sources == 'ad_spend':
+            return {'full_rebuild': self.full_rebuild or self.ad_spend_full,
+                    'ad_spend_dates': {source: [d.isoformat() for d in dates]
+                                       for source, dates in self.ad_spend_dates.items()}}
+        return {}
+
+    def step_limit_bytes(self, step: str) -> int:
+        base_step = step.split(':')[0]
+        return int(STEP_MAX_GB.get(base_step, self.max_gb_per_step) * 1024**3)
+
+    def estimate_bytes(self, sql: str) -> int:
+        dry_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        return self.client.query(sql, job_config=dry_config).total_bytes_processed or 0
+
+    def unestimable_reason(self, sql: str) -> str:
+        """
+        Why a script cannot be dry-run, or None. BigQuery validates every
+        statement of a script against the tables as they are before it runs,
+        so a MERGE into a table the script creates, or a CREATE after a DROP
+        that changes the partitioning, fails the dry run (fresh datasets).
+        """
+        if len([statement for statement in sql.split(';') if statement.strip()]) < 2:
+            return None
+        dropped = sorted(set(SCRIPT_DROPS.findall(sql)))
+        if dropped:
+            return f"re-creates {', '.join(dropped)}"
+        missing = []
+        for table_id in sorted(set(SCRIPT_TARGETS.findall(sql))):
+            try:
+                self.client.get_table(table_id)
+            except NotFound:
+                missing.append(table_id)
+        return f"creates {', '.join(missing)}" if missing else None
+
+    def submit(self, step: str, sql: str, job_config: bigquery.QueryJobConfig = None,
+               wait: bool = True) -> bigquery.QueryJob:
+        """
+        Start a query job without waiting for it.
+
+        The job takes one of the max_concurrent_jobs slots until finish().
+        With wait=False nothing is submitted and None is returned when all
+        slots are taken, so a caller holding unfinished jobs can finish one
+        instead of blocking on a slot it may itself be holding.
+
+        Real runs dry-run the query first and refuse to submit it if the
+        estimate is over the step limit or the remaining run budget; the job
+        also carries maximum_bytes_billed as a hard stop in BigQuery.
+        """
+        if not self._job_slots.acquire(blocking=wait):
+            return None
+        try:
+            return self._submit(step, sql, job_config or bigquery.QueryJobConfig())
+        except Exception:
+            self._job_slots.release()
+            raise
+
+    def _submit(self, step: str, sql: str, job_config: bigquery.QueryJobConfig) -> bigquery.QueryJob:
+        reason = self.unestimable_reason(sql)
+        if self.dry_run:
+            if reason:
+                return UnestimatedJob(reason)
+            job_config.dry_run = True
+            job_config.use_query_cache = False
+            try:
+                return self.client.query(sql, job_config=job_config)
+            except NotFound as e:
+                # Reads a table an earlier step creates, which --plan does not run
+                return UnestimatedJob(f"input missing until earlier steps run ({e.message})")
+
+        step_limit = self.step_limit_bytes(step)
+        if reason:
+            # Only maximum_bytes_billed bounds the job; the budget sees it once billed
+            logger.warning(f"  ⚠ {step}: not estimated, the script {reason}; "
+                           f"capped at {step_limit / 1024**3:.0f} GB by maximum_bytes_billed")
+            estimate = 0
+        else:
+            estimate = self.estimate_bytes(sql)
+        with self._lock:
+            if estimate > step_limit:
+                raise BudgetExceededError(
+                    f"{step} would scan {estimate / 1024**3:.2f} GB, over its "
+                    f"{step_limit / 1024**3:.0f} GB limit (MAX_GB_PER_STEP / STEP_MAX_GB). "
+                    f"Check the query for a missing date filter, or raise the limit with --max-gb-per-step")
+            committed = self.ledger.totals()['bytes_billed'] + sum(self._reserved.values())
+            if committed + estimate > self.run_budget_bytes:
+                raise BudgetExceededError(
+                    f"{step} would bring this run to {(committed + estimate) / 1024**3:.2f} GB, over the "
+                    f"{self.run_budget_bytes / 1024**3:.0f} GB run budget (RUN_BUDGET_GB / --run-budget-gb)")
+            job_config.maximum_bytes_billed = step_limit
+            job = self.client.query(sql, job_config=job_config)
+            self._reserved[job.job_id] = estimate
+        return job
+
+    def finish(self, step: str, job: bigquery.QueryJob) -> bigquery.QueryJob:
+        """Wait for a submitted job, record it in the run ledger and free its slot."""
+        if self.dry_run:
+            with self._lock:
+                self.planned_jobs.append({'step': step.split(':')[0], 'bytes': job.total_bytes_processed or 0,
+                                          'limit': self.step_limit_bytes(step),
+                                          'unestimated': getattr(job, 'reason', None)})
+            self._job_slots.release()
+            return job
+        try:
+            job = self.ledger.timed(step, job)
+            if not step.endswith(':row_count'):
+                with self._lock:
+                    self.written_tables.add(step.split(':')[0])
+            return job
+        except Exception as e:
+            if any(err.get('reason') == 'bytesBilledLimitExceeded' for err in getattr(e, 'errors', None) or []):
+                raise BudgetExceededError(
+                    f"{step} stopped by BigQuery at maximum_bytes_billed="
+                    f"{job.maximum_bytes_billed} bytes: {e}") from e
+            raise
+        finally:
+            with self._lock:
+                self._reserved.pop(job.job_id, None)
+            self._job_slots.release()
+
+    def query(self, step: str, sql: str, job_config: bigquery.QueryJobConfig = None) -> bigquery.QueryJob:
+        """Run a query to completion and record it in the run ledger."""
+        return self.finish(step, self.submit(step, sql, job_config))
+
+    def row_count(self, table_name: str) -> int:
+        if self.dry_run:
+            return 0
+        try:
+            sql = f"SELECT COUNT(*) as cnt FROM `{PROJECT_ID}.ineco_marts.{table_name}`"
+            return list(self.query(f"{table_name}:row_count", sql).result())[0].cnt
+        except Exception:
+            return 0
+
+
+def format_dates(dates: list) -> str:
+    """Render dates as a BigQuery DATE literal list for IN (...)."""
+    return ', '.join(f"DATE '{d.isoformat()}'" for d in dates)
+
+
+def detect_changed_shards(ctx: RefreshContext, step_name: str):
+    """Compare GA4 shard metadata against the saved watermarks."""
+    logger.info("Checking GA4 shard watermarks...")
+    current = fetch_shard_metadata(ctx.client, PROJECT_ID, ledger=ctx.ledger)
+    previous = load_watermarks(WATERMARK_FILE)
+    ctx.shard_watermarks = current
+
+    if previous is None:
+        today = datetime.now().date()
+        ctx.changed_dates = [today - timedelta(days=n) for n in range(LOOKBACK_DAYS, -1, -1)]
+        logger.info(f"  No watermarks at {WATERMARK_FILE}, using last {LOOKBACK_DAYS} days")
+    else:
+        ctx.changed_dates = changed_dates(current, previous)
+        shown = ', '.join(d.isoformat() for d in ctx.changed_dates[:10])
+        more = f" (+{len(ctx.changed_dates) - 10} more)" if len(ctx.changed_dates) > 10 else ''
+        logger.info(f"  ✓ {len(current)} shards, {len(ctx.changed_dates)} changed dates: {shown or 'none'}{more}")
+
+
+def commit_shard_watermarks(ctx: RefreshContext, step_name: str):
+    """Save watermarks only after every fact that used them succeeded."""
+    if ctx.dry_run:
+        return
+    save_watermarks(WATERMARK_FILE, ctx.shard_watermarks)
+    logger.info(f"  ✓ Saved {len(ctx.shard_watermarks)} shard watermarks")
+
+
+def input_fingerprint(ctx: RefreshContext, table_name: str, sql: str) -> str:
+    """Hash of a full-replace step's SQL and the last-modified time, rows and size of its inputs."""
+    parts = [sql]
+    if 'CURRENT_DATE' in sql:
+        parts.append(datetime.now().date().isoformat())
+    inputs = {}
+    for name in FULL_REPLACE_INPUTS[table_name]:
+        dataset, table = name.split('.')
+        inputs.setdefault(dataset, []).append(table)
+    for dataset, tables in sorted(inputs.items()):
+        metadata = fetch_table_metadata(ctx.client, PROJECT_ID, dataset, tables, ledger=ctx.ledger,
+                                        step=f"{table_name}:fingerprint")
+        parts.extend(f"{dataset}.{table}={metadata.get(table)}" for table in tables)
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:32]
+
+
+def run_full_replace(ctx: RefreshContext, table_name: str, sql: str) -> bool:
+    """
+    Run a CREATE OR REPLACE unless the inputs are unchanged since the table was
+    last built (same fingerprint label). --full always rebuilds. Returns True
+    if the table was rebuilt.
+    """
+    fingerprint = input_fingerprint(ctx, table_name, sql)
+    table_id = f"{PROJECT_ID}.ineco_marts.{table_name}"
+    if not ctx.full_rebuild:
+        try:
+            labels = ctx.client.get_table(table_id).labels or {}
+        except NotFound:
+            labels = {}
+        if labels.get(FINGERPRINT_LABEL) == fingerprint:
+            logger.info(f"  ✓ {table_name}: inputs unchanged since the last build, skipped")
+            return False
+
+    ctx.query(table_name, sql)
+    if not ctx.dry_run:
+        # CREATE OR REPLACE drops labels, so the new table only carries this fingerprint
+        table = ctx.client.get_table(table_id)
+        table.labels = {**(table.labels or {}), FINGERPRINT_LABEL: fingerprint}
+        ctx.client.update_table(table, ['labels'])
+    return True
+
+
+def select_columns(sql: str) -> list:
+    """Output column names of the outermost SELECT of a query."""
+    depth, start, items = 0, None, []
+    for match in re.finditer(r"[(),]|\bSELECT\b|\bFROM\b", sql, re.IGNORECASE):
+        token = match.group(0).upper()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and token == 'SELECT' and start is None:
+            start = match.end()
+        elif depth == 0 and start is not None and token in (',', 'FROM'):
+            items.append(sql[start:match.start()])
+            start = match.end()
+            if token == 'FROM':
+                break
+    return [re.findall(r"\w+", item)[-1] for item in items if item.strip()]
+
+
+def check_key_dimensions():
+    """Every natural key and attribute of a key dimension must be a column of its select."""
+    for table_name, dim in KEY_DIMENSIONS.items():
+        selected = set(select_columns(dim['select']))
+        missing = [c for c in dim['natural_key'] + dim['attributes'] + ['first_seen_date'] if c not in selected]
+        if missing:
+            raise ValueError(f"KEY_DIMENSIONS['{table_name}'] lists {', '.join(missing)}, "
+                             f"which its select does not produce")
+
+
+check_key_dimensions()
+
+
+def key_dimension_sql(table_name: str, event_filter: str) -> str:
+    """CREATE IF NOT EXISTS + MERGE that adds new natural keys with new surrogate keys."""
+    dim = KEY_DIMENSIONS[table_name]
+    natural_key = dim['natural_key']
+    columns = [dim['key']] + natural_key + dim['attributes'] + ['first_seen_date']
+    updates = [f"{c} = s.{c}" for c in dim['attributes']]
+    updates.append("first_seen_date = IF(d.first_seen_date IS NULL OR s.first_seen_date < d.first_seen_date, "
+                   "s.first_seen_date, d.first_seen_date)")
+    return KEY_DIMENSION_QUERY.format(
+        project=PROJECT_ID, table=table_name, key=dim['key'],
+        select=dim['select'].format(project=PROJECT_ID, event_filter=event_filter),
+        select_empty=dim['select'].format(project=PROJECT_ID, event_filter='FALSE'),
+        natural_key=', '.join(natural_key),
+        match=' AND '.join(f"d.{c} = s.{c}" for c in natural_key),
+        updates=', '.join(updates),
+        columns=', '.join(columns),
+        values=', '.join(f"s.{c}" for c in columns))
+
+
+def refresh_dimension(ctx: RefreshContext, dim_name: str):
+    """Add the natural keys of the changed GA4 dates (all dates on --full or first build) to a key dimension."""
+    if ctx.full_rebuild or not table_exists(ctx.client, dim_name):
+        event_filter = 'TRUE'
+    elif not ctx.changed_dates:
+        logger.info(f"  ✓ {dim_name}: no GA4 shards changed, nothing to refresh")
+        return
+    else:
+        event_filter = f"event_date IN ({format_dates(ctx.changed_dates)})"
+    logger.info(f"Refreshing {dim_name}...")
+    ctx.query(dim_name, key_dimension_sql(dim_name, event_filter))
+    row_count = ctx.row_count(dim_name)
+    logger.info(f"  ✓ {dim_name}: {row_count:,} rows")
+
+
+def shard_filter(date) -> str:
+    """_TABLE_SUFFIX predicate for the daily and intraday GA4 shards of one date."""
+    suffix = date.strftime('%Y%m%d')
+    return f"_TABLE_SUFFIX IN ('{suffix}', 'intraday_{suffix}')"
+
+
+def event_filters(date) -> dict:
+    """Template filters for one date of GA4-derived tables."""
+    return {'event_filter': f"event_date = DATE '{date.isoformat()}'", 'shard_filter': shard_filter(date)}
+
+
+def replace_partitions(ctx: RefreshContext, table_name: str, select_template: str, dates: list,
+                       dataset: str = 'ineco_marts', filters=event_filters) -> dict:
+    """
+    Overwrite one date partition per job with WRITE_TRUNCATE.
+
+    Each day is swapped in atomically, so readers never see a missing day.
+    filters(date) gives the template placeholders restricting the read to
+    that day. Up to PARTITION_JOBS_IN_FLIGHT jobs run at once, as long as
+    the run has free job slots (MAX_CONCURRENT_JOBS); otherwise the oldest
+    job is finished first. Returns {date: rows written} from the finished jobs.
+    """
+    step = f"{table_name}:partition"
+    rows_written = {}
+    in_flight = deque()
+
+    def finish_oldest():
+        date, job = in_flight.popleft()
+        ctx.finish(step, job)
+        rows_written[date] = 0 if ctx.dry_run else (job.result().total_rows or 0)
+
+    try:
+        for date in dates:
+            job_config = bigquery.QueryJobConfig(
+                destination=f"{PROJECT_ID}.{dataset}.{table_name}${date.strftime('%Y%m%d')}",
+                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION],
+            )
+            sql = select_template.format(project=PROJECT_ID, **filters(date))
+            while True:
+                if len(in_flight) >= PARTITION_JOBS_IN_FLIGHT:
+                    finish_oldest()
+                # Block on a slot only while holding none
+                job = ctx.submit(step, sql, job_config, wait=not in_flight)
+                if job is not None:
+                    break
+                finish_oldest()
+            in_flight.append((date, job))
+        while in_flight:
+            finish_oldest()
+    finally:
+        # A failed job must not leave the others holding their slots
+        for _, job in in_flight:
+            try:
+                ctx.finish(step, job)
+            except Exception:
+                pass
+    return rows_written
+
+
+def refresh_staging(ctx: RefreshContext, table_name: str):
+    """Replace the partitions of changed GA4 dates in a date-partitioned staging table."""
+    try:
+        table = ctx.client.get_table(f"{PROJECT_ID}.ineco_staging.{table_name}")
+    except NotFound:
+        table = None
+    if table is not None and table.table_type != 'TABLE':
+        raise RuntimeError(f"ineco_staging.{table_name} is a {table.table_type}, not a partitioned table. "
+                           f"Run bigquery/staging/{table_name}.sql once to migrate it")
+
+    select_template = STAGING_SELECT_QUERIES[table_name]
+    if table is None or ctx.full_rebuild:
+        logger.info(f"Rebuilding {table_name} (full)...")
+        select = select_template.format(project=PROJECT_ID, shard_filter='TRUE', event_filter='TRUE')
+        ctx.query(table_name, STAGING_FULL_REBUILD_QUERY.format(project=PROJECT_ID, table=table_name, select=select))
+        logger.info(f"  ✓ {table_name}: rebuilt from full history")
+    elif not ctx.changed_dates:
+        logger.info(f"  ✓ {table_name}: no GA4 shards changed, nothing to refresh")
+    else:
+        logger.info(f"Refreshing {table_name} ({len(ctx.changed_dates)} changed dates)...")
+        rows_written = replace_partitions(ctx, table_name, select_template, ctx.changed_dates,
+                                          dataset='ineco_staging')
+        logger.info(f"  ✓ {table_name}: {sum(rows_written.values()):,} rows in {len(rows_written)} partitions")
+
+
+def stale_fact_layout(table) -> bool:
+    """True for a fact built before the surrogate keys (string columns, clustered on them)."""
+    return table.clustering_fields not in (None, FACT_CLUSTERING)
+
+
+def refresh_fact(ctx: RefreshContext, fact_name: str):
+    try:
+        table = ctx.client.get_table(f"{PROJECT_ID}.ineco_marts.{fact_name}")
+    except NotFound:
+        table = None
+
+    if table is None or stale_fact_layout(table) or ctx.full_rebuild:
+        logger.info(f"Rebuilding {fact_name} (full)...")
+        ctx.query(fact_name, fact_rebuild_sql(fact_name))
+    elif not ctx.changed_dates:
+        logger.info(f"  ✓ {fact_name}: no GA4 shards changed, nothing to refresh")
+        return
+    elif ctx.write_mode == 'partition':
+        logger.info(f"Refreshing {fact_name} (partition replace, {len(ctx.changed_dates)} changed dates)...")
+        rows_written = replace_partitions(ctx, fact_name, FACT_SELECT_QUERIES[fact_name], ctx.changed_dates)
+        for date, rows in rows_written.items():
+            logger.info(f"  {fact_name}${date.strftime('%Y%m%d')}: {rows:,} rows written")
+    else:
+        dates = format_dates(ctx.changed_dates)
+        logger.info(f"Refreshing {fact_name} (DELETE + INSERT, {len(ctx.changed_dates)} changed dates)...")
+
+        delete_sql = FACT_INCREMENTAL_QUERIES['delete_recent'].format(
+            project=PROJECT_ID, fact=fact_name, dates=dates)
+        delete_job = ctx.query(f"{fact_name}:delete", delete_sql)
+        deleted_rows = delete_job.num_dml_affected_rows or 0
+
+        select = FACT_SELECT_QUERIES[fact_name].format(
+            project=PROJECT_ID, event_filter=f"event_date IN ({dates})")
+        insert_sql = FACT_INCREMENTAL_QUERIES['insert_recent'].format(
+            project=PROJECT_ID, fact=fact_name, select=select)
+        insert_job = ctx.query(f"{fact_name}:insert", insert_sql)
+        inserted_rows = insert_job.num_dml_affected_rows or 0
+
+        logger.info(f"  {fact_name}: deleted {deleted_rows:,} old rows, inserted {inserted_rows:,} new rows")
+
+    row_count = ctx.row_count(fact_name)
+    logger.info(f"  ✓ {fact_name}: {row_count:,} total rows")
+
+
+def refresh_full_replace(ctx: RefreshContext, table_name: str):
+    """Rebuild a funnel table with CREATE OR REPLACE when its inputs changed."""
+    logger.info(f"Refreshing {table_name}...")
+    if not run_full_replace(ctx, table_name, FUNNEL_QUERIES[table_name].format(project=PROJECT_ID)):
+        return
+    logger.info(f"  ✓ {table_name}: {ctx.row_count(table_name):,} rows")
+
+
+def rollup_filters(grain: str):
+    """Template filters for the fact dates of one rollup period."""
+    def filters(start) -> dict:
+        return {'fact_filter': f"date BETWEEN DATE '{start.isoformat()}' "
+                               f"AND DATE '{period_end(start, grain).isoformat()}'"}
+    return filters
+
+
+def rollup_sql(table_name: str, fact_filter: str) -> str:
+    """CREATE OR REPLACE of a rollup from the fact rows matching fact_filter."""
+    select = ROLLUP_SELECT_QUERIES[table_name].format(project=PROJECT_ID, fact_filter=fact_filter)
+    return ROLLUP_FULL_REBUILD_QUERY.format(project=PROJECT_ID, table=table_name, select=select,
+                                            cluster=', '.join(ROLLUPS[table_name]['dimensions']))
+
+
+def replace_rollup_periods(ctx: RefreshContext, table_name: str, dates: list) -> dict:
+    """Recompute the rollup periods (day, week or month) containing dates."""
+    grain = ROLLUPS[table_name]['grain']
+    periods = sorted({period_start(d, grain) for d in dates})
+    return replace_partitions(ctx, table_name, ROLLUP_SELECT_QUERIES[table_name], periods,
+                              filters=rollup_filters(grain))
+
+
+def refresh_rollup(ctx: RefreshContext, table_name: str):
+    """Replace the rollup periods that contain changed GA4 dates (everything on --full or first build)."""
+    try:
+        table = ctx.client.get_table(f"{PROJECT_ID}.ineco_marts.{table_name}")
+    except NotFound:
+        table = None
+    # Rollups built with other measures (e.g. the summed distinct counts) are rebuilt
+    stale_columns = table is not None and {f.name for f in table.schema} != set(rollup_columns(table_name))
+    if ctx.full_rebuild or table is None or stale_columns:
+        logger.info(f"Rebuilding {table_name} (full)...")
+        ctx.query(table_name, rollup_sql(table_name, 'TRUE'))
+    elif not ctx.changed_dates:
+        logger.info(f"  ✓ {table_name}: no GA4 shards changed, nothing to refresh")
+        return
+    else:
+        rows_written = replace_rollup_periods(ctx, table_name, ctx.changed_dates)
+        logger.info(f"  {table_name}: {sum(rows_written.values()):,} rows in {len(rows_written)} "
+                    f"{ROLLUPS[table_name]['grain']} periods")
+    logger.info(f"  ✓ {table_name}: {ctx.row_count(table_name):,} rows")
+
+
+def detect_ad_spend_changes(ctx: RefreshContext, step_name: str):
+    """Find the dates the Google Ads transfer and the Meta Airbyte sync rewrote since the last run."""
+    logger.info("Checking ad spend source watermarks...")
+    previous = load_watermarks(AD_SPEND_WATERMARK_FILE, key='sources')
+    google_partitions = fetch_partition_metadata(ctx.client, PROJECT_ID, 'ineco_raw', GOOGLE_ADS_TABLE,
+                                                 ledger=ctx.ledger, step=step_name)
+    since_ms = (previous or {}).get('meta_ads', {}).get('extracted_ms', 0)
+    meta_dates, meta_ms = fetch_extracted_dates(ctx.client, PROJECT_ID, 'ineco_raw', META_ADS_TABLE, since_ms,
+                                                'date_start', META_EXTRACTED_AT_COLUMN,
+                                                ledger=ctx.ledger, step=step_name)
+    ctx.ad_spend_watermarks = {'google_ads': google_partitions, 'meta_ads': {'extracted_ms': meta_ms}}
+
+    if previous is None:
+        ctx.ad_spend_full = True
+        logger.info(f"  No watermarks at {AD_SPEND_WATERMARK_FILE}, rebuilding ad spend in full")
+        return
+    ctx.ad_spend_dates = {
+        'google_ads': changed_dates(google_partitions, previous.get('google_ads', {})),
+        'meta_ads': meta_dates,
+    }
+    logger.info(f"  ✓ Google Ads: {len(ctx.ad_spend_dates['google_ads'])} changed dates, "
+                f"Meta: {len(meta_dates)} changed dates")
+
+
+def commit_ad_spend_watermarks(ctx: RefreshContext, step_name: str):
+    """Save ad spend watermarks only after both ad spend tables succeeded."""
+    if ctx.dry_run:
+        return
+    save_watermarks(AD_SPEND_WATERMARK_FILE, ctx.ad_spend_watermarks, key='sources')
+    logger.info(f"  ✓ Saved ad spend watermarks ({len(ctx.ad_spend_watermarks['google_ads'])} Google Ads partitions)")
+
+
+def ad_spend_filters(date) -> dict:
+    """Template filters for one date of the ad spend tables."""
+    day = f"DATE '{date.isoformat()}'"
+    return {'google_filter': f"_DATA_DATE = {day}", 'meta_filter': f"DATE(date_start) = {day}",
+            'mart_filter': f"date = {day}"}
+
+
+def refresh_ad_spend(ctx: RefreshContext, table_name: str):
+    """Replace the ad spend partitions of dates whose source data changed."""
+    try:
+        table = ctx.client.get_table(f"{PROJECT_ID}.ineco_marts.{table_name}")
+    except NotFound:
+        table = None
+    select_template = AD_SPEND_SELECT_QUERIES[table_name]
+
+    if table is None or table.time_partitioning is None or ctx.full_rebuild or ctx.ad_spend_full:
+        logger.info(f"Rebuilding {table_name} (full, partitioned by date)...")
+        sql = ad_spend_rebuild_sql(table_name)
+        if table is not None and table.time_partitioning is None:
+            # CREATE OR REPLACE cannot change the partitioning of an existing table
+            sql = f"DROP TABLE `{PROJECT_ID}.ineco_marts.{table_name}`;\n{sql}"
+        ctx.query(table_name, sql)
+    else:
+        dates = sorted({d for source in AD_SPEND_SOURCES[table_name] for d in ctx.ad_spend_dates.get(source, [])})
+        if not dates:
+            logger.info(f"  ✓ {table_name}: no ad spend source dates changed, nothing to refresh")
+            return
+        logger.info(f"Refreshing {table_name} (partition replace, {len(dates)} changed dates)...")
+        replace_partitions(ctx, table_name, select_template, dates, filters=ad_spend_filters)
+    logger.info(f"  ✓ {table_name}: {ctx.row_count(table_name):,} rows")
+
+
+# ============================================================
+# REFRESH DAG
+# ============================================================
+# Marts read the materialized stg_events, or the int_user_day_events rollup
+# built from it through the stg_events_clean view, so they wait for those; the
+# ad spend tables read raw sources and only wait for their own watermark check. Rollups are
+# refreshed from their fact. GA4 watermarks are saved only after staging, both facts and the
+# rollups succeeded. Optional steps (ad spend, funnels) log a warning on
+# failure instead of failing the run. 'sources' names the watermarks whose dates a step refreshes
+# (recorded in its checkpoint entry).
+
+REFRESH_STEPS = {
+    'detect_changed_shards': {'run': detect_changed_shards, 'depends_on': []},
+    'stg_events': {'run': refresh_staging, 'depends_on': ['detect_changed_shards'], 'sources': 'ga4'},
+    'int_user_day_events': {'run': refresh_staging, 'depends_on': ['stg_events'], 'sources': 'ga4'},
+    'dim_channel': {'run': refresh_dimension, 'depends_on': ['stg_events'], 'sources': 'ga4'},
+    'dim_campaign': {'run': refresh_dimension, 'depends_on': ['stg_events'], 'sources': 'ga4'},
+    'dim_geo': {'run': refresh_dimension, 'depends_on': ['stg_events'], 'sources': 'ga4'},
+    'fact_sessions': {'run': refresh_fact, 'depends_on': ['stg_events', 'dim_channel', 'dim_campaign', 'dim_geo'],
+                      'sources': 'ga4'},
+    'fact_conversions': {'run': refresh_fact,
+                         'depends_on': ['int_user_day_events', 'dim_channel', 'dim_campaign', 'dim_geo'],
+                         'sources': 'ga4'},
+    **{name: {'run': refresh_rollup, 'depends_on': [rollup['fact']], 'sources': 'ga4'}
+       for name, rollup in ROLLUPS.items()},
+    'commit_shard_watermarks': {'run': commit_shard_watermarks,
+                                'depends_on': ['fact_sessions', 'fact_conversions', *ROLLUPS]},
+    'detect_ad_spend_changes': {'run': detect_ad_spend_changes, 'depends_on': [], 'optional': True},
+    'fact_ad_spend_google': {'run': refresh_ad_spend, 'depends_on': ['detect_ad_spend_changes'], 'optional': True,
+                             'sources': 'ad_spend'},
+    'fact_ad_spend': {'run': refresh_ad_spend, 'depends_on': ['fact_ad_spend_google'], 'optional': True,
+                      'sources': 'ad_spend'},
+    'commit_ad_spend_watermarks': {'run': commit_ad_spend_watermarks, 'depends_on': ['fact_ad_spend'],
+                                   'optional': True},
+    'funnel_loans': {'run': refresh_full_replace, 'depends_on': ['int_user_day_events'], 'optional': True},
+    'funnel_registration': {'run': refresh_full_replace, 'depends_on': ['int_user_day_events'], 'optional': True},
+    'funnel_summary': {'run': refresh_full_replace, 'depends_on': ['funnel_loans', 'funnel_registration'],
+                       'optional': True},
+}
+
+
+def publish_mart_versions(ctx: RefreshContext, tables: list):
+    """
+    Publish a new cache version for each mart table this run rewrote, so
+    Superset drops the cached chart results read from it (mart_versions.py).
+    Tables whose step found nothing to refresh keep their version.
+    """
+    for table_name in tables:
+        if table_name in ctx.written_tables and table_name not in STAGING_SELECT_QUERIES:
+            publish_version(table_name)
+
+
+def create_client():
+    """BigQuery client, or the local executor when QUERY_EXECUTOR=duckdb."""
+    creds_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS',
+                                '/home/harut/superset/credentials/bigquery-service-account.json')
+    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
+    return create_executor(PROJECT_ID, location=LOCATION)
+
+
+def log_plan(ctx: RefreshContext):
+    """Log dry-run byte estimates per step and for the whole run."""
+    steps = {}
+    for job in ctx.planned_jobs:
+        step = steps.setdefault(job['step'], {'jobs': 0, 'bytes': 0, 'over_limit': 0, 'unestimated': []})
+        step['jobs'] += 1
+        step['bytes'] += job['bytes']
+        step['over_limit'] += job['bytes'] > job['limit']
+        if job['unestimated']:
+            step['unestimated'].append(job['unestimated'])
+    total = sum(step['bytes'] for step in steps.values())
+
+    logger.info("\n--- Plan (dry run, nothing executed) ---")
+    for name, step in sorted(steps.items(), key=lambda item: -item[1]['bytes']):
+        flag = f"  ✗ {step['over_limit']} job(s) over step limit" if step['over_limit'] else ''
+        if step['unestimated']:
+            flag += f"  ? {len(step['unestimated'])} job(s) unestimated: {step['unestimated'][0]}"
+        logger.info(f"  {name:<24} {step['bytes'] / 1024**3:10.3f} GB  ({step['jobs']} job(s)){flag}")
+    unestimated = sum(len(step['unestimated']) for step in steps.values())
+    logger.info(f"  {'TOTAL':<24} {total / 1024**3:10.3f} GB  (~${estimate_cost_usd(total):.4f})"
+                f"{f' + {unestimated} unestimated job(s), each capped at its step limit' if unestimated else ''}")
+    logger.info(f"  Run budget: {ctx.run_budget_bytes / 1024**3:.0f} GB"
+                f"{'  ✗ OVER BUDGET' if total > ctx.run_budget_bytes else ''}")
+    return total <= ctx.run_budget_bytes and not any(step['over_limit'] for step in steps.values())
+
+
+# ============================================================
+# BACKFILL
+# ============================================================
+# GA4-derived partitioned tables in dependency order: (dataset, table,
+# per-date select template, full rebuild query used to create a missing table)
+BACKFILL_TABLES = [
+    ('ineco_staging', 'stg_events', STAGING_SELECT_QUERIES['stg_events'], STAGING_FULL_REBUILD_QUERY),
+    ('ineco_staging', 'int_user_day_events', STAGING_SELECT_QUERIES['int_user_day_events'],
+     STAGING_FULL_REBUILD_QUERY),
+    ('ineco_marts', 'fact_sessions', FACT_SELECT_QUERIES['fact_sessions'], FULL_REBUILD_QUERY),
+    ('ineco_marts', 'fact_conversions', FACT_SELECT_QUERIES['fact_conversions'], FULL_REBUILD_QUERY),
+]
+
+
+def ensure_backfill_tables(ctx: RefreshContext):
+    """Create missing backfill targets empty (WHERE FALSE scans nothing) so partitions can be written."""
+    dimensions_ready = False
+    for dataset, table_name, template, create_query in BACKFILL_TABLES:
+        if dataset == 'ineco_marts' and not dimensions_ready:
+            # Facts look up surrogate keys, so the key dimensions must exist first
+            for dim_name in KEY_DIMENSIONS:
+                ctx.query(f"{dim_name}:create", key_dimension_sql(dim_name, 'FALSE'))
+            dimensions_ready = True
+        try:
+            table = ctx.client.get_table(f"{PROJECT_ID}.{dataset}.{table_name}")
+        except NotFound:
+            table = None
+        if table is not None:
+            if table_name in FACT_SELECT_QUERIES and stale_fact_layout(table):
+                raise RuntimeError(f"ineco_marts.{table_name} still has the string dimension columns. "
+                                   f"Run refresh_marts.py once to rebuild it with surrogate keys")
+            continue
+        logger.info(f"  Creating empty {dataset}.{table_name}")
+        select = template.format(project=PROJECT_ID, shard_filter='FALSE', event_filter='FALSE')
+        ctx.query(f"{table_name}:create",
+                  create_query.format(project=PROJECT_ID, table=table_name, fact=table_name,
+                                      cluster=', '.join(FACT_CLUSTERING), select=select))
+    for table_name in ROLLUPS:
+        if not table_exists(ctx.client, table_name):
+            logger.info(f"  Creating empty ineco_marts.{table_name}")
+            ctx.query(f"{table_name}:create", rollup_sql(table_name, 'FALSE'))
+
+
+# Chunks add their natural keys to the key dimensions one at a time, so
+# concurrent MERGEs never hand out the same surrogate key twice
+KEY_DIMENSION_LOCK = threading.Lock()
+
+
+def backfill_chunk(ctx: RefreshContext, dates: list):
+    """Rebuild staging for one chunk of dates, add its new dimension keys, then rebuild the facts."""
+    keys_added = False
+    for dataset, table_name, template, _ in BACKFILL_TABLES:
+        if dataset == 'ineco_marts' and not keys_added:
+            with KEY_DIMENSION_LOCK:
+                for dim_name in KEY_DIMENSIONS:
+                    ctx.query(f"{dim_name}:backfill",
+                              key_dimension_sql(dim_name, f"event_date IN ({format_dates(dates)})"))
+            keys_added = True
+        replace_partitions(ctx, table_name, template, dates, dataset=dataset)
+
+
+def run_backfill(ctx: RefreshContext, start, end, chunk_days: int = BACKFILL_CHUNK_DAYS,
+                 max_concurrency: int = MAX_CONCURRENT_JOBS) -> bool:
+    """
+    Rebuild [start, end] in chunks of chunk_days, max_concurrency chunks at a time.
+
+    Finished chunks are recorded in STATE_DIR/backfill_<start>_<end>.json, so
+    re-running the same range after a failure only runs the missing chunks.
+    """
+    dates = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    chunks = {f"{c[0]:%Y%m%d}-{c[-1]:%Y%m%d}": c
+              for c in (dates[i:i + chunk_days] for i in range(0, len(dates), chunk_days))}
+    state_path = os.path.join(STATE_DIR, f"backfill_{start:%Y%m%d}_{end:%Y%m%d}.json")
+    completed = set() if ctx.dry_run else set(load_watermarks(state_path, key='completed_chunks') or [])
+    todo = {chunk_id: c for chunk_id, c in chunks.items() if chunk_id not in completed}
+    logger.info(f"Backfill {start} → {end}: {len(chunks)} chunks of {chunk_days} days, "
+                f"{len(chunks) - len(todo)} already done ({state_path})")
+
+    ensure_backfill_tables(ctx)
+    lock = threading.Lock()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {pool.submit(backfill_chunk, ctx, c): chunk_id for chunk_id, c in todo.items()}
+        for future in as_completed(futures):
+            chunk_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(chunk_id)
+                logger.error(f"  ✗ chunk {chunk_id}: {e}")
+                continue
+            logger.info(f"  ✓ chunk {chunk_id}")
+            if ctx.dry_run:
+                continue
+            with lock:
+                completed.add(chunk_id)
+                save_watermarks(state_path, sorted(completed), key='completed_chunks')
+
+    if failed:
+        logger.error(f"Backfill incomplete: {len(failed)} chunks failed ({', '.join(sorted(failed))}). "
+                     f"Re-run the same --backfill range to resume")
+        return False
+
+    # Weeks and months can span chunks, so rollups are rebuilt once all facts are in
+    for table_name in ROLLUPS:
+        rows_written = replace_rollup_periods(ctx, table_name, dates)
+        logger.info(f"  ✓ {table_name}: {len(rows_written)} {ROLLUPS[table_name]['grain']} periods")
+    return True
+
+
+def backfill_marts(start, end, chunk_days: int = BACKFILL_CHUNK_DAYS,
+                   max_concurrency: int = MAX_CONCURRENT_JOBS, plan: bool = False,
+                   max_gb_per_step: float = MAX_GB_PER_STEP, run_budget_gb: float = RUN_BUDGET_GB):
+    client = create_client()
+    ledger = RunLedger('refresh_marts_backfill')
+    ctx = RefreshContext(client, ledger, dry_run=plan, max_gb_per_step=max_gb_per_step,
+                         run_budget_gb=run_budget_gb, max_concurrent_jobs=max_concurrency)
+
+    logger.info("=" * 60)
+    logger.info(f"Starting Backfill - {datetime.now()} (run {ledger.run_id})")
+    logger.info(f"Budgets: {max_gb_per_step:.0f} GB per step, {run_budget_gb:.0f} GB per run"
+                f"{' (PLAN ONLY - dry run)' if plan else ''}")
+    logger.info("=" * 60)
+
+    success = run_backfill(ctx, start, end, chunk_days=chunk_days, max_concurrency=max_concurrency)
+    if plan:
+        return log_plan(ctx) and success
+    publish_mart_versions(ctx, sorted(ctx.written_tables))
+    ledger.log_summary()
+    ledger.flush(client)
+    return success
+
+
+def refresh_marts(full_rebuild: bool = False, max_concurrency: int = MAX_CONCURRENT_JOBS,
+                  write_mode: str = FACT_WRITE_MODE, plan: bool = False,
+                  max_gb_per_step: float = MAX_GB_PER_STEP, run_budget_gb: float = RUN_BUDGET_GB,
+                  resume: bool = False, warm_cache: bool = WARM_CACHE_AFTER_REFRESH):
+    checkpoint, completed = None, set()
+    if resume:
+        checkpoint = RunCheckpoint.latest(CHECKPOINT_DIR)
+        if checkpoint is None:
+            logger.warning(f"No checkpoint in {CHECKPOINT_DIR}, running a normal refresh")
+        else:
+            rerun = downstream(REFRESH_STEPS, set(REFRESH_STEPS) - checkpoint.succeeded())
+            if not rerun:
+                logger.info(f"Run {checkpoint.run_id} already completed every step, nothing to resume")
+                return True
+            completed = set(REFRESH_STEPS) - rerun
+            full_rebuild = checkpoint.options.get('full_rebuild', full_rebuild)
+            write_mode = checkpoint.options.get('write_mode', write_mode)
+
+    client = create_client()
+    ledger = RunLedger('refresh_marts', run_id=checkpoint.run_id if checkpoint else None)
+    ctx = RefreshContext(client, ledger, full_rebuild=full_rebuild, write_mode=write_mode, dry_run=plan,
+                         max_gb_per_step=max_gb_per_step, run_budget_gb=run_budget_gb,
+                         max_concurrent_jobs=max_concurrency)
+    if checkpoint is not None:
+        ctx.restore_state(checkpoint.context)
+        checkpoint.resumed += 1
+    else:
+        checkpoint = RunCheckpoint(CHECKPOINT_DIR, ledger.run_id,
+                                   {'full_rebuild': full_rebuild, 'write_mode': write_mode})
+
+    def on_step_done(name, result):
+        checkpoint.record(name, result, inputs=ctx.step_inputs(REFRESH_STEPS[name].get('sources')),
+                          context=ctx.checkpoint_state())
+        if result['status'] == 'success':
+            publish_mart_versions(ctx, [name])
+
+    logger.info("=" * 60)
+    logger.info(f"Starting Mart Refresh - {datetime.now()} (run {ledger.run_id})")
+    if completed:
+        logger.info(f"Resuming: {len(completed)} steps done in an earlier attempt, "
+                    f"re-running {', '.join(sorted(set(REFRESH_STEPS) - completed))}")
+    logger.info(f"Mode: {'FULL REBUILD' if full_rebuild else 'INCREMENTAL (changed GA4 shards)'}")
+    logger.info(f"Concurrency: up to {max_concurrency} jobs, fact write mode: {write_mode}")
+    logger.info(f"Budgets: {max_gb_per_step:.0f} GB per step, {run_budget_gb:.0f} GB per run"
+                f"{' (PLAN ONLY - dry run)' if plan else ''}")
+    logger.info("=" * 60)
+    
+    run_start = time.monotonic()
+    if not plan:
+        checkpoint.save()
+    step_results = run_steps(REFRESH_STEPS, ctx, max_concurrency=max_concurrency, completed=completed,
+                             on_step_done=None if plan else on_step_done)
+    log_run_report(REFRESH_STEPS, step_results, time.monotonic() - run_start)
+
+    if plan:
+        failed = [name for name, r in step_results.items() if r['status'] != 'success']
+        return log_plan(ctx) and not failed
+
+    success_count = sum(1 for r in step_results.values() if r['status'] == 'success')
+    error_count = sum(1 for name, r in step_results.items()
+                      if r['status'] != 'success' and not REFRESH_STEPS[name].get('optional'))
+
+    # Quality checks
+    qc_results = run_quality_checks(client, ledger=ledger)
     
     logger.info("\n" + "=" * 60)
     logger.info("REFRESH SUMMARY")
     logger.info("=" * 60)
-    logger.info(f"Tables refreshed: {success_count} succeeded, {error_count} failed")
-    logger.info(f"Data processed: {gb_processed:.2f} GB (~${estimated_cost:.4f})")
+    logger.info(f"Refresh steps: {success_count} succeeded, {error_count} failed")
+    ledger.log_summary()
     logger.info(f"Quality checks: {qc_results['passed']} passed, {qc_results['failed']} failed, {qc_results['warnings']} warnings")
     
     if qc_results['critical_failures']:
@@ -619,14 +1527,60 @@ def refresh_marts(full_rebuild: bool = False):
         logger.error("CRITICAL: Data quality checks failed!")
     else:
         logger.info("All quality checks passed!")
+
+    if warm_cache and error_count == 0:
+        # Charts read the facts, so a failed fact refresh leaves nothing new to cache
+        try:
+            warm_dashboards()
+        except Exception as e:
+            logger.warning(f"  ⚠ Cache warm-up skipped: {e}")
     
     logger.info("=" * 60)
+    ledger.flush(client)
     return error_count == 0 and qc_results['failed'] == 0
 
 
 if __name__ == '__main__':
-    import sys
-    full_rebuild = '--full' in sys.argv
-    print(f"Running {'FULL REBUILD' if full_rebuild else 'INCREMENTAL'} refresh...")
-    success = refresh_marts(full_rebuild=full_rebuild)
+    parser = argparse.ArgumentParser(description='Refresh Ineco star schema marts')
+    parser.add_argument('--full', action='store_true', help='Full rebuild of fact tables')
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENT_JOBS,
+                        help=f'Maximum BigQuery jobs in flight, partition jobs included (default: {MAX_CONCURRENT_JOBS})')
+    parser.add_argument('--write-mode', choices=['partition', 'dml'], default=FACT_WRITE_MODE,
+                        help=f'How incremental facts are written (default: {FACT_WRITE_MODE})')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry-run every query and print estimated bytes per step, without running anything')
+    parser.add_argument('--max-gb-per-step', type=float, default=MAX_GB_PER_STEP,
+                        help=f'maximum_bytes_billed per job, in GB (default: {MAX_GB_PER_STEP:.0f})')
+    parser.add_argument('--run-budget-gb', type=float, default=RUN_BUDGET_GB,
+                        help=f'Total bytes billed allowed per run, in GB (default: {RUN_BUDGET_GB:.0f})')
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'),
+                        type=lambda d: datetime.strptime(d, '%Y-%m-%d').date(),
+                        help='Rebuild staging and fact partitions for START..END (YYYY-MM-DD), resumable')
+    parser.add_argument('--chunk-days', type=int, default=BACKFILL_CHUNK_DAYS,
+                        help=f'Days per backfill chunk (default: {BACKFILL_CHUNK_DAYS})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Re-run only the failed or unstarted steps of the last run, and their downstream steps')
+    parser.add_argument('--no-warm-cache', action='store_true',
+                        help='Do not warm the Superset dashboard caches after the refresh')
+    parser.add_argument('--write-ddl', action='store_true',
+                        help='Regenerate the fact and ad spend DDL files in bigquery/marts/ and exit')
+    args = parser.parse_args()
+    if args.write_ddl:
+        write_ddl()
+        exit(0)
+    if args.backfill:
+        start, end = args.backfill
+        if end < start:
+            parser.error('--backfill END must not be before START')
+        print(f"Running backfill {start} → {end}{' (plan)' if args.plan else ''}...")
+        success = backfill_marts(start, end, chunk_days=args.chunk_days, max_concurrency=args.max_concurrency,
+                                 plan=args.plan, max_gb_per_step=args.max_gb_per_step,
+                                 run_budget_gb=args.run_budget_gb)
+        exit(0 if success else 1)
+    print(f"Running {'FULL REBUILD' if args.full else 'INCREMENTAL'} {'plan' if args.plan else 'refresh'}"
+          f"{' (resume)' if args.resume else ''}...")
+    success = refresh_marts(full_rebuild=args.full, max_concurrency=args.max_concurrency,
+                            write_mode=args.write_mode, plan=args.plan,
+                            max_gb_per_step=args.max_gb_per_step, run_budget_gb=args.run_budget_gb,
+                            resume=args.resume, warm_cache=WARM_CACHE_AFTER_REFRESH and not args.no_warm_cache)
     exit(0 if success else 1)
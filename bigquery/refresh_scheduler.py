@@ -0,0 +1,167 @@
+"""
+Dependency-aware scheduler for mart refresh steps
+Submits independent BigQuery jobs concurrently and reports the critical path
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+def validate_steps(steps: dict):
+    """Check that every dependency exists and the graph has no cycles."""
+    for name, step in steps.items():
+        for dep in step.get('depends_on', []):
+            if dep not in steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+
+    visiting, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dep in steps[name].get('depends_on', []):
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for name in steps:
+        visit(name, [])
+
+
+def downstream(steps: dict, names) -> set:
+    """names plus every step that depends on one of them, directly or not."""
+    selected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, step in steps.items():
+            if name not in selected and selected.intersection(step.get('depends_on', [])):
+                selected.add(name)
+                changed = True
+    return selected
+
+
+def run_steps(steps: dict, ctx, max_concurrency: int = 4, completed: set = None, on_step_done=None) -> dict:
+    """
+    Run refresh steps as a DAG.
+
+    steps: {name: {'run': fn(ctx, name), 'depends_on': [...], 'optional': bool}}
+    A step starts as soon as all of its dependencies succeeded. Steps downstream
+    of a failure are skipped. Steps in completed (done by an earlier attempt of
+    the run) count as succeeded without running. on_step_done(name, result) is
+    called on the scheduler thread as each step finishes or is skipped.
+    Returns {name: {'status', 'start', 'end', 'wall_sec', 'error'}} with times
+    relative to the start of the run.
+    """
+    validate_steps(steps)
+    results = {name: {'status': 'success', 'start': None, 'end': None, 'wall_sec': 0.0, 'error': None,
+                      'resumed': True}
+               for name in completed or ()}
+    pending = {name: step for name, step in steps.items() if name not in results}
+    running = {}
+    run_start = time.monotonic()
+
+    def execute(name):
+        start = time.monotonic() - run_start
+        try:
+            steps[name]['run'](ctx, name)
+            return name, 'success', start, None
+        except Exception as e:
+            return name, 'failed', start, e
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        while pending or running:
+            for name in list(pending):
+                deps = pending[name].get('depends_on', [])
+                if any(results.get(d, {}).get('status') in ('failed', 'skipped') for d in deps):
+                    blocked_by = [d for d in deps if results.get(d, {}).get('status') != 'success']
+                    logger.warning(f"  ⏭ {name}: skipped (upstream failed: {', '.join(blocked_by)})")
+                    results[name] = {'status': 'skipped', 'start': None, 'end': None,
+                                     'wall_sec': 0.0, 'error': None}
+                    del pending[name]
+                    if on_step_done is not None:
+                        on_step_done(name, results[name])
+                elif all(results.get(d, {}).get('status') == 'success' for d in deps):
+                    running[pool.submit(execute, name)] = name
+                    del pending[name]
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                del running[future]
+                name, status, start, error = future.result()
+                end = time.monotonic() - run_start
+                results[name] = {'status': status, 'start': start, 'end': end,
+                                 'wall_sec': end - start, 'error': error}
+                if on_step_done is not None:
+                    on_step_done(name, results[name])
+                if error is None:
+                    continue
+                if steps[name].get('optional'):
+                    logger.warning(f"  ⚠ {name}: {error}")
+                else:
+                    logger.error(f"  ✗ {name}: {error}")
+
+    return results
+
+
+def critical_path(steps: dict, results: dict) -> tuple:
+    """
+    Longest chain of dependent steps by measured wall time.
+
+    Returns (list of step names, total seconds).
+    """
+    finish = {}
+    previous = {}
+
+    def earliest_finish(name):
+        if name in finish:
+            return finish[name]
+        best_dep, best = None, 0.0
+        for dep in steps[name].get('depends_on', []):
+            dep_finish = earliest_finish(dep)
+            if dep_finish > best:
+                best_dep, best = dep, dep_finish
+        previous[name] = best_dep
+        finish[name] = best + results.get(name, {}).get('wall_sec', 0.0)
+        return finish[name]
+
+    if not steps:
+        return [], 0.0
+
+    last = max(steps, key=earliest_finish)
+    path = []
+    node = last
+    while node is not None:
+        path.append(node)
+        node = previous.get(node)
+    return list(reversed(path)), finish[last]
+
+
+def log_run_report(steps: dict, results: dict, total_wall_sec: float):
+    """Log per-step wall time and the critical path of a run."""
+    path, path_sec = critical_path(steps, results)
+    serial_sec = sum(r['wall_sec'] for r in results.values())
+
+    logger.info("\n--- Step Timings ---")
+    ordered = sorted(results.items(),
+                     key=lambda item: (item[1]['start'] is None, item[1]['start'] or 0))
+    for name, result in ordered:
+        marker = '*' if name in path else ' '
+        if result.get('resumed'):
+            logger.info(f" {marker} {name:<24} done in an earlier attempt")
+        elif result['status'] == 'skipped':
+            logger.info(f" {marker} {name:<24} skipped")
+        else:
+            logger.info(f" {marker} {name:<24} {result['status']:<8} "
+                        f"start +{result['start']:6.1f}s  wall {result['wall_sec']:6.1f}s")
+    logger.info(f"Critical path (*): {' → '.join(path)} ({path_sec:.1f}s)")
+    logger.info(f"Wall time: {total_wall_sec:.1f}s (sum of steps: {serial_sec:.1f}s)")
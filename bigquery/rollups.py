@@ -0,0 +1,267 @@
+"""
+Pre-aggregated Fact Rollups and the Superset Rollup Router
+fact_sessions and fact_conversions are stored at a 8-9 column grain, but most
+dashboard charts group by date and channel only. refresh_marts.py keeps the
+rollups below in step with the facts (same changed dates); they hold the
+summable counts summed and the HLL++ sketches merged (HLL_COUNT.MERGE_PARTIAL),
+so SUM(...) and HLL_COUNT.MERGE(...) metrics give the same results as on the
+fact table. Distinct user counts are left out: only their sketches are rolled
+up, and a metric on the count itself reads the fact.
+
+rollup_table() is registered as a Jinja macro in superset_config.py. The
+routed virtual datasets (superset_rollups.sql) select from it, and it returns
+the smallest rollup that has every column, metric, time grain and time range
+boundary the chart asks for, or the fact table otherwise.
+
+Usage:
+    python bigquery/rollups.py agg_sessions_daily_channel
+"""
+
+import argparse
+import re
+from datetime import date, datetime, timedelta
+
+from sketches import MARTS_DATASET, SKETCH_COLUMNS
+
+# Counts where each session or pageview falls in exactly one fact row, so
+# summing them over rows gives the total
+SUMMED_MEASURES = {
+    'fact_sessions': ['sessions', 'bounced_sessions', 'pageviews'],
+    'fact_conversions': [],
+}
+
+# COUNT(DISTINCT ...) columns: a user seen on two days or channels is in two
+# rows, so their sum overcounts. Rollups carry only their sketches
+# (SKETCH_COLUMNS); metrics that read the counts themselves stay on the fact.
+DISTINCT_COUNTS = {
+    'fact_sessions': list(SKETCH_COLUMNS['fact_sessions']),
+    'fact_conversions': list(SKETCH_COLUMNS['fact_conversions']) + ['total_sessions'],
+}
+
+# Per fact, in order of expected size (smallest first): the router picks the
+# first one that can answer a query. 'grain' is the period in the date column
+# (day, or the Sunday week start / month start Superset's P1W / P1M use).
+ROLLUPS = {
+    'agg_sessions_monthly_campaign': {'fact': 'fact_sessions', 'grain': 'month',
+                                      'dimensions': ['campaign', 'channel_group']},
+    'agg_sessions_daily_channel': {'fact': 'fact_sessions', 'grain': 'day',
+                                   'dimensions': ['source_clean', 'channel_group']},
+    'agg_sessions_weekly_channel_product': {'fact': 'fact_sessions', 'grain': 'week',
+                                            'dimensions': ['channel_group', 'product_category']},
+    'agg_conversions_monthly_campaign': {'fact': 'fact_conversions', 'grain': 'month',
+                                         'dimensions': ['campaign', 'channel_group']},
+    'agg_conversions_daily_channel': {'fact': 'fact_conversions', 'grain': 'day',
+                                      'dimensions': ['source_clean', 'channel_group']},
+    'agg_conversions_weekly_channel_product': {'fact': 'fact_conversions', 'grain': 'week',
+                                               'dimensions': ['channel_group', 'product_category']},
+}
+
+# Fact columns stored as surrogate keys: column -> (dimension table, key)
+DIMENSION_COLUMNS = {
+    'source_clean': ('dim_channel', 'channel_key'),
+    'channel_group': ('dim_channel', 'channel_key'),
+    'campaign': ('dim_campaign', 'campaign_key'),
+    'country': ('dim_geo', 'geo_key'),
+    'city': ('dim_geo', 'geo_key'),
+}
+
+PERIOD_EXPRESSIONS = {'day': 'f.date', 'week': 'DATE_TRUNC(f.date, WEEK)', 'month': 'DATE_TRUNC(f.date, MONTH)'}
+
+# Superset time grains each rollup grain can be re-aggregated to (None: the
+# query neither selects, groups nor filters by date)
+GRAIN_TIME_GRAINS = {
+    'day': {None, 'P1D', 'P1W', 'P1M', 'P3M', 'P1Y'},
+    'week': {None, 'P1W'},
+    'month': {None, 'P1M', 'P3M', 'P1Y'},
+}
+
+# Functions a metric expression may use and still be answered by a rollup
+# (SUM of sums and a merge of merged sketches are exact; COUNT, AVG, MIN or
+# MAX over the rollup rows are not)
+ROLLUP_SAFE_FUNCTIONS = {'SUM', 'HLL_COUNT.MERGE', 'SAFE_DIVIDE', 'COALESCE', 'IFNULL', 'NULLIF', 'ROUND'}
+
+# Saved metric names of the routed datasets (superset_metrics.sql) -> column
+SAVED_METRIC_COLUMNS = {f"unique_{column}": sketch
+                        for sketches in SKETCH_COLUMNS.values() for column, sketch in sketches.items()}
+
+
+def dimension_joins(columns: list, table_ref: str) -> tuple:
+    """
+    Select expressions for columns of a fact aliased f, reading the ones in
+    DIMENSION_COLUMNS from their dimension, and the LEFT JOINs on the keys
+    that need. table_ref formats a table name into a reference.
+    """
+    expressions, joins = [], {}
+    for column in columns:
+        if column not in DIMENSION_COLUMNS:
+            expressions.append(f"f.{column}")
+            continue
+        dimension, key = DIMENSION_COLUMNS[column]
+        expressions.append(f"{dimension}.{column}")
+        joins[dimension] = f"LEFT JOIN {table_ref.format(table=dimension)} {dimension} USING ({key})"
+    return expressions, list(joins.values())
+
+
+def rollup_select(table_name: str) -> str:
+    """
+    SELECT of one rollup from its fact, with the channel and campaign labels
+    read through the fact's keys. {fact_filter} restricts the fact rows read
+    (TRUE for a full rebuild, one period's dates otherwise).
+    """
+    rollup = ROLLUPS[table_name]
+    fact = rollup['fact']
+    dimensions, joins = dimension_joins(rollup['dimensions'], f"`{{{{project}}}}.{MARTS_DATASET}.{{table}}`")
+    columns = [f"{PERIOD_EXPRESSIONS[rollup['grain']]} as date"] + dimensions
+    columns += [f"SUM(f.{m}) as {m}" for m in SUMMED_MEASURES[fact]]
+    columns += [f"HLL_COUNT.MERGE_PARTIAL(f.{s}) as {s}" for s in SKETCH_COLUMNS[fact].values()]
+    group_by = ', '.join(str(i) for i in range(1, len(dimensions) + 2))
+    return (f"\n        SELECT\n          " + ',\n          '.join(columns) +
+            f"\n        FROM `{{project}}.{MARTS_DATASET}.{fact}` f" +
+            ''.join(f"\n        {join}" for join in joins) +
+            f"\n        WHERE {{fact_filter}}"
+            f"\n        GROUP BY {group_by}\n    ")
+
+
+def labeled_fact(fact: str) -> str:
+    """Subquery of a fact with its label columns joined back, for queries no rollup answers."""
+    labels, joins = dimension_joins(list(DIMENSION_COLUMNS), f"{MARTS_DATASET}.{{table}}")
+    return (f"(SELECT f.*, {', '.join(labels)} FROM {MARTS_DATASET}.{fact} f "
+            f"{' '.join(joins)})")
+
+
+def period_start(day: date, grain: str) -> date:
+    """First date of the rollup period containing day."""
+    if grain == 'week':
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    if grain == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def period_end(start: date, grain: str) -> date:
+    """Last date of the rollup period starting at start."""
+    if grain == 'week':
+        return start + timedelta(days=6)
+    if grain == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start
+
+
+# ---------- routing ----------
+
+def rollup_columns(table_name: str) -> list:
+    """Columns of a rollup table, in select order."""
+    fact = ROLLUPS[table_name]['fact']
+    return ['date', *ROLLUPS[table_name]['dimensions'], *SUMMED_MEASURES[fact], *SKETCH_COLUMNS[fact].values()]
+
+
+def _measures(fact: str) -> set:
+    return set(SUMMED_MEASURES[fact]) | set(SKETCH_COLUMNS[fact].values())
+
+
+def _column_name(column) -> str:
+    if isinstance(column, dict):
+        return column.get('sqlExpression') or column.get('column_name') or column.get('label') or ''
+    return column or ''
+
+
+def _metric_columns(metric, fact: str):
+    """Columns a metric reads, or None if summing it over rollup rows would change its value."""
+    if isinstance(metric, str):
+        if metric in SAVED_METRIC_COLUMNS:
+            return {SAVED_METRIC_COLUMNS[metric]}
+        return None
+    if metric.get('expressionType') == 'SIMPLE':
+        if (metric.get('aggregate') or '').upper() != 'SUM':
+            return None
+        return {(metric.get('column') or {}).get('column_name')}
+    expression = metric.get('sqlExpression') or ''
+    functions = {f.upper() for f in re.findall(r'([A-Za-z_][\w.]*)\s*\(', expression)}
+    if not functions or functions - ROLLUP_SAFE_FUNCTIONS:
+        return None
+    known = _measures(fact) | set(DISTINCT_COUNTS[fact])
+    return {word for word in re.findall(r'[A-Za-z_]\w*', expression) if word in known}
+
+
+def _parse_dttm(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _aligned(value, grain: str) -> bool:
+    """True if a time range bound falls on a rollup period boundary."""
+    value = _parse_dttm(value)
+    if value is None:
+        return True
+    if value.time() != datetime.min.time():
+        return False
+    return period_start(value.date(), grain) == value.date()
+
+
+def route_rollup(fact: str, columns=None, groupby=None, metrics=None, filter=None,
+                 from_dttm=None, to_dttm=None, time_grain=None) -> str:
+    """Name of the smallest rollup of fact that can answer the query, or fact itself."""
+    if not metrics:
+        # Raw rows (samples, drill to detail, column sync) need the fact grain
+        return fact
+
+    needed = {'date'}
+    by_date = False
+    for column in list(columns or []) + list(groupby or []):
+        if isinstance(column, dict) and column.get('columnType') == 'BASE_AXIS':
+            time_grain = column.get('timeGrain') or time_grain
+        needed.add(_column_name(column))
+        by_date = by_date or _column_name(column) == 'date'
+    for condition in filter or []:
+        needed.add(_column_name(condition.get('col')))
+        # The time range arrives as from_dttm/to_dttm; any other filter on date needs days
+        by_date = by_date or (_column_name(condition.get('col')) == 'date'
+                              and condition.get('op') != 'TEMPORAL_RANGE')
+    if by_date and time_grain is None:
+        # A date without a time grain is one row per day
+        time_grain = 'P1D'
+    for metric in metrics:
+        metric_columns = _metric_columns(metric, fact)
+        if metric_columns is None or metric_columns - _measures(fact):
+            return fact
+
+    for name, rollup in ROLLUPS.items():
+        if rollup['fact'] != fact or not needed <= {'date'} | set(rollup['dimensions']):
+            continue
+        if time_grain not in GRAIN_TIME_GRAINS[rollup['grain']]:
+            continue
+        if not (_aligned(from_dttm, rollup['grain']) and _aligned(to_dttm, rollup['grain'])):
+            continue
+        return name
+    return fact
+
+
+def rollup_table(fact: str, columns=None, groupby=None, metrics=None, filter=None,
+                 from_dttm=None, to_dttm=None, time_grain=None) -> str:
+    """
+    Jinja macro for the routed virtual datasets:
+        SELECT * FROM {{ rollup_table('fact_sessions', columns=columns, groupby=groupby,
+                                      metrics=metrics, filter=filter, from_dttm=from_dttm, to_dttm=to_dttm,
+                                      time_grain=time_grain) }}
+
+    Only simple filters are visible to the macro; a chart with a custom SQL
+    WHERE on a column outside the rollups should use the fact dataset.
+    """
+    table = route_rollup(fact, columns=columns or None, groupby=groupby or None, metrics=metrics or None,
+                         filter=filter or None, from_dttm=from_dttm or None, to_dttm=to_dttm or None,
+                         time_grain=time_grain or None)
+    if table == fact:
+        return labeled_fact(fact)
+    return f"{MARTS_DATASET}.{table}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the SELECT that builds a fact rollup')
+    parser.add_argument('table', choices=sorted(ROLLUPS))
+    parser.add_argument('--project', default='x-victor-477214-g0')
+    parser.add_argument('--where', default='TRUE', help='Fact row filter, e.g. "date >= \'2026-01-01\'"')
+    args = parser.parse_args()
+    print(rollup_select(args.table).format(project=args.project, fact_filter=args.where))
@@ -0,0 +1,79 @@
+"""
+Step Checkpoints for Resumable Refresh Runs
+Every refresh run writes STATE_DIR/checkpoints/<run_id>.json, rewritten
+atomically after each step: the run options, the status of every finished
+step with the source dates it used, and the watermarks the detect steps
+produced. refresh_marts.py --resume loads the newest checkpoint, restores the
+watermarks and re-runs only the steps that did not succeed plus everything
+downstream of them, under the same run id.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """Persisted step status of one refresh run; thread-safe."""
+
+    def __init__(self, directory: str, run_id: str, options: dict = None):
+        self.path = os.path.join(directory, f"{run_id}.json")
+        self.run_id = run_id
+        self.options = dict(options or {})
+        self.started_at = datetime.now().isoformat()
+        self.steps = {}
+        self.context = {}
+        self.resumed = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def latest(cls, directory: str):
+        """The most recently written checkpoint in directory, or None."""
+        paths = glob.glob(os.path.join(directory, '*.json'))
+        if not paths:
+            return None
+        with open(max(paths, key=os.path.getmtime)) as f:
+            data = json.load(f)
+        checkpoint = cls(directory, data['run_id'], data.get('options'))
+        checkpoint.started_at = data.get('started_at')
+        checkpoint.steps = data.get('steps', {})
+        checkpoint.context = data.get('context', {})
+        checkpoint.resumed = data.get('resumed', 0)
+        return checkpoint
+
+    def succeeded(self) -> set:
+        with self._lock:
+            return {name for name, step in self.steps.items() if step['status'] == 'success'}
+
+    def record(self, step: str, result: dict, inputs: dict = None, context: dict = None):
+        """Store a finished step (and the run context if it changed) and save."""
+        error = result.get('error')
+        with self._lock:
+            self.steps[step] = {
+                'status': result['status'],
+                'finished_at': datetime.now().isoformat(),
+                'wall_sec': round(result.get('wall_sec') or 0.0, 1),
+                'error': str(error) if error else None,
+                'inputs': inputs or {},
+            }
+            if context is not None:
+                self.context = context
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'run_id': self.run_id, 'started_at': self.started_at, 'options': self.options,
+                       'resumed': self.resumed, 'steps': self.steps, 'context': self.context},
+                      f, indent=2, sort_keys=True, default=str)
+        os.replace(tmp_path, self.path)
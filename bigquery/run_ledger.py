@@ -0,0 +1,181 @@
+"""
+Run Ledger for BigQuery Jobs
+Records every job a pipeline submits (step, job id, wall time, bytes processed
+and billed, slot-ms, cache hit, DML rows) and persists the run as:
+- JSONL, appended to LEDGER_DIR/run_ledger.jsonl
+- optionally a BigQuery table (LEDGER_TABLE, see bigquery/ops/run_ledger.sql)
+- optionally a Prometheus textfile (PROM_TEXTFILE_DIR, node_exporter collector)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+LEDGER_DIR = os.environ.get(
+    'LEDGER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'ledger'))
+LEDGER_TABLE = os.environ.get('LEDGER_TABLE', '')  # e.g. x-victor-477214-g0.ineco_ops.run_ledger
+PROM_TEXTFILE_DIR = os.environ.get('PROM_TEXTFILE_DIR', '')
+
+# On-demand analysis price (EU multi-region), USD per TiB billed
+BQ_PRICE_PER_TIB = float(os.environ.get('BQ_PRICE_PER_TIB', '6.25'))
+
+
+def estimate_cost_usd(bytes_billed: int) -> float:
+    return (bytes_billed or 0) / 2**40 * BQ_PRICE_PER_TIB
+
+
+class RunLedger:
+    """Collects job statistics for one pipeline run; thread-safe."""
+
+    def __init__(self, pipeline: str, run_id: str = None):
+        self.pipeline = pipeline
+        self.run_id = run_id or f"{pipeline}-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.started_at = datetime.now(timezone.utc)
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, step: str, job, wall_sec: float = None) -> dict:
+        """Record a finished query, load or copy job."""
+        started = getattr(job, 'started', None)
+        ended = getattr(job, 'ended', None)
+        if wall_sec is None and started and ended:
+            wall_sec = (ended - started).total_seconds()
+        record = {
+            'run_id': self.run_id,
+            'pipeline': self.pipeline,
+            'step': step,
+            'job_id': getattr(job, 'job_id', None),
+            'job_type': getattr(job, 'job_type', None),
+            'started_at': started.isoformat() if started else None,
+            'wall_sec': wall_sec,
+            'bytes_processed': getattr(job, 'total_bytes_processed', None) or 0,
+            'bytes_billed': getattr(job, 'total_bytes_billed', None) or 0,
+            'slot_ms': getattr(job, 'slot_millis', None) or 0,
+            'cache_hit': bool(getattr(job, 'cache_hit', False)),
+            'dml_affected_rows': getattr(job, 'num_dml_affected_rows', None),
+            'output_rows': getattr(job, 'output_rows', None),
+            'error': (getattr(job, 'error_result', None) or {}).get('message'),
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def timed(self, step: str, job):
+        """Wait for a job and record it (failed jobs too), timing client-side as a fallback."""
+        start = time.monotonic()
+        try:
+            job.result()
+        finally:
+            record = self.record(step, job)
+            if record['wall_sec'] is None:
+                record['wall_sec'] = time.monotonic() - start
+        return job
+
+    def totals(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        bytes_billed = sum(r['bytes_billed'] for r in records)
+        return {
+            'jobs': len(records),
+            'bytes_processed': sum(r['bytes_processed'] for r in records),
+            'bytes_billed': bytes_billed,
+            'slot_ms': sum(r['slot_ms'] for r in records),
+            'cache_hits': sum(1 for r in records if r['cache_hit']),
+            'cost_usd': estimate_cost_usd(bytes_billed),
+        }
+
+    def step_totals(self) -> dict:
+        steps = {}
+        with self._lock:
+            records = list(self.records)
+        for r in records:
+            totals = steps.setdefault(r['step'], {'jobs': 0, 'wall_sec': 0.0, 'bytes_processed': 0,
+                                                  'bytes_billed': 0, 'slot_ms': 0})
+            totals['jobs'] += 1
+            totals['wall_sec'] += r['wall_sec'] or 0.0
+            totals['bytes_processed'] += r['bytes_processed']
+            totals['bytes_billed'] += r['bytes_billed']
+            totals['slot_ms'] += r['slot_ms']
+        return steps
+
+    def log_summary(self):
+        totals = self.totals()
+        logger.info(f"BigQuery jobs: {totals['jobs']} ({totals['cache_hits']} cache hits), "
+                    f"{totals['bytes_processed'] / 1024**3:.2f} GB processed, "
+                    f"{totals['bytes_billed'] / 1024**3:.2f} GB billed (~${totals['cost_usd']:.4f}), "
+                    f"{totals['slot_ms'] / 1000:.0f} slot-seconds")
+
+    def flush(self, client: bigquery.Client = None):
+        """Persist the run to JSONL, and to BigQuery / Prometheus when configured."""
+        with self._lock:
+            records = list(self.records)
+
+        os.makedirs(LEDGER_DIR, exist_ok=True)
+        with open(os.path.join(LEDGER_DIR, 'run_ledger.jsonl'), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+        if LEDGER_TABLE and client is not None and records:
+            try:
+                errors = client.insert_rows_json(LEDGER_TABLE, records)
+                if errors:
+                    logger.warning(f"Ledger rows rejected by {LEDGER_TABLE}: {errors[:3]}")
+            except Exception as e:
+                logger.warning(f"Could not write ledger to {LEDGER_TABLE}: {e}")
+
+        if PROM_TEXTFILE_DIR:
+            try:
+                self.write_textfile(PROM_TEXTFILE_DIR)
+            except Exception as e:
+                logger.warning(f"Could not write Prometheus textfile: {e}")
+
+    def write_textfile(self, directory: str):
+        """Write last-run gauges in the node_exporter textfile format."""
+        totals = self.totals()
+        run_labels = f'pipeline="{self.pipeline}"'
+        lines = [
+            '# HELP ineco_pipeline_run_timestamp_seconds Start time of the last run.',
+            '# TYPE ineco_pipeline_run_timestamp_seconds gauge',
+            f'ineco_pipeline_run_timestamp_seconds{{{run_labels}}} {self.started_at.timestamp():.0f}',
+            '# HELP ineco_pipeline_run_duration_seconds Wall time of the last run.',
+            '# TYPE ineco_pipeline_run_duration_seconds gauge',
+            f'ineco_pipeline_run_duration_seconds{{{run_labels}}} '
+            f'{(datetime.now(timezone.utc) - self.started_at).total_seconds():.1f}',
+            '# HELP ineco_pipeline_run_jobs BigQuery jobs submitted by the last run.',
+            '# TYPE ineco_pipeline_run_jobs gauge',
+            f'ineco_pipeline_run_jobs{{{run_labels}}} {totals["jobs"]}',
+            '# HELP ineco_pipeline_run_bytes_billed Bytes billed by the last run.',
+            '# TYPE ineco_pipeline_run_bytes_billed gauge',
+            f'ineco_pipeline_run_bytes_billed{{{run_labels}}} {totals["bytes_billed"]}',
+            '# HELP ineco_pipeline_run_cost_usd Estimated on-demand cost of the last run.',
+            '# TYPE ineco_pipeline_run_cost_usd gauge',
+            f'ineco_pipeline_run_cost_usd{{{run_labels}}} {totals["cost_usd"]:.6f}',
+        ]
+        step_metrics = [
+            ('wall_seconds', 'wall_sec', 'Summed job wall time of a step in the last run.'),
+            ('bytes_processed', 'bytes_processed', 'Bytes processed by a step in the last run.'),
+            ('bytes_billed', 'bytes_billed', 'Bytes billed by a step in the last run.'),
+            ('slot_ms', 'slot_ms', 'Slot milliseconds used by a step in the last run.'),
+            ('jobs', 'jobs', 'BigQuery jobs submitted by a step in the last run.'),
+        ]
+        step_totals = self.step_totals()
+        for metric, key, help_text in step_metrics:
+            lines.append(f'# HELP ineco_pipeline_step_{metric} {help_text}')
+            lines.append(f'# TYPE ineco_pipeline_step_{metric} gauge')
+            for step, totals in sorted(step_totals.items()):
+                lines.append(f'ineco_pipeline_step_{metric}{{{run_labels},step="{step}"}} {totals[key]}')
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'ineco_{self.pipeline}.prom')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
@@ -0,0 +1,162 @@
+"""
+Source Watermarks for Change-Detected Refresh
+Tracks last-modified time and row count of GA4 events_YYYYMMDD shards and of
+date partitions (e.g. the Google Ads transfer), plus an extraction timestamp
+for Airbyte tables, so the refresh only recomputes the dates whose source data
+was added, rewritten or dropped
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+GA4_DATASET = 'analytics_280405726'
+
+# Same lower bound as the stg_events view (_TABLE_SUFFIX >= '20251201')
+GA4_START_SUFFIX = '20251201'
+
+SHARD_METADATA_QUERY = """
+    SELECT table_id, last_modified_time, row_count
+    FROM `{project}.{dataset}.__TABLES__`
+    WHERE STARTS_WITH(table_id, 'events_')
+"""
+
+PARTITION_METADATA_QUERY = """
+    SELECT partition_id, UNIX_MILLIS(last_modified_time) AS last_modified_ms, total_rows
+    FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+    WHERE table_name = '{table}'
+"""
+
+TABLE_METADATA_QUERY = """
+    SELECT table_id, last_modified_time, row_count, size_bytes
+    FROM `{project}.{dataset}.__TABLES__`
+    WHERE table_id IN ({tables})
+"""
+
+# Dates of rows (re)extracted after a watermark, and the newest extraction time
+EXTRACTED_DATES_QUERY = """
+    SELECT DATE({date_column}) AS date, UNIX_MILLIS(MAX({extracted_column})) AS extracted_ms
+    FROM `{project}.{dataset}.{table}`
+    WHERE {extracted_column} > TIMESTAMP_MILLIS({since_ms})
+      AND {date_column} IS NOT NULL
+    GROUP BY 1
+"""
+
+
+def shard_date(table_id: str):
+    """Date covered by a GA4 shard (events_YYYYMMDD or events_intraday_YYYYMMDD) or partition id (YYYYMMDD)."""
+    suffix = table_id.rsplit('_', 1)[-1]
+    try:
+        return datetime.strptime(suffix, '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def fetch_shard_metadata(client: bigquery.Client, project: str, dataset: str = GA4_DATASET,
+                         ledger=None) -> dict:
+    """Read shard metadata from __TABLES__ (metadata only, no bytes scanned)."""
+    sql = SHARD_METADATA_QUERY.format(project=project, dataset=dataset)
+    start = datetime.strptime(GA4_START_SUFFIX, '%Y%m%d').date()
+    job = client.query(sql)
+    if ledger is not None:
+        ledger.timed('detect_changed_shards', job)
+    shards = {}
+    for row in job.result():
+        date = shard_date(row.table_id)
+        if date is None or date < start:
+            continue
+        shards[row.table_id] = {
+            'last_modified_time': int(row.last_modified_time),
+            'row_count': int(row.row_count),
+        }
+    return shards
+
+
+def fetch_table_metadata(client: bigquery.Client, project: str, dataset: str, tables: list,
+                         ledger=None, step: str = 'fetch_table_metadata') -> dict:
+    """Read {table_id: {'last_modified_time', 'row_count', 'size_bytes'}} from __TABLES__; missing tables are absent."""
+    sql = TABLE_METADATA_QUERY.format(project=project, dataset=dataset,
+                                      tables=', '.join(f"'{t}'" for t in tables))
+    job = client.query(sql)
+    if ledger is not None:
+        ledger.timed(step, job)
+    return {row.table_id: {'last_modified_time': int(row.last_modified_time), 'row_count': int(row.row_count),
+                           'size_bytes': int(row.size_bytes)}
+            for row in job.result()}
+
+
+def fetch_partition_metadata(client: bigquery.Client, project: str, dataset: str, table: str,
+                             ledger=None, step: str = 'detect_partition_changes') -> dict:
+    """Read {partition_id: {'last_modified_ms', 'total_rows'}} of a date-partitioned table."""
+    sql = PARTITION_METADATA_QUERY.format(project=project, dataset=dataset, table=table)
+    job = client.query(sql)
+    if ledger is not None:
+        ledger.timed(step, job)
+    partitions = {}
+    for row in job.result():
+        if shard_date(row.partition_id) is None:
+            continue  # __NULL__ / __UNPARTITIONED__
+        partitions[row.partition_id] = {
+            'last_modified_ms': int(row.last_modified_ms),
+            'total_rows': int(row.total_rows or 0),
+        }
+    return partitions
+
+
+def fetch_extracted_dates(client: bigquery.Client, project: str, dataset: str, table: str, since_ms: int,
+                          date_column: str, extracted_column: str, ledger=None,
+                          step: str = 'detect_extracted_dates') -> tuple:
+    """
+    Dates with rows extracted after since_ms (epoch millis).
+
+    Returns (sorted dates, newest extraction time in millis or since_ms).
+    """
+    sql = EXTRACTED_DATES_QUERY.format(project=project, dataset=dataset, table=table, since_ms=int(since_ms),
+                                       date_column=date_column, extracted_column=extracted_column)
+    job = client.query(sql)
+    if ledger is not None:
+        ledger.timed(step, job)
+    dates, newest_ms = set(), since_ms
+    for row in job.result():
+        dates.add(row.date)
+        newest_ms = max(newest_ms, int(row.extracted_ms))
+    return sorted(dates), newest_ms
+
+
+def load_watermarks(path: str, key: str = 'shards'):
+    """Return the saved watermarks, or None if this is the first run."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(key, {})
+
+
+def save_watermarks(path: str, watermarks: dict, key: str = 'shards'):
+    """Atomically replace the watermark file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'saved_at': datetime.now().isoformat(), key: watermarks}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def changed_dates(current: dict, previous: dict) -> list:
+    """
+    Dates whose shards (or partitions) are new, rewritten (last-modified or
+    row count moved) or gone since the previous watermark. No age limit, so GA4 reprocessing
+    of old days is picked up too.
+    """
+    dates = set()
+    for table_id, meta in current.items():
+        if previous.get(table_id) != meta:
+            dates.add(shard_date(table_id))
+    for table_id in previous.keys() - current.keys():
+        # e.g. events_intraday_YYYYMMDD dropped once the daily shard lands
+        dates.add(shard_date(table_id))
+    dates.discard(None)
+    return sorted(dates)
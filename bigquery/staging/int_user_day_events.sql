@@ -0,0 +1,43 @@
+-- Intermediate Table: int_user_day_events
+-- One row per user, day, fact_conversions dimensions and event mapping flow, with a
+-- boolean flag per funnel event. fact_conversions, funnel_loans, funnel_registration
+-- and funnel_summary are rollups of this table (COUNT(DISTINCT IF(flag, user_pseudo_id, NULL))).
+-- refresh_marts.py replaces the partitions of changed dates; run this file only for a
+-- full rebuild. refresh_marts.py runs the SELECT of this file, with the
+-- TRUE  -- {event_filter} slot replaced by the dates being rebuilt.
+-- Updated: 2026-10-18
+
+CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_staging.int_user_day_events`
+PARTITION BY event_date
+CLUSTER BY user_pseudo_id
+AS
+SELECT
+  event_date,
+  user_pseudo_id,
+  source_clean,
+  channel_group,
+  COALESCE(campaign, '(not set)') as campaign,
+  device_category,
+  product_category,
+  country,
+  city,
+  flow_type,
+  ARRAY_AGG(DISTINCT session_id IGNORE NULLS) as session_ids,
+  LOGICAL_OR(event_name = 'page_view') as has_page_view,
+  -- Loans (Sprint) funnel
+  LOGICAL_OR(event_name_clean = 'sprint_apply_click') as has_sprint_apply_click,
+  LOGICAL_OR(event_name_clean = 'sprint_sub_id_captured') as has_sprint_sub_id_captured,
+  LOGICAL_OR(event_name_clean = 'sprint_open_personal_account') as has_sprint_open_personal_account,
+  LOGICAL_OR(event_name_clean = 'sprint_ssn_submitted') as has_sprint_ssn_submitted,
+  LOGICAL_OR(event_name_clean = 'sprint_check_limit_click') as has_sprint_check_limit_click,
+  LOGICAL_OR(event_name_clean = 'sprint_phone_submitted') as has_sprint_phone_submitted,
+  LOGICAL_OR(event_name_clean = 'sprint_check_limit_completed' AND NOT is_test_event) as has_sprint_completed,
+  -- Registration funnel
+  LOGICAL_OR(event_name_clean IN ('reg_apply_click', 'cards_apply_click')) as has_reg_apply_click,
+  LOGICAL_OR(event_name_clean = 'reg_sub_id_captured') as has_reg_sub_id_captured,
+  LOGICAL_OR(event_name_clean = 'reg_phone_submitted') as has_reg_phone_submitted,
+  LOGICAL_OR(event_name_clean = 'kyc_started') as has_kyc_started,
+  LOGICAL_OR(event_name_clean = 'reg_completed') as has_reg_completed
+FROM `x-victor-477214-g0.ineco_staging.stg_events_clean`
+WHERE TRUE  -- {event_filter}
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10;
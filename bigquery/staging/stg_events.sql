@@ -1,8 +1,22 @@
--- Staging View: stg_events
+-- Staging Table: stg_events
 -- Cleans and transforms GA4 events with channel grouping and product classification
--- Updated: 2026-02-14
-
-CREATE OR REPLACE VIEW `x-victor-477214-g0.ineco_staging.stg_events` AS
+-- Date-partitioned and clustered on user_pseudo_id. refresh_marts.py replaces one
+-- partition (stg_events$YYYYMMDD) per changed GA4 shard; run this file only for the
+-- one-time migration from the old view or a full rebuild.
+-- refresh_marts.py runs the SELECT of this file, with the TRUE  -- {shard_filter}
+-- slot replaced by the shards being rebuilt.
+-- Updated: 2026-10-18
+
+-- stg_events used to be a view, which cannot be replaced by a table in place.
+-- stg_events_clean stays a view over stg_events and picks up the table unchanged: it only
+-- maps event names, and event_date filters on it prune stg_events partitions (RUNBOOK,
+-- Staging Layout).
+DROP VIEW IF EXISTS `x-victor-477214-g0.ineco_staging.stg_events`;
+
+CREATE OR REPLACE TABLE `x-victor-477214-g0.ineco_staging.stg_events`
+PARTITION BY event_date
+CLUSTER BY user_pseudo_id
+AS
 WITH base AS (
   SELECT
     -- Date and time
@@ -52,6 +66,7 @@ WITH base AS (
 
   FROM `x-victor-477214-g0.analytics_280405726.events_*`
   WHERE _TABLE_SUFFIX >= '20251201'
+    AND TRUE  -- {shard_filter}
 )
 SELECT
   *,
@@ -0,0 +1,239 @@
+"""
+Two-Tier Superset Data Cache
+TieredRedisCache keeps a size-bounded in-process LRU (L1) in front of the
+versioned Redis data cache (L2, versioned_cache.py), so repeated requests for
+the same chart on a web worker skip the Redis round trip, the version check
+and the unpickling.
+
+- L1 entries are dropped when refresh_marts.py publishes a new version of a
+  table they read (MART_VERSIONS_CHANNEL) or when another process overwrites
+  or deletes the key (INVALIDATION_CHANNEL). While the subscription is down
+  L1 is bypassed, and entries never outlive l1_max_age seconds.
+- dataset_timeouts caps the TTL of results read from the given
+  ineco_marts tables, in both tiers.
+- L1 hits, L2 hits and misses are counted per process and added to the Redis
+  hash CACHE_STATS_KEY every STATS_FLUSH_SEC seconds.
+
+Configured as DATA_CACHE_CONFIG in superset_config.py (mounted into
+/app/pythonpath). Show the hit rates of all workers with:
+    docker exec superset_app python /app/pythonpath/tiered_cache.py
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from versioned_cache import VERSIONS_FIELD, VersionedRedisCache
+from mart_versions import MART_VERSIONS_CHANNEL, referenced_tables
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'ineco:cache_invalidate'
+CACHE_STATS_KEY = 'ineco:cache_stats'
+STATS_FLUSH_SEC = 60
+RECONNECT_SEC = 5
+
+
+class TieredRedisCache(VersionedRedisCache):
+    """CACHE_TYPE for DATA_CACHE_CONFIG: 'tiered_cache.TieredRedisCache'."""
+
+    def __init__(self, *args, l1_max_bytes: int = 64 * 1024**2, l1_max_age: int = 300,
+                 dataset_timeouts: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.l1_max_bytes = l1_max_bytes
+        self.l1_max_age = l1_max_age
+        self.dataset_timeouts = dataset_timeouts or {}
+        # key -> (expires_at, size, tables, value), least recently used first
+        self._l1 = OrderedDict()
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+        self._listening = False
+        self._listener_pid = None
+        self.counters = Counter()
+        self._unflushed = Counter()
+        self._flushed_at = time.monotonic()
+
+    # --- L1 ---------------------------------------------------------------
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None or not self._listening:
+                return None
+            if entry[0] < time.monotonic():
+                self._l1_drop(key)
+                return None
+            self._l1.move_to_end(key)
+            return entry[3]
+
+    def _l1_put(self, key, value, size: int, tables: list):
+        if size > self.l1_max_bytes // 4:
+            return
+        timeouts = [self.dataset_timeouts[t] for t in tables if t in self.dataset_timeouts]
+        expires_at = time.monotonic() + min([self.l1_max_age, *timeouts])
+        with self._lock:
+            if not self._listening:
+                return
+            self._l1_drop(key)
+            self._l1[key] = (expires_at, size, set(tables), value)
+            self._l1_bytes += size
+            while self._l1_bytes > self.l1_max_bytes:
+                self._l1_drop(next(iter(self._l1)))
+
+    def _l1_drop(self, key):
+        """Remove one entry; the caller holds the lock."""
+        entry = self._l1.pop(key, None)
+        if entry is not None:
+            self._l1_bytes -= entry[1]
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1.clear()
+            self._l1_bytes = 0
+
+    def _invalidate(self, channel: str, name: str):
+        with self._lock:
+            if channel == MART_VERSIONS_CHANNEL:
+                stale = [key for key, entry in self._l1.items() if name in entry[2]]
+            else:
+                stale = [name]
+            for key in stale:
+                self._l1_drop(key)
+
+    # --- invalidation listener ----------------------------------------------
+
+    def _ensure_listener(self):
+        """Start the pub/sub thread once per process (gunicorn forks after the config is loaded)."""
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._listening = False
+            self._l1.clear()
+            self._l1_bytes = 0
+        threading.Thread(target=self._listen, name='tiered-cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._read_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(MART_VERSIONS_CHANNEL, INVALIDATION_CHANNEL)
+                with self._lock:
+                    self._listening = True
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._invalidate(message['channel'].decode(), message['data'].decode())
+                    self._flush_counters()
+            except Exception as e:
+                logger.warning(f"Cache invalidation channel lost, bypassing L1: {e}")
+                with self._lock:
+                    self._listening = False
+                self._l1_clear()
+                if pubsub is not None:
+                    pubsub.close()
+                time.sleep(RECONNECT_SEC)
+
+    # --- hit counters ---------------------------------------------------------
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+            self._unflushed[name] += 1
+
+    def _flush_counters(self):
+        if time.monotonic() - self._flushed_at < STATS_FLUSH_SEC:
+            return
+        with self._lock:
+            counts, self._unflushed = self._unflushed, Counter()
+            self._flushed_at = time.monotonic()
+        if counts:
+            pipe = self._write_client.pipeline()
+            for name, count in counts.items():
+                pipe.hincrby(CACHE_STATS_KEY, name, count)
+            pipe.execute()
+
+    def stats(self) -> dict:
+        """Counters and hit rates of this process."""
+        return hit_rates(self.counters)
+
+    # --- cache interface --------------------------------------------------------
+
+    def get(self, key):
+        self._ensure_listener()
+        value = self._l1_get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return detach(value)
+        raw = self._read_client.get(self._get_prefix() + key)
+        entry = self.serializer.loads(raw) if raw is not None else None
+        value = self.unwrap(entry)
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('l2_hits')
+        tables = list(entry[VERSIONS_FIELD]) if value is not entry else []
+        self._l1_put(key, value, len(raw), tables)
+        return detach(value)
+
+    def set(self, key, value, timeout=None):
+        tables = referenced_tables(value.get('query')) if isinstance(value, dict) else []
+        timeouts = [self.dataset_timeouts[t] for t in tables if t in self.dataset_timeouts]
+        if timeouts:
+            timeout = min([timeout or self.default_timeout or min(timeouts), *timeouts])
+        result = super().set(key, value, timeout)
+        self._announce(key)
+        return result
+
+    def delete(self, key):
+        result = super().delete(key)
+        self._announce(key)
+        return result
+
+    def clear(self):
+        self._l1_clear()
+        return super().clear()
+
+    def _announce(self, key: str):
+        """Drop the key from the L1 of every process, this one included."""
+        with self._lock:
+            self._l1_drop(key)
+        try:
+            self._write_client.publish(INVALIDATION_CHANNEL, key)
+        except Exception as e:
+            logger.warning(f"Could not announce cache invalidation of {key}: {e}")
+
+
+def detach(value):
+    """Copy of a cached chart result that callers may modify without touching the L1 entry."""
+    if isinstance(value, dict) and hasattr(value.get('df'), 'copy'):
+        return {**value, 'df': value['df'].copy()}
+    return copy.copy(value)
+
+
+def hit_rates(counts: dict) -> dict:
+    l1, l2, misses = (int(counts.get(name, 0)) for name in ('l1_hits', 'l2_hits', 'misses'))
+    total = l1 + l2 + misses
+    return {'l1_hits': l1, 'l2_hits': l2, 'misses': misses, 'requests': total,
+            'l1_hit_rate': l1 / total if total else 0.0,
+            'l2_hit_rate': l2 / (l2 + misses) if l2 + misses else 0.0,
+            'hit_rate': (l1 + l2) / total if total else 0.0}
+
+
+if __name__ == '__main__':
+    import redis
+
+    client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=int(os.environ.get('REDIS_PORT', '6379')),
+                         db=int(os.environ.get('REDIS_RESULTS_DB', '1')))
+    stats = hit_rates({name.decode(): value for name, value in client.hgetall(CACHE_STATS_KEY).items()})
+    print(f"Chart data cache, all web workers ({stats['requests']:,} requests):")
+    print(f"  L1 (in-process): {stats['l1_hits']:>10,} hits  {stats['l1_hit_rate']:6.1%} of requests")
+    print(f"  L2 (Redis):      {stats['l2_hits']:>10,} hits  {stats['l2_hit_rate']:6.1%} of L1 misses")
+    print(f"  Misses:          {stats['misses']:>10,}")
+    print(f"  Overall hit rate: {stats['hit_rate']:.1%}")
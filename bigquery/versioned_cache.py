@@ -0,0 +1,43 @@
+"""
+Superset Data Cache Versioned by Mart Refreshes
+RedisCache that stores, next to each cached chart result, the refresh
+versions (mart_versions.py) of the ineco_marts tables its query read. A get
+returns a miss as soon as one of those tables has a newer version, so the
+cache timeout can be long (DATA_CACHE_CONFIG in superset_config.py) without
+serving data from before the last refresh.
+
+Results from tables that have no published version yet are cached for
+UNVERSIONED_TIMEOUT only, the previous fixed TTL.
+"""
+
+from flask_caching.backends.rediscache import RedisCache
+
+from mart_versions import current_versions, referenced_tables
+
+UNVERSIONED_TIMEOUT = 300
+VERSIONS_FIELD = '__mart_versions__'
+
+
+class VersionedRedisCache(RedisCache):
+    """CACHE_TYPE for DATA_CACHE_CONFIG: 'versioned_cache.VersionedRedisCache'."""
+
+    def set(self, key, value, timeout=None):
+        tables = referenced_tables(value.get('query')) if isinstance(value, dict) else []
+        if not tables:
+            return super().set(key, value, timeout)
+        versions = current_versions(self._read_client, tables)
+        if None in versions.values():
+            timeout = min(timeout or self.default_timeout or UNVERSIONED_TIMEOUT, UNVERSIONED_TIMEOUT)
+        return super().set(key, {VERSIONS_FIELD: versions, 'value': value}, timeout)
+
+    def unwrap(self, entry):
+        """Cached value of a stored entry, or None once a table it read has a newer version."""
+        if not (isinstance(entry, dict) and VERSIONS_FIELD in entry):
+            return entry
+        versions = entry[VERSIONS_FIELD]
+        if current_versions(self._read_client, list(versions)) != versions:
+            return None
+        return entry['value']
+
+    def get(self, key):
+        return self.unwrap(super().get(key))
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Workload Advisor for the ineco_marts Tables
+Ranks the query shapes users actually run against the marts and recommends
+partitioning, clustering and rollup changes, with the bytes each would save.
+
+Inputs:
+- BigQuery INFORMATION_SCHEMA.JOBS_BY_PROJECT: every SELECT that read an
+  ineco_marts table (bytes billed, slot-ms, cache hits, query text)
+- Superset metadata database: chart loads from `logs` (with each chart's
+  group-by and filter columns from `slices.params`) and SQL Lab runs from
+  `query`, used to name the charts behind each shape
+
+A shape is (table, filter columns, group-by columns), parsed from the query
+text. Estimates are heuristics from a small profile of the tables (capped by
+--max-profile-gb):
+    partition - bytes x (1 - date range read / date span of the table)
+    cluster   - bytes x (1 - 1 / distinct values) for jobs with an equality
+                filter on the proposed first clustering column
+    rollup    - bytes x (1 - rollup rows / fact rows), rows counted over
+                the last PROFILE_DAYS days
+
+Usage:
+    POSTGRES_HOST=<superset db host> python bigquery/workload_advisor.py --days 30
+    python bigquery/workload_advisor.py --days 7 --no-superset --json /tmp/advice.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from datetime import date, datetime
+
+from google.cloud import bigquery
+
+from rollups import ROLLUPS
+from run_ledger import RunLedger, estimate_cost_usd
+from source_watermarks import fetch_table_metadata
+
+PROJECT_ID = 'x-victor-477214-g0'
+LOCATION = 'EU'
+MARTS_DATASET = 'ineco_marts'
+
+# Profiling queries of partitioned tables read only this many recent days
+PROFILE_DAYS = 30
+MAX_CLUSTER_COLUMNS = 4
+
+# Marts SELECTs of the last {days} days; jobs writing into the pipeline
+# datasets (partition replacement jobs of refresh_marts.py) are excluded
+JOBS_QUERY = """
+    SELECT
+      job_id,
+      query,
+      cache_hit,
+      COALESCE(total_bytes_processed, 0) AS bytes_processed,
+      COALESCE(total_bytes_billed, 0) AS bytes_billed,
+      COALESCE(total_slot_ms, 0) AS slot_ms,
+      ARRAY(SELECT t.table_id FROM UNNEST(referenced_tables) t
+            WHERE t.dataset_id = '{dataset}') AS tables
+    FROM `{project}`.`region-{region}`.INFORMATION_SCHEMA.JOBS_BY_PROJECT
+    WHERE creation_time >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY)
+      AND job_type = 'QUERY'
+      AND statement_type = 'SELECT'
+      AND state = 'DONE'
+      AND error_result IS NULL
+      AND COALESCE(destination_table.dataset_id, '') NOT IN ('ineco_marts', 'ineco_staging')
+      AND EXISTS (SELECT 1 FROM UNNEST(referenced_tables) t WHERE t.dataset_id = '{dataset}')
+"""
+
+COLUMNS_QUERY = """
+    SELECT table_name, column_name, data_type, is_partitioning_column = 'YES' AS is_partitioning,
+           clustering_ordinal_position
+    FROM `{project}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+"""
+
+# Superset metadata database (psycopg2 parameters)
+CHART_LOADS_QUERY = """
+    SELECT s.id, s.slice_name, s.params, t.table_name, COUNT(l.id) AS loads
+    FROM slices s
+    JOIN tables t ON t.id = s.datasource_id AND s.datasource_type = 'table'
+    LEFT JOIN logs l ON l.slice_id = s.id
+     AND l.dttm >= NOW() - %(days)s * INTERVAL '1 day'
+     AND (l.action LIKE '%%.data' OR l.action = 'explore_json')
+    WHERE t.schema = %(dataset)s
+    GROUP BY s.id, s.slice_name, s.params, t.table_name
+"""
+
+SQLLAB_QUERY = """
+    SELECT executed_sql
+    FROM query
+    WHERE status = 'success'
+      AND start_time >= EXTRACT(EPOCH FROM NOW() - %(days)s * INTERVAL '1 day') * 1000
+      AND executed_sql LIKE %(pattern)s
+"""
+
+CLAUSE_KEYWORDS = re.compile(
+    r'\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|QUALIFY|ORDER\s+BY|LIMIT|UNION|WINDOW|JOIN|ON)\b', re.IGNORECASE)
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+DATE_LITERAL = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+
+def superset_dsn() -> str:
+    """Same database superset_config.py uses; SUPERSET_DB_URI overrides it."""
+    return os.environ.get('SUPERSET_DB_URI') or (
+        f"postgresql://{os.environ.get('POSTGRES_USER', 'superset')}:"
+        f"{os.environ.get('POSTGRES_PASSWORD', 'superset')}@"
+        f"{os.environ.get('POSTGRES_HOST', 'localhost')}:"
+        f"{os.environ.get('POSTGRES_PORT', '5432')}/"
+        f"{os.environ.get('POSTGRES_DB', 'superset')}"
+    )
+
+
+# ---------- query shapes ----------
+
+def parse_shape(sql: str, columns: set) -> dict:
+    """Filter (and equality filter) columns, group-by columns and the date literals of the WHERE clauses."""
+    literals = []
+
+    def keep(match):
+        literals.append(match.group())
+        return f"'#{len(literals) - 1}'"
+
+    text = re.sub(r'--[^\n]*', ' ', sql)
+    text = STRING_LITERAL.sub(keep, text)
+    parts = CLAUSE_KEYWORDS.split(text)
+    filters, equality, group_by, dates = set(), set(), set(), []
+    for keyword, segment in zip(parts[1::2], parts[2::2]):
+        keyword = ' '.join(keyword.upper().split())
+        names = {n for n in re.findall(r'`?([A-Za-z_]\w*)`?', segment) if n in columns}
+        if keyword == 'WHERE':
+            filters |= names
+            equality |= {n for n in names if re.search(rf'\b{n}`?\s*(=|IN\s*\()', segment, re.IGNORECASE)}
+            for index in re.findall(r"'#(\d+)'", segment):
+                dates += DATE_LITERAL.findall(literals[int(index)])
+        elif keyword == 'GROUP BY':
+            group_by |= names
+    return {'filters': filters, 'equality': equality, 'group_by': group_by, 'dates': sorted(dates)}
+
+
+def chart_shape(params: str) -> dict:
+    """Group-by and filter columns a chart asks for (dashboard native filters come on top at run time)."""
+    try:
+        form_data = json.loads(params or '{}')
+    except ValueError:
+        form_data = {}
+
+    def names(value):
+        values = value if isinstance(value, list) else [value]
+        for v in values:
+            if isinstance(v, dict):
+                v = v.get('sqlExpression') or v.get('column_name') or v.get('label')
+            if v:
+                yield v
+
+    group_by = set()
+    for key in ('groupby', 'columns', 'all_columns', 'series', 'entity', 'x_axis'):
+        group_by.update(names(form_data.get(key)))
+    filters = {f.get('subject') for f in form_data.get('adhoc_filters') or []
+               if f.get('expressionType') == 'SIMPLE' and f.get('subject')}
+    if form_data.get('time_range') not in (None, 'No filter'):
+        filters.add(form_data.get('granularity_sqla') or 'date')
+    return {'group_by': group_by, 'filters': filters}
+
+
+def fetch_columns(client: bigquery.Client, ledger: RunLedger) -> dict:
+    """{table: {column: {'type', 'partitioning', 'cluster_position'}}} of ineco_marts."""
+    job = ledger.timed('columns', client.query(COLUMNS_QUERY.format(project=PROJECT_ID, dataset=MARTS_DATASET)))
+    tables = defaultdict(dict)
+    for row in job.result():
+        tables[row.table_name][row.column_name] = {
+            'type': row.data_type, 'partitioning': row.is_partitioning,
+            'cluster_position': row.clustering_ordinal_position}
+    return dict(tables)
+
+
+def fetch_job_shapes(client: bigquery.Client, ledger: RunLedger, columns: dict, days: int) -> dict:
+    """Aggregate the marts SELECTs of the last days into {shape key: shape}."""
+    sql = JOBS_QUERY.format(project=PROJECT_ID, region=LOCATION.lower(), dataset=MARTS_DATASET, days=days)
+    shapes = {}
+    for row in ledger.timed('jobs', client.query(sql)).result():
+        # Joins are attributed to the first marts table the job read
+        table = row.tables[0] if row.tables else None
+        if table not in columns:
+            continue
+        parsed = parse_shape(row.query or '', set(columns[table]))
+        key = (table, tuple(sorted(parsed['filters'])), tuple(sorted(parsed['group_by'])))
+        shape = shapes.setdefault(key, {
+            'table': table, 'filters': set(parsed['filters']), 'group_by': set(parsed['group_by']),
+            'equality': set(), 'jobs': 0, 'cache_hits': 0, 'bytes_processed': 0, 'bytes_billed': 0,
+            'slot_ms': 0, 'date_ranges': [], 'charts': [], 'sqllab_runs': 0})
+        shape['jobs'] += 1
+        shape['cache_hits'] += bool(row.cache_hit)
+        shape['bytes_processed'] += row.bytes_processed
+        shape['bytes_billed'] += row.bytes_billed
+        shape['slot_ms'] += row.slot_ms
+        shape['equality'] |= parsed['equality']
+        if parsed['dates']:
+            shape['date_ranges'].append((parsed['dates'][0], parsed['dates'][-1], row.bytes_billed))
+    return shapes
+
+
+def attach_superset_usage(shapes: dict, columns: dict, days: int):
+    """Name the charts and count the SQL Lab runs behind each shape."""
+    import psycopg2
+
+    with psycopg2.connect(superset_dsn()) as con, con.cursor() as cursor:
+        cursor.execute(CHART_LOADS_QUERY, {'days': days, 'dataset': MARTS_DATASET})
+        charts = cursor.fetchall()
+        cursor.execute(SQLLAB_QUERY, {'days': days, 'pattern': f'%{MARTS_DATASET}.%'})
+        sqllab = [row[0] for row in cursor.fetchall()]
+
+    for _, name, params, table_name, loads in charts:
+        if not loads:
+            continue
+        # Routed datasets read the fact or one of its rollups
+        fact = table_name[:-len('_routed')] if table_name.endswith('_routed') else table_name
+        tables = {fact} | {rollup for rollup, r in ROLLUPS.items() if r['fact'] == fact}
+        chart = chart_shape(params)
+        for shape in shapes.values():
+            known = set(columns.get(shape['table'], {}))
+            if (shape['table'] in tables and shape['group_by'] == chart['group_by'] & known
+                    and chart['filters'] & known <= shape['filters']):
+                shape['charts'].append(f"{name} ({loads} loads)")
+
+    for sql in sqllab:
+        match = re.search(rf'{MARTS_DATASET}`?\.`?(\w+)', sql)
+        if not match or match.group(1) not in columns:
+            continue
+        table = match.group(1)
+        parsed = parse_shape(sql, set(columns[table]))
+        shape = shapes.get((table, tuple(sorted(parsed['filters'])), tuple(sorted(parsed['group_by']))))
+        if shape is not None:
+            shape['sqllab_runs'] += 1
+
+
+# ---------- recommendations ----------
+
+class Profiler:
+    """Small aggregate queries over the marts, each capped with maximum_bytes_billed."""
+
+    def __init__(self, client: bigquery.Client, ledger: RunLedger, columns: dict, max_gb: float):
+        self.client = client
+        self.ledger = ledger
+        self.columns = columns
+        self.job_config = bigquery.QueryJobConfig(maximum_bytes_billed=int(max_gb * 1024**3))
+
+    def _recent(self, table: str) -> str:
+        partition = [c for c, meta in self.columns[table].items() if meta['partitioning']]
+        if not partition:
+            return 'TRUE'
+        return f"{partition[0]} >= DATE_SUB(CURRENT_DATE(), INTERVAL {PROFILE_DAYS} DAY)"
+
+    def _one(self, step: str, sql: str):
+        return list(self.ledger.timed(step, self.client.query(sql, job_config=self.job_config)).result())[0]
+
+    def distinct_values(self, table: str, columns: list) -> dict:
+        select = ', '.join(f"APPROX_COUNT_DISTINCT({c}) AS {c}" for c in columns)
+        row = self._one(f"{table}:ndv", f"SELECT {select} FROM `{PROJECT_ID}.{MARTS_DATASET}.{table}` "
+                                       f"WHERE {self._recent(table)}")
+        return {c: max(1, row[c] or 1) for c in columns}
+
+    def date_span_days(self, table: str, column: str) -> int:
+        row = self._one(f"{table}:span", f"SELECT DATE_DIFF(DATE(MAX({column})), DATE(MIN({column})), DAY) + 1 "
+                                         f"AS days FROM `{PROJECT_ID}.{MARTS_DATASET}.{table}`")
+        return max(1, row.days or 1)
+
+    def group_ratio(self, table: str, dimensions: list) -> float:
+        key = ', '.join(['date'] + dimensions)
+        row = self._one(f"{table}:groups",
+                        f"SELECT APPROX_COUNT_DISTINCT(TO_JSON_STRING(STRUCT({key}))) AS groups, COUNT(*) AS row_count "
+                        f"FROM `{PROJECT_ID}.{MARTS_DATASET}.{table}` WHERE {self._recent(table)}")
+        return min(1.0, (row.groups or 0) / max(1, row.row_count or 1))
+
+
+def range_fraction(date_ranges: list, span_days: int) -> float:
+    """Bytes-weighted share of the table's date span the jobs asked for."""
+    today = date.today().isoformat()
+    weighted = total = 0
+    for low, high, bytes_billed in date_ranges:
+        high = high if high != low else today
+        days = (datetime.strptime(high, '%Y-%m-%d') - datetime.strptime(low, '%Y-%m-%d')).days + 1
+        weighted += min(1.0, max(days, 1) / span_days) * bytes_billed
+        total += bytes_billed
+    return weighted / total if total else 1.0
+
+
+def recommend(shapes: list, columns: dict, sizes: dict, profiler: Profiler) -> list:
+    """Partitioning, clustering and rollup recommendations per table, with estimated bytes saved."""
+    recommendations = []
+    by_table = defaultdict(list)
+    for shape in shapes:
+        by_table[shape['table']].append(shape)
+
+    for table, table_shapes in by_table.items():
+        meta = columns[table]
+        partition = [c for c, m in meta.items() if m['partitioning']]
+        clustering = [c for c, m in sorted(meta.items(), key=lambda i: i[1]['cluster_position'] or 0)
+                      if m['cluster_position']]
+
+        # Partitioning: date-filtered jobs on an unpartitioned table
+        if not partition:
+            date_columns = [c for c, m in meta.items() if m['type'] in ('DATE', 'TIMESTAMP', 'DATETIME')]
+            filtered = [s for s in table_shapes if set(date_columns) & s['filters'] and s['date_ranges']]
+            if filtered:
+                column = max(date_columns, key=lambda c: sum(s['bytes_billed'] for s in filtered if c in s['filters']))
+                span = profiler.date_span_days(table, column)
+                saved = sum(s['bytes_billed'] * (1 - range_fraction(s['date_ranges'], span)) for s in filtered)
+                recommendations.append({
+                    'table': table, 'kind': 'partition', 'change': f"PARTITION BY {column}",
+                    'jobs': sum(s['jobs'] for s in filtered),
+                    'bytes_billed': sum(s['bytes_billed'] for s in filtered), 'bytes_saved': int(saved)})
+
+        # Clustering: equality filter columns ranked by the bytes of the jobs using them
+        weights = defaultdict(int)
+        for shape in table_shapes:
+            for column in shape['equality'] - set(partition):
+                weights[column] += shape['bytes_billed']
+        proposed = [c for c, _ in sorted(weights.items(), key=lambda i: -i[1])][:MAX_CLUSTER_COLUMNS]
+        if proposed and proposed[0] != (clustering[:1] or [None])[0]:
+            first = proposed[0]
+            ndv = profiler.distinct_values(table, [first])[first]
+            using = [s for s in table_shapes if first in s['equality']]
+            recommendations.append({
+                'table': table, 'kind': 'cluster',
+                'change': f"CLUSTER BY {', '.join(proposed)} (now: {', '.join(clustering) or 'none'})",
+                'jobs': sum(s['jobs'] for s in using), 'bytes_billed': sum(s['bytes_billed'] for s in using),
+                'bytes_saved': int(sum(s['bytes_billed'] for s in using) * (1 - 1 / ndv))})
+
+        # Rollups: fact shapes an existing rollup could answer, or a new rollup at the shape's grain
+        if table not in {r['fact'] for r in ROLLUPS.values()}:
+            continue
+        proposals = defaultdict(list)
+        for shape in table_shapes:
+            dimensions = (shape['group_by'] | shape['filters']) - {'date'}
+            existing = [name for name, r in ROLLUPS.items()
+                        if r['fact'] == table and dimensions <= set(r['dimensions'])]
+            proposals[(existing[0] if existing else None, tuple(sorted(dimensions)))].append(shape)
+        for (rollup, dimensions), grouped in proposals.items():
+            billed = sum(s['bytes_billed'] for s in grouped)
+            if rollup:
+                ratio = sizes.get(rollup, {}).get('size_bytes', 0) / max(1, sizes.get(table, {}).get('size_bytes', 1))
+                change = f"point these charts at {table}_routed (answered by {rollup})"
+            elif len(dimensions) <= 3 and len(dimensions) < len(meta) // 2:
+                ratio = profiler.group_ratio(table, list(dimensions))
+                change = f"add a daily rollup of {table} by {', '.join(dimensions) or '(date only)'} to ROLLUPS"
+            else:
+                continue
+            if ratio >= 0.5:
+                continue
+            recommendations.append({
+                'table': table, 'kind': 'rollup', 'change': change,
+                'jobs': sum(s['jobs'] for s in grouped), 'bytes_billed': billed,
+                'bytes_saved': int(billed * (1 - ratio))})
+
+    return sorted(recommendations, key=lambda r: -r['bytes_saved'])
+
+
+def print_report(shapes: list, recommendations: list, days: int, top: int):
+    total = sum(s['bytes_billed'] for s in shapes)
+    print(f"\n📊 ineco_marts workload, last {days} days: {sum(s['jobs'] for s in shapes):,} jobs, "
+          f"{total / 1024**3:,.2f} GB billed (~${estimate_cost_usd(total):.2f})")
+    print(f"\nTop {min(top, len(shapes))} query shapes by bytes billed:")
+    for i, shape in enumerate(shapes[:top], 1):
+        print(f"  {i:>2}. {shape['table']}  {shape['bytes_billed'] / 1024**3:,.2f} GB, {shape['jobs']} jobs "
+              f"({shape['cache_hits']} cached), {shape['slot_ms'] / 1000:,.0f} slot-s")
+        print(f"      group by: {', '.join(sorted(shape['group_by'])) or '-'}   "
+              f"filters: {', '.join(sorted(shape['filters'])) or '-'}")
+        sources = shape['charts'][:5] + ([f"SQL Lab ({shape['sqllab_runs']} runs)"] if shape['sqllab_runs'] else [])
+        if sources:
+            print(f"      from: {'; '.join(sources)}")
+
+    print("\n💡 Recommendations (estimated savings over the same window):")
+    if not recommendations:
+        print("  ✅ Nothing to change: the marts already match the workload")
+    for r in recommendations:
+        print(f"  [{r['kind']}] {r['table']}: {r['change']}")
+        print(f"      {r['jobs']} jobs, {r['bytes_billed'] / 1024**3:,.2f} GB billed → saves ~"
+              f"{r['bytes_saved'] / 1024**3:,.2f} GB (~${estimate_cost_usd(r['bytes_saved']):.2f})")
+
+
+def run_advisor(days: int, top: int = 15, use_superset: bool = True, max_profile_gb: float = 5.0,
+                json_path: str = None) -> list:
+    client = bigquery.Client(project=PROJECT_ID, location=LOCATION)
+    ledger = RunLedger('workload_advisor')
+    columns = fetch_columns(client, ledger)
+    shapes = fetch_job_shapes(client, ledger, columns, days)
+    if use_superset:
+        attach_superset_usage(shapes, columns, days)
+    ranked = sorted(shapes.values(), key=lambda s: -s['bytes_billed'])
+    sizes = fetch_table_metadata(client, PROJECT_ID, MARTS_DATASET, sorted(columns), ledger=ledger,
+                                 step='table_sizes')
+    recommendations = recommend(ranked, columns, sizes, Profiler(client, ledger, columns, max_profile_gb))
+    print_report(ranked, recommendations, days, top)
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'days': days, 'shapes': ranked, 'recommendations': recommendations}, f, indent=2,
+                      default=lambda v: sorted(v) if isinstance(v, set) else str(v))
+        print(f"\n✅ Report written to {json_path}")
+    ledger.log_summary()
+    return recommendations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recommend partitioning, clustering and rollups from the marts workload')
+    parser.add_argument('--days', type=int, default=30, help='Workload window in days (default: 30)')
+    parser.add_argument('--top', type=int, default=15, help='Query shapes to list (default: 15)')
+    parser.add_argument('--no-superset', action='store_true',
+                        help='Only use BigQuery job statistics (no Superset metadata database)')
+    parser.add_argument('--max-profile-gb', type=float, default=5.0,
+                        help='maximum_bytes_billed per profiling query, in GB (default: 5)')
+    parser.add_argument('--json', help='Also write shapes and recommendations to this file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    run_advisor(args.days, top=args.top, use_superset=not args.no_superset, max_profile_gb=args.max_profile_gb,
+                json_path=args.json)
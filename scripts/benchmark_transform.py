@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark transform_data() of load_bank_data.py
+
+Runs the previous row-by-row transform (safe_int through .apply, .astype(str))
+and the current vectorized one on the same synthetic bank export and prints
+rows per second, the speed-up, memory of the output and how each one handles
+missing values: source gaps that are not NULL in the output (the text 'nan',
+'None' or a 0), IDs stored as '123.0', and the dtype of the count columns.
+The vectorized transform must keep every gap NULL, or the run fails.
+
+Usage:
+    python3 scripts/benchmark_transform.py
+    python3 scripts/benchmark_transform.py --rows 1000000 --repeat 5
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from load_bank_data import transform_data
+
+
+def safe_int(x):
+    """Convert to int, handling errors"""
+    try:
+        return int(x)
+    except:
+        return 0
+
+
+def transform_data_legacy(df: pd.DataFrame) -> pd.DataFrame:
+    """transform_data() before vectorization, kept as the baseline"""
+    return pd.DataFrame({
+        'event_time_raw': df.get('Event Time', '').astype(str),
+        'event_date': pd.to_datetime(df['Event _date']).dt.date,
+        'event_name': df.get('Event Name', '').astype(str),
+        'token_id': df.get('Event Param Value (String)', '').astype(str),
+        'acquired_source': df.get('Acquired Source', '').astype(str),
+        'acquired_medium': df.get('Acquired Medium', '').astype(str),
+        'acquired_campaign': df.get('Acquired Campaign', '').astype(str),
+        'client_code': df['Client_code'].astype(str),
+        'soc_card': df.get('Soc_card', '').astype(str),
+        'count_soc_card': df.get('count_soc_card', 0).apply(safe_int),
+        'had_product': df.get('HAD_PRODUCT', '').astype(str),
+        'is_first_interaction': df.get('1-st/2-nd', 0).apply(safe_int),
+        'loan_count': df['LOAN_COUNT'].fillna(0).apply(safe_int),
+        'loan_amount': pd.to_numeric(df.get('LOAN_AMOUNT', 0), errors='coerce').fillna(0),
+        'deposit_count': df.get('DEPOSIT_COUNT', 0).fillna(0).apply(safe_int),
+        'deposit_amount': pd.to_numeric(df.get('DEPOSIT_AMOUNT', 0), errors='coerce').fillna(0),
+        'card_count': df.get('CARD_COUNT', 0).fillna(0).apply(safe_int),
+        'uploaded_at': datetime.now()
+    })
+
+
+def synthetic_export(rows: int, seed: int = 7) -> pd.DataFrame:
+    """Bank export shaped like the real one, with gaps where the bank leaves cells empty"""
+    rng = np.random.default_rng(seed)
+
+    def with_gaps(values, share):
+        values = pd.Series(values)
+        return values.mask(rng.random(rows) < share)
+
+    dates = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    counts = lambda p: with_gaps(rng.binomial(1, p, rows).astype(float), 0.3)
+    amounts = lambda p: with_gaps(np.where(rng.random(rows) < p, rng.gamma(2, 500_000, rows).round(), 0), 0.3)
+    return pd.DataFrame({
+        'Event Time': dates.strftime('%Y-%m-%d') + ' ' + pd.Series(rng.integers(0, 86400, rows)).astype(str),
+        'Event _date': dates.strftime('%Y-%m-%d'),
+        'Event Name': rng.choice(['purchase', 'loan_approved', 'card_issued', 'deposit_opened'], rows),
+        'Event Param Value (String)': with_gaps([f"tok_{i:09d}" for i in rng.integers(0, 10**9, rows)], 0.02),
+        'Acquired Source': with_gaps(rng.choice(['google', 'facebook', 'sfmc', 'sms', 'landing', 'viber'], rows), 0.1),
+        'Acquired Medium': with_gaps(rng.choice(['cpc', 'email', 'sms', 'referral', 'organic'], rows), 0.1),
+        'Acquired Campaign': with_gaps(rng.choice([f"campaign_{i}" for i in range(40)], rows), 0.2),
+        'Client_code': with_gaps(rng.integers(10**6, 10**7, rows).astype(float), 0.01),
+        'Soc_card': with_gaps(rng.integers(10**9, 10**10, rows).astype(float), 0.5),
+        'count_soc_card': with_gaps(rng.integers(0, 3, rows).astype(float), 0.5),
+        'HAD_PRODUCT': with_gaps(rng.choice(['Y', 'N'], rows), 0.05),
+        '1-st/2-nd': with_gaps(rng.integers(1, 3, rows).astype(float), 0.1),
+        'LOAN_COUNT': counts(0.2),
+        'LOAN_AMOUNT': amounts(0.2),
+        'DEPOSIT_COUNT': counts(0.1),
+        'DEPOSIT_AMOUNT': amounts(0.1),
+        'CARD_COUNT': counts(0.3),
+    })
+
+
+# Output column -> export column whose gaps must stay NULL
+NULLABLE_COLUMNS = {
+    'token_id': 'Event Param Value (String)', 'acquired_source': 'Acquired Source',
+    'acquired_campaign': 'Acquired Campaign', 'client_code': 'Client_code', 'soc_card': 'Soc_card',
+    'count_soc_card': 'count_soc_card', 'had_product': 'HAD_PRODUCT', 'is_first_interaction': '1-st/2-nd',
+}
+COUNT_COLUMNS = ['count_soc_card', 'is_first_interaction', 'loan_count', 'deposit_count', 'card_count']
+
+
+def null_handling(source: pd.DataFrame, output: pd.DataFrame) -> dict:
+    """Source gaps not NULL in the output, IDs with a '.0' suffix, dtypes of the count columns"""
+    lost = sum(int((source[src].isna() & output[col].notna()).sum()) for col, src in NULLABLE_COLUMNS.items())
+    float_ids = int(output['client_code'].astype('string').str.endswith('.0').sum())
+    return {'lost_nulls': lost, 'float_ids': float_ids,
+            'count_dtypes': sorted({str(output[c].dtype) for c in COUNT_COLUMNS})}
+
+
+def check_null_handling(result: dict):
+    assert result['lost_nulls'] == 0, f"{result['lost_nulls']:,} source gaps are not NULL in the output"
+    assert result['float_ids'] == 0, f"{result['float_ids']:,} client codes stored as '123.0'"
+    assert result['count_dtypes'] == ['Int64'], f"count columns are {result['count_dtypes']}, not Int64"
+
+
+def best_of(fn, df: pd.DataFrame, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bank data transform')
+    parser.add_argument('--rows', type=int, default=200_000, help='Synthetic rows (default: 200,000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per transform, best is reported (default: 3)')
+    args = parser.parse_args()
+
+    print(f"📊 Building a synthetic export of {args.rows:,} rows...")
+    df = synthetic_export(args.rows)
+
+    results = {}
+    for name, fn in (('legacy (apply/astype)', transform_data_legacy), ('vectorized', transform_data)):
+        seconds, output = best_of(fn, df, args.repeat)
+        results[name] = seconds
+        nulls = null_handling(df, output)
+        print(f"   {name:<22} {seconds:8.3f}s  {args.rows / seconds:>12,.0f} rows/s  "
+              f"{output.memory_usage(deep=True).sum() / 1024**2:8.1f} MB  "
+              f"{nulls['lost_nulls']:>9,} gaps not NULL  {nulls['float_ids']:>9,} '.0' IDs  "
+              f"counts {'/'.join(nulls['count_dtypes'])}")
+
+    check_null_handling(null_handling(df, transform_data(df)))
+    legacy, vectorized = results.values()
+    print(f"✅ Speed-up: {legacy / vectorized:.1f}x, missing values stay NULL")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,26 +14,29 @@ import sys
 from datetime import datetime, timedelta
 from google.cloud import bigquery
 
+# Shared check registry lives next to refresh_marts.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bigquery'))
+from executors import create_executor
+from quality_checks import run_checks
+from run_ledger import RunLedger
+
 # Configuration
 PROJECT_ID = 'x-victor-477214-g0'
 CREDENTIALS_PATH = '/Users/harut/Desktop/Ineco/credentials/bigquery-service-account.json'
 
-# Test thresholds
-MAX_NULL_PERCENT = 5  # Max % of nulls allowed in key columns
-MAX_STALENESS_DAYS = 7  # Alert if data is older than this
-MIN_ROW_COUNT = 100  # Minimum expected rows per table
-
 
 class DataQualityTester:
     def __init__(self):
         os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = CREDENTIALS_PATH
-        self.client = bigquery.Client(project=PROJECT_ID)
+        self.client = create_executor(PROJECT_ID)
+        self.ledger = RunLedger('data_quality_tests')
         self.results = []
         self.failures = []
+        self._table_check_results = None
     
-    def run_query(self, sql):
+    def run_query(self, sql, step='query'):
         """Execute query and return first row"""
-        return list(self.client.query(sql).result())[0]
+        return list(self.ledger.timed(step, self.client.query(sql)).result())[0]
     
     def log_result(self, test_name, passed, details=""):
         """Log test result"""
@@ -49,33 +52,21 @@ class DataQualityTester:
         if details:
             print(f"         {details}")
     
+    def log_table_checks(self, check_type):
+        """Log registry checks of one type, compiled to one scan per table on first use"""
+        if self._table_check_results is None:
+            self._table_check_results = run_checks(self.client, PROJECT_ID, 'dq', ledger=self.ledger)
+        for result in self._table_check_results:
+            if result['check']['type'] == check_type:
+                self.log_result(result['check']['name'], result['passed'], result['details'])
+    
     # ==================== ROW COUNT TESTS ====================
     
     def test_row_counts(self):
         """Check that tables have minimum expected rows"""
         print("\n📊 ROW COUNT TESTS")
         print("-" * 50)
-        
-        tables = [
-            ('fact_sessions', 1000),
-            ('fact_conversions', 1000),
-            ('fact_bank_conversions', 100),
-            ('dim_channel', 5),
-            ('dim_product', 3),
-        ]
-        
-        for table, min_rows in tables:
-            sql = f"SELECT COUNT(*) as cnt FROM `{PROJECT_ID}.ineco_marts.{table}`"
-            try:
-                result = self.run_query(sql)
-                passed = result.cnt >= min_rows
-                self.log_result(
-                    f"{table} row count",
-                    passed,
-                    f"Found {result.cnt:,} rows (min: {min_rows})"
-                )
-            except Exception as e:
-                self.log_result(f"{table} row count", False, str(e))
+        self.log_table_checks('row_count')
     
     # ==================== NULL VALUE TESTS ====================
     
@@ -83,35 +74,7 @@ class DataQualityTester:
         """Check for unexpected nulls in key columns"""
         print("\n🔍 NULL VALUE TESTS")
         print("-" * 50)
-        
-        checks = [
-            ('fact_sessions', 'date'),
-            ('fact_sessions', 'channel_group'),
-            ('fact_conversions', 'date'),
-            ('fact_conversions', 'product_category'),
-            ('fact_bank_conversions', 'date'),
-            ('fact_bank_conversions', 'channel_group'),
-            ('fact_bank_conversions', 'loan_count'),
-        ]
-        
-        for table, column in checks:
-            sql = f"""
-            SELECT 
-                COUNT(*) as total,
-                COUNTIF({column} IS NULL) as null_count,
-                SAFE_DIVIDE(COUNTIF({column} IS NULL), COUNT(*)) * 100 as null_pct
-            FROM `{PROJECT_ID}.ineco_marts.{table}`
-            """
-            try:
-                result = self.run_query(sql)
-                passed = result.null_pct <= MAX_NULL_PERCENT
-                self.log_result(
-                    f"{table}.{column} nulls",
-                    passed,
-                    f"{result.null_pct:.1f}% null (max: {MAX_NULL_PERCENT}%)"
-                )
-            except Exception as e:
-                self.log_result(f"{table}.{column} nulls", False, str(e))
+        self.log_table_checks('null_rate')
     
     # ==================== DATA FRESHNESS TESTS ====================
     
@@ -119,26 +82,7 @@ class DataQualityTester:
         """Check that data is recent"""
         print("\n📅 DATA FRESHNESS TESTS")
         print("-" * 50)
-        
-        tables = ['fact_sessions', 'fact_conversions']
-        
-        for table in tables:
-            sql = f"""
-            SELECT 
-                MAX(date) as max_date,
-                DATE_DIFF(CURRENT_DATE(), MAX(date), DAY) as days_old
-            FROM `{PROJECT_ID}.ineco_marts.{table}`
-            """
-            try:
-                result = self.run_query(sql)
-                passed = result.days_old <= MAX_STALENESS_DAYS
-                self.log_result(
-                    f"{table} freshness",
-                    passed,
-                    f"Latest: {result.max_date} ({result.days_old} days old, max: {MAX_STALENESS_DAYS})"
-                )
-            except Exception as e:
-                self.log_result(f"{table} freshness", False, str(e))
+        self.log_table_checks('freshness')
     
     # ==================== VALUE RANGE TESTS ====================
     
@@ -146,40 +90,7 @@ class DataQualityTester:
         """Check that metrics are within expected ranges"""
         print("\n📈 VALUE RANGE TESTS")
         print("-" * 50)
-        
-        # Check for negative values (shouldn't exist)
-        checks = [
-            ('fact_sessions', 'sessions', 0, None),
-            ('fact_sessions', 'users', 0, None),
-            ('fact_bank_conversions', 'loan_count', 0, None),
-            ('fact_bank_conversions', 'loan_amount', 0, None),
-            ('fact_bank_conversions', 'card_count', 0, None),
-        ]
-        
-        for table, column, min_val, max_val in checks:
-            conditions = []
-            if min_val is not None:
-                conditions.append(f"{column} < {min_val}")
-            if max_val is not None:
-                conditions.append(f"{column} > {max_val}")
-            
-            where_clause = " OR ".join(conditions) if conditions else "FALSE"
-            
-            sql = f"""
-            SELECT COUNT(*) as violations
-            FROM `{PROJECT_ID}.ineco_marts.{table}`
-            WHERE {where_clause}
-            """
-            try:
-                result = self.run_query(sql)
-                passed = result.violations == 0
-                self.log_result(
-                    f"{table}.{column} range",
-                    passed,
-                    f"{result.violations} out-of-range values"
-                )
-            except Exception as e:
-                self.log_result(f"{table}.{column} range", False, str(e))
+        self.log_table_checks('range')
     
     # ==================== CONSISTENCY TESTS ====================
     
@@ -191,11 +102,13 @@ class DataQualityTester:
         # Check channel_group values are consistent
         sql = """
         SELECT 
-            (SELECT COUNT(DISTINCT channel_group) FROM `x-victor-477214-g0.ineco_marts.fact_sessions`) as sessions_channels,
-            (SELECT COUNT(DISTINCT channel_group) FROM `x-victor-477214-g0.ineco_marts.fact_conversions`) as conversions_channels
+            (SELECT COUNT(DISTINCT d.channel_group) FROM `x-victor-477214-g0.ineco_marts.fact_sessions`
+             JOIN `x-victor-477214-g0.ineco_marts.dim_channel` d USING (channel_key)) as sessions_channels,
+            (SELECT COUNT(DISTINCT d.channel_group) FROM `x-victor-477214-g0.ineco_marts.fact_conversions`
+             JOIN `x-victor-477214-g0.ineco_marts.dim_channel` d USING (channel_key)) as conversions_channels
         """
         try:
-            result = self.run_query(sql)
+            result = self.run_query(sql, 'consistency:channel_groups')
             passed = result.sessions_channels == result.conversions_channels
             self.log_result(
                 "Channel groups match (sessions vs conversions)",
@@ -214,7 +127,7 @@ class DataQualityTester:
         FROM `x-victor-477214-g0.ineco_marts.fact_bank_conversions`
         """
         try:
-            result = self.run_query(sql)
+            result = self.run_query(sql, 'consistency:bank_totals')
             passed = result.loans > 0 and result.cards >= 0 and result.deposits >= 0
             self.log_result(
                 "Bank conversion totals",
@@ -242,7 +155,7 @@ class DataQualityTester:
         )
         """
         try:
-            result = self.run_query(sql)
+            result = self.run_query(sql, 'duplicates:bank_conversions')
             # Some duplicates are expected (same client, multiple products on same day)
             passed = True  # Info only, not a failure
             self.log_result(
@@ -285,6 +198,11 @@ class DataQualityTester:
             for f in self.failures:
                 print(f"  - {f}")
         
+        totals = self.ledger.totals()
+        print(f"BigQuery: {totals['jobs']} jobs, {totals['bytes_billed'] / 1024**3:.2f} GB billed "
+              f"(~${totals['cost_usd']:.4f})")
+        self.ledger.flush(self.client)
+        
         print("\n" + "=" * 60)
         
         # Return exit code (0 = all passed, 1 = some failed)
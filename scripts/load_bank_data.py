@@ -7,17 +7,31 @@ Handles:
 - Incremental loading (MERGE)
 - Data validation
 - Automatic mart refresh
+- Bounded memory: the file is read and transformed in chunks of --chunk-rows
+  rows, written to one local Parquet file and uploaded in a single load job
 
 Usage:
     python3 load_bank_data.py /path/to/bank_conversions.csv
+    python3 load_bank_data.py /path/to/bank_conversions.csv --chunk-rows 50000
 """
 
+import argparse
+import codecs
 import os
 import sys
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 from google.cloud import bigquery
 
+# Run ledger is shared with refresh_marts.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bigquery'))
+from executors import create_executor
+from run_ledger import RunLedger
+
 # Configuration
 PROJECT_ID = 'x-victor-477214-g0'
 CREDENTIALS_PATH = '/Users/harut/Desktop/Ineco/credentials/bigquery-service-account.json'
@@ -27,101 +41,212 @@ RAW_TABLE = f'{PROJECT_ID}.ineco_raw.bank_conversions'
 STAGING_TABLE = f'{PROJECT_ID}.ineco_staging.stg_bank_conversions'
 MART_TABLE = f'{PROJECT_ID}.ineco_marts.fact_bank_conversions'
 
+# Rows read, transformed and written to Parquet at a time
+CHUNK_ROWS = 100_000
+# Bytes read to detect the file encoding
+SNIFF_BYTES = 1024 * 1024
+ENCODINGS = ['utf-8', 'cp1251', 'latin1']
+# xlsx (zip) and xls (OLE2) signatures
+EXCEL_MAGIC = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
 
-def safe_int(x):
-    """Convert to int, handling errors"""
-    try:
-        return int(x)
-    except:
-        return 0
+REQUIRED_COLUMNS = ['Event _date', 'Client_code', 'LOAN_COUNT', 'CARD_COUNT']
 
+# Schema of the Parquet upload, as load_table_from_dataframe infers it from
+# the transform_data() output (naive uploaded_at -> DATETIME)
+LOAD_SCHEMA = [
+    bigquery.SchemaField('event_time_raw', 'STRING'),
+    bigquery.SchemaField('event_date', 'DATE'),
+    bigquery.SchemaField('event_name', 'STRING'),
+    bigquery.SchemaField('token_id', 'STRING'),
+    bigquery.SchemaField('acquired_source', 'STRING'),
+    bigquery.SchemaField('acquired_medium', 'STRING'),
+    bigquery.SchemaField('acquired_campaign', 'STRING'),
+    bigquery.SchemaField('client_code', 'STRING'),
+    bigquery.SchemaField('soc_card', 'STRING'),
+    bigquery.SchemaField('count_soc_card', 'INT64'),
+    bigquery.SchemaField('had_product', 'STRING'),
+    bigquery.SchemaField('is_first_interaction', 'INT64'),
+    bigquery.SchemaField('loan_count', 'INT64'),
+    bigquery.SchemaField('loan_amount', 'FLOAT64'),
+    bigquery.SchemaField('deposit_count', 'INT64'),
+    bigquery.SchemaField('deposit_amount', 'FLOAT64'),
+    bigquery.SchemaField('card_count', 'INT64'),
+    bigquery.SchemaField('uploaded_at', 'DATETIME'),
+]
 
-def load_csv(file_path: str) -> pd.DataFrame:
-    """Load and validate CSV file"""
-    print(f"📂 Loading file: {file_path}")
-    
-    # Try different encodings
-    for encoding in ['utf-8', 'cp1251', 'latin1']:
+# Low-cardinality columns kept as pandas categoricals / Parquet dictionaries
+CATEGORICAL_COLUMNS = ['event_name', 'acquired_source', 'acquired_medium', 'acquired_campaign', 'had_product']
+
+ARROW_TYPES = {'STRING': pa.string(), 'DATE': pa.date32(), 'INT64': pa.int64(), 'FLOAT64': pa.float64(),
+               'DATETIME': pa.timestamp('us')}
+PARQUET_SCHEMA = pa.schema([
+    (field.name, pa.dictionary(pa.int32(), pa.string()) if field.name in CATEGORICAL_COLUMNS
+     else ARROW_TYPES[field.field_type])
+    for field in LOAD_SCHEMA
+])
+
+
+def sniff_encoding(file_path: str, sample_bytes: int = SNIFF_BYTES) -> str:
+    """First of ENCODINGS that decodes a sample of the file"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    for encoding in ENCODINGS:
         try:
-            df = pd.read_csv(file_path, encoding=encoding)
-            break
-        except:
+            # final=False: the sample may end in the middle of a character
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
             continue
-    else:
-        # Try Excel
-        df = pd.read_excel(file_path)
-    
-    print(f"   Rows: {len(df):,}")
-    print(f"   Columns: {len(df.columns)}")
-    
-    # Validate required columns
-    required = ['Event _date', 'Client_code', 'LOAN_COUNT', 'CARD_COUNT']
-    missing = [c for c in required if c not in df.columns]
+    return ENCODINGS[-1]
+
+
+def is_excel(file_path: str) -> bool:
+    with open(file_path, 'rb') as f:
+        return f.read(4) in EXCEL_MAGIC
+
+
+def validate_columns(df: pd.DataFrame):
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
-    
-    return df
 
 
-def transform_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Transform to match BigQuery schema"""
-    print("🔄 Transforming data...")
-    
+def read_chunks(file_path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield the file as DataFrames of at most chunk_rows rows"""
+    print(f"📂 Loading file: {file_path}")
+
+    if is_excel(file_path):
+        # Excel files cannot be read incrementally; only the CSV path is bounded
+        print("   Format: Excel (read whole)")
+        df = pd.read_excel(file_path)
+        print(f"   Columns: {len(df.columns)}")
+        validate_columns(df)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    encoding = sniff_encoding(file_path)
+    print(f"   Format: CSV ({encoding}), {chunk_rows:,} rows per chunk")
+    with pd.read_csv(file_path, encoding=encoding, chunksize=chunk_rows) as reader:
+        for i, chunk in enumerate(reader):
+            if i == 0:
+                print(f"   Columns: {len(chunk.columns)}")
+                validate_columns(chunk)
+            yield chunk
+
+
+def write_parquet(chunks, parquet_path: str, uploaded_at: datetime = None) -> int:
+    """Transform each chunk and append it to one Parquet file (a row group per chunk); returns the row count"""
+    uploaded_at = uploaded_at or datetime.now()
+    writer, rows, undated = None, 0, 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(transform_data(chunk, uploaded_at=uploaded_at),
+                                         preserve_index=False).cast(PARQUET_SCHEMA)
+            undated += table.column('event_date').null_count
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, PARQUET_SCHEMA, compression='snappy')
+            writer.write_table(table)
+            rows += table.num_rows
+            print(f"   {rows:,} rows transformed", end='\r')
+    finally:
+        if writer is not None:
+            writer.close()
+    print(f"   Rows: {rows:,}" + " " * 20)
+    if undated:
+        print(f"   ⚠️  {undated:,} rows with an empty or unparseable 'Event _date' are loaded with a NULL date")
+    return rows
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Source column, or all-missing if the export does not have it"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series(pd.NA, index=df.index, dtype='object')
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Nullable strings; integral numbers (IDs parsed as float because of gaps) lose the '.0'"""
+    if pd.api.types.is_numeric_dtype(series):
+        numbers = pd.to_numeric(series, errors='coerce')
+        if (numbers.dropna() % 1 == 0).all():
+            series = numbers.astype('Int64')
+    return series.astype('string')
+
+
+def _integer(series: pd.Series) -> pd.Series:
+    """Nullable integers, truncated like int(); unparseable values (inf and overflow included) become NULL"""
+    numbers = pd.to_numeric(series, errors='coerce').astype('float64')
+    return np.trunc(numbers.where(np.isfinite(numbers))).astype('Int64')
+
+
+def transform_data(df: pd.DataFrame, uploaded_at: datetime = None) -> pd.DataFrame:
+    """
+    Transform to match BigQuery schema. Vectorized: missing values stay NULL
+    (never the string 'nan'), counts are nullable Int64 (0 when the bank left
+    LOAN/DEPOSIT/CARD_COUNT empty), low-cardinality text is categorical.
+    """
+    amount = lambda name: pd.to_numeric(_column(df, name), errors='coerce').fillna(0).astype('float64')
     df_clean = pd.DataFrame({
-        'event_time_raw': df.get('Event Time', '').astype(str),
-        'event_date': pd.to_datetime(df['Event _date']).dt.date,
-        'event_name': df.get('Event Name', '').astype(str),
-        'token_id': df.get('Event Param Value (String)', '').astype(str),
-        'acquired_source': df.get('Acquired Source', '').astype(str),
-        'acquired_medium': df.get('Acquired Medium', '').astype(str),
-        'acquired_campaign': df.get('Acquired Campaign', '').astype(str),
-        'client_code': df['Client_code'].astype(str),
-        'soc_card': df.get('Soc_card', '').astype(str),
-        'count_soc_card': df.get('count_soc_card', 0).apply(safe_int),
-        'had_product': df.get('HAD_PRODUCT', '').astype(str),
-        'is_first_interaction': df.get('1-st/2-nd', 0).apply(safe_int),
-        'loan_count': df['LOAN_COUNT'].fillna(0).apply(safe_int),
-        'loan_amount': pd.to_numeric(df.get('LOAN_AMOUNT', 0), errors='coerce').fillna(0),
-        'deposit_count': df.get('DEPOSIT_COUNT', 0).fillna(0).apply(safe_int),
-        'deposit_amount': pd.to_numeric(df.get('DEPOSIT_AMOUNT', 0), errors='coerce').fillna(0),
-        'card_count': df.get('CARD_COUNT', 0).fillna(0).apply(safe_int),
-        'uploaded_at': datetime.now()
-    })
-    
-    return df_clean
+        'event_time_raw': _text(_column(df, 'Event Time')),
+        'event_date': pd.to_datetime(df['Event _date'], errors='coerce').dt.normalize(),
+        'event_name': _text(_column(df, 'Event Name')).astype('category'),
+        'token_id': _text(_column(df, 'Event Param Value (String)')),
+        'acquired_source': _text(_column(df, 'Acquired Source')).astype('category'),
+        'acquired_medium': _text(_column(df, 'Acquired Medium')).astype('category'),
+        'acquired_campaign': _text(_column(df, 'Acquired Campaign')).astype('category'),
+        'client_code': _text(df['Client_code']),
+        'soc_card': _text(_column(df, 'Soc_card')),
+        'count_soc_card': _integer(_column(df, 'count_soc_card')),
+        'had_product': _text(_column(df, 'HAD_PRODUCT')).astype('category'),
+        'is_first_interaction': _integer(_column(df, '1-st/2-nd')),
+        'loan_count': _integer(df['LOAN_COUNT']).fillna(0),
+        'loan_amount': amount('LOAN_AMOUNT'),
+        'deposit_count': _integer(_column(df, 'DEPOSIT_COUNT')).fillna(0),
+        'deposit_amount': amount('DEPOSIT_AMOUNT'),
+        'card_count': _integer(df['CARD_COUNT']).fillna(0),
+    }, index=df.index)
+    df_clean['uploaded_at'] = pd.Timestamp(uploaded_at or datetime.now())
+    return df_clean.reset_index(drop=True)
 
 
-def get_existing_count(client: bigquery.Client) -> int:
+def get_existing_count(client: bigquery.Client, ledger: RunLedger) -> int:
     """Get current row count in raw table"""
     query = f"SELECT COUNT(*) as cnt FROM `{RAW_TABLE}`"
     try:
-        return list(client.query(query).result())[0].cnt
+        return list(ledger.timed('raw_row_count', client.query(query)).result())[0].cnt
     except:
         return 0
 
 
-def load_to_bigquery(df: pd.DataFrame, client: bigquery.Client):
-    """Load data to BigQuery with deduplication"""
+def load_to_bigquery(parquet_path: str, row_count: int, client: bigquery.Client, ledger: RunLedger):
+    """Load the transformed Parquet file to BigQuery with deduplication"""
     
     # Check for existing data
-    existing_count = get_existing_count(client)
+    existing_count = get_existing_count(client, ledger)
     print(f"📊 Existing rows in raw table: {existing_count:,}")
     
     # Create temp table for new data
     temp_table = f'{PROJECT_ID}.ineco_raw._temp_bank_load'
     
-    print(f"⬆️  Uploading {len(df):,} rows to temp table...")
-    job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE")
-    client.load_table_from_dataframe(df, temp_table, job_config=job_config).result()
+    print(f"⬆️  Uploading {row_count:,} rows to temp table "
+          f"({os.path.getsize(parquet_path) / 1024**2:.1f} MB Parquet)...")
+    job_config = bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE",
+                                        source_format=bigquery.SourceFormat.PARQUET, schema=LOAD_SCHEMA)
+    with open(parquet_path, 'rb') as f:
+        job = client.load_table_from_file(f, temp_table, job_config=job_config)
+    ledger.timed('load_temp', job)
     
-    # Merge into raw table (deduplicate)
+    # Merge into raw table (deduplicate); missing IDs and unparseable dates are NULL, which '=' never matches
     print("🔀 Merging with deduplication...")
     merge_sql = f"""
     MERGE `{RAW_TABLE}` target
     USING `{temp_table}` source
-    ON target.token_id = source.token_id 
-       AND target.client_code = source.client_code
-       AND target.event_date = source.event_date
+    ON target.token_id IS NOT DISTINCT FROM source.token_id
+       AND target.client_code IS NOT DISTINCT FROM source.client_code
+       AND target.event_date IS NOT DISTINCT FROM source.event_date
     WHEN MATCHED THEN
         UPDATE SET
             loan_count = source.loan_count,
@@ -133,12 +258,12 @@ def load_to_bigquery(df: pd.DataFrame, client: bigquery.Client):
     WHEN NOT MATCHED THEN
         INSERT ROW
     """
-    client.query(merge_sql).result()
+    ledger.timed('merge_raw', client.query(merge_sql))
     
     # Get new count
-    new_count = get_existing_count(client)
+    new_count = get_existing_count(client, ledger)
     added = new_count - existing_count
-    updated = len(df) - added
+    updated = row_count - added
     
     print(f"✅ Results:")
     print(f"   New rows added: {added:,}")
@@ -151,7 +276,7 @@ def load_to_bigquery(df: pd.DataFrame, client: bigquery.Client):
     return added, updated
 
 
-def refresh_staging(client: bigquery.Client):
+def refresh_staging(client: bigquery.Client, ledger: RunLedger):
     """Refresh staging table with clean data"""
     print("🔄 Refreshing staging table...")
     
@@ -162,13 +287,14 @@ def refresh_staging(client: bigquery.Client):
     WHERE token_id IS NOT NULL
       AND client_code IS NOT NULL
     """
-    client.query(sql).result()
+    ledger.timed('refresh_staging', client.query(sql))
     
-    count = list(client.query(f"SELECT COUNT(*) as cnt FROM `{STAGING_TABLE}`").result())[0].cnt
+    count_job = client.query(f"SELECT COUNT(*) as cnt FROM `{STAGING_TABLE}`")
+    count = list(ledger.timed('staging_row_count', count_job).result())[0].cnt
     print(f"   Staging rows: {count:,}")
 
 
-def refresh_mart(client: bigquery.Client):
+def refresh_mart(client: bigquery.Client, ledger: RunLedger):
     """Refresh mart table with channel mapping"""
     print("🔄 Refreshing mart table...")
     
@@ -212,19 +338,20 @@ def refresh_mart(client: bigquery.Client):
         loan_amount + deposit_amount as total_revenue_amd
     FROM `{STAGING_TABLE}`
     """
-    client.query(sql).result()
+    ledger.timed('refresh_mart', client.query(sql))
     
-    count = list(client.query(f"SELECT COUNT(*) as cnt FROM `{MART_TABLE}`").result())[0].cnt
+    count_job = client.query(f"SELECT COUNT(*) as cnt FROM `{MART_TABLE}`")
+    count = list(ledger.timed('mart_row_count', count_job).result())[0].cnt
     print(f"   Mart rows: {count:,}")
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 load_bank_data.py <csv_file_path>")
-        print("Example: python3 load_bank_data.py /path/to/bank_conversions.csv")
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Load a bank conversion export (CSV or Excel) into BigQuery')
+    parser.add_argument('file_path', help='e.g. /path/to/bank_conversions.csv')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help=f'Rows read and transformed at a time (default: {CHUNK_ROWS:,})')
+    args = parser.parse_args()
+    file_path = args.file_path
     
     if not os.path.exists(file_path):
         print(f"❌ File not found: {file_path}")
@@ -232,7 +359,8 @@ def main():
     
     # Setup BigQuery client
     os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = CREDENTIALS_PATH
-    client = bigquery.Client(project=PROJECT_ID, location='EU')
+    client = create_executor(PROJECT_ID, location='EU')
+    ledger = RunLedger('load_bank_data')
     
     print("=" * 60)
     print("BANK CONVERSION DATA LOADER")
@@ -240,16 +368,19 @@ def main():
     print(f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
     
-    # Load and transform
-    df = load_csv(file_path)
-    df_clean = transform_data(df)
-    
-    # Load to BigQuery
-    added, updated = load_to_bigquery(df_clean, client)
+    # Read, transform and load in chunks
+    with tempfile.TemporaryDirectory(prefix='bank_load_') as tmp_dir:
+        parquet_path = os.path.join(tmp_dir, 'bank_conversions.parquet')
+        print("🔄 Transforming data...")
+        row_count = write_parquet(read_chunks(file_path, args.chunk_rows), parquet_path)
+        if row_count == 0:
+            print(f"❌ No rows in {file_path}")
+            sys.exit(1)
+        added, updated = load_to_bigquery(parquet_path, row_count, client, ledger)
     
     # Refresh downstream tables
-    refresh_staging(client)
-    refresh_mart(client)
+    refresh_staging(client, ledger)
+    refresh_mart(client, ledger)
     
     print()
     print("=" * 60)
@@ -265,12 +396,17 @@ def main():
         ROUND(SUM(loan_amount + deposit_amount)) as total_revenue
     FROM `{MART_TABLE}`
     """
-    stats = list(client.query(query).result())[0]
+    stats = list(ledger.timed('mart_totals', client.query(query)).result())[0]
     print(f"\n📊 Current Totals:")
     print(f"   Loans: {stats.loans}")
     print(f"   Cards: {stats.cards}")
     print(f"   Deposits: {stats.deposits}")
     print(f"   Total Revenue: {stats.total_revenue:,.0f} AMD")
+    
+    totals = ledger.totals()
+    print(f"\n💰 BigQuery: {totals['jobs']} jobs, {totals['bytes_billed'] / 1024**3:.2f} GB billed "
+          f"(~${totals['cost_usd']:.4f})")
+    ledger.flush(client)
 
 
 if __name__ == '__main__':
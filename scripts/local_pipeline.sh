@@ -0,0 +1,39 @@
+#!/bin/bash
+# Run the mart pipeline end to end on DuckDB (QUERY_EXECUTOR=duckdb), no BigQuery needed:
+# synthetic fixtures -> full refresh -> incremental refresh -> bank load -> data quality tests
+# Needs: pip install duckdb sqlglot google-cloud-bigquery pandas pyarrow openpyxl
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
+WORK_DIR="${LOCAL_PIPELINE_DIR:-$(mktemp -d)}"
+
+export QUERY_EXECUTOR=duckdb
+export DUCKDB_FIXTURES_DIR="$WORK_DIR/fixtures"
+export DUCKDB_PATH="$WORK_DIR/ineco.duckdb"
+export STATE_DIR="$WORK_DIR/state"
+export LOG_DIR="$WORK_DIR/logs"
+mkdir -p "$LOG_DIR"
+rm -f "$DUCKDB_PATH"
+
+echo "=== Local pipeline in $WORK_DIR ==="
+
+cd "$PROJECT_DIR/bigquery"
+python local_fixtures.py --output-dir "$DUCKDB_FIXTURES_DIR"
+
+echo "--- Full refresh ---"
+python refresh_marts.py --full --no-warm-cache
+
+echo "--- Incremental refresh (all shards changed) ---"
+rm -f "$STATE_DIR/ga4_shard_watermarks.json"
+python refresh_marts.py --no-warm-cache
+
+cd "$PROJECT_DIR/scripts"
+echo "--- Bank export load ---"
+python load_bank_data.py "$DUCKDB_FIXTURES_DIR/bank_export.csv"
+
+echo "--- Data quality tests ---"
+python data_quality_tests.py
+
+echo "=== Local pipeline passed ==="
@@ -50,25 +50,69 @@ CACHE_CONFIG = {
     "CACHE_REDIS_DB": REDIS_RESULTS_DB,
 }
 
-DATA_CACHE_CONFIG = CACHE_CONFIG
+# Chart data: entries carry the refresh versions of the ineco_marts tables
+# they read (bigquery/versioned_cache.py, mounted into /app/pythonpath) and
+# are dropped when refresh_marts.py publishes a newer one, so they can live
+# for a day instead of 5 minutes. Each worker also keeps the results it served
+# recently in memory (bigquery/tiered_cache.py).
+# Caps in seconds for results read from a table, e.g. {"fact_ad_spend": 3600}
+DATASET_CACHE_TIMEOUTS = {}
+
+DATA_CACHE_CONFIG = {
+    **CACHE_CONFIG,
+    "CACHE_TYPE": "tiered_cache.TieredRedisCache",
+    "CACHE_DEFAULT_TIMEOUT": int(os.environ.get("DATA_CACHE_TIMEOUT", 86400)),
+    "CACHE_OPTIONS": {
+        "l1_max_bytes": int(os.environ.get("DATA_CACHE_L1_MB", 64)) * 1024**2,
+        "l1_max_age": int(os.environ.get("DATA_CACHE_L1_MAX_AGE", 300)),
+        "dataset_timeouts": DATASET_CACHE_TIMEOUTS,
+    },
+}
 
 # =============================================================================
 # CELERY CONFIGURATION (for async queries)
 # =============================================================================
 
+# Each task family has its own queue and worker service in docker-compose.yml
+# (bigquery/celery_queues.py, mounted into /app/pythonpath)
+from celery.schedules import crontab
+from celery_queues import DEFAULT_QUEUE, route_task
+
 class CeleryConfig:
     broker_url = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CELERY_DB}"
     result_backend = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_RESULTS_DB}"
-    imports = ("superset.sql_lab",)
+    imports = (
+        "superset.sql_lab",
+        "superset.tasks.scheduler",
+        "superset.tasks.thumbnails",
+        "superset.tasks.cache",
+    )
+    task_routes = (route_task,)
+    task_default_queue = DEFAULT_QUEUE
+    # Reserve one task per process, so a long query never holds back a short one
+    worker_prefetch_multiplier = 1
     task_annotations = {
         "sql_lab.get_sql_results": {"rate_limit": "100/s"},
     }
+    beat_schedule = {
+        "reports.scheduler": {
+            "task": "reports.scheduler",
+            "schedule": crontab(minute="*", hour="*"),
+        },
+        "reports.prune_log": {
+            "task": "reports.prune_log",
+            "schedule": crontab(minute=0, hour=0),
+        },
+    }
 
 CELERY_CONFIG = CeleryConfig
 
-# Enable async queries - use RedisCache for results backend
-from flask_caching.backends.rediscache import RedisCache
-RESULTS_BACKEND = RedisCache(
+# Enable async queries - results are stored as zstd-compressed Arrow chunks
+# and SQL Lab reads back only the rows it displays (bigquery/arrow_results.py,
+# mounted into /app/pythonpath). Requires the msgpack + Arrow payload format.
+from arrow_results import ArrowResultsBackend
+RESULTS_BACKEND_USE_MSGPACK = True
+RESULTS_BACKEND = ArrowResultsBackend(
     host=REDIS_HOST,
     port=REDIS_PORT,
     db=REDIS_RESULTS_DB,
@@ -101,6 +145,19 @@ FEATURE_FLAGS = {
     "DYNAMIC_PLUGINS": False,  # Disabled - causes 404 errors
 }
 
+# =============================================================================
+# JINJA MACROS
+# =============================================================================
+
+# rollup_table(): the routed fact datasets (superset_rollups.sql) read the
+# smallest pre-aggregated rollup that can answer each chart query
+# (bigquery/rollups.py, mounted into /app/pythonpath)
+from rollups import rollup_table
+
+JINJA_CONTEXT_ADDONS = {
+    "rollup_table": rollup_table,
+}
+
 # =============================================================================
 # SECURITY CONFIGURATION
 # =============================================================================
@@ -124,6 +181,26 @@ SESSION_COOKIE_SAMESITE = "Lax"
 SQL_MAX_ROW = 100000
 DISPLAY_MAX_ROW = 10000
 
+# Queries on date-partitioned marts/staging tables without a partition filter
+# get a recent-date window (or are rejected, PARTITION_FILTER_MODE=reject), and
+# BigQuery stops any query over the user's maximum_bytes_billed
+# (bigquery/query_guard.py, mounted into /app/pythonpath)
+from functools import partial
+from query_guard import cap_bytes_billed, mutate_sql
+
+SQL_QUERY_MUTATOR = mutate_sql
+
+# GB billed per query by role; the most generous role of a user applies,
+# None means no cap
+ROLE_MAX_GB_BILLED = {
+    "Admin": None,
+    "Alpha": 200,
+    "Gamma": 20,
+    "sql_lab": 50,
+}
+DB_CONNECTION_MUTATOR = partial(cap_bytes_billed, role_caps=ROLE_MAX_GB_BILLED,
+                                default_gb=float(os.environ.get("DEFAULT_MAX_GB_BILLED", 20)))
+
 # Timeout for SQL queries (seconds)
 SQLLAB_TIMEOUT = 300
 SUPERSET_WEBSERVER_TIMEOUT = 300
@@ -0,0 +1,87 @@
+-- ================================================================
+-- ROUTED FACT DATASETS: charts read the smallest rollup that fits
+-- ================================================================
+-- fact_sessions_routed / fact_conversions_routed are virtual datasets over
+-- the rollup_table() Jinja macro (bigquery/rollups.py, registered in
+-- superset_config.py). For each chart query the macro picks the smallest of
+-- agg_<fact>_monthly_campaign, agg_<fact>_daily_channel and
+-- agg_<fact>_weekly_channel_product that has the chart's columns, metrics,
+-- time grain and time range, and falls back to the fact table otherwise
+-- (e.g. device or city breakdowns, COUNT/AVG metrics, SUM of a distinct user
+-- count instead of its unique_* sketch metric, custom SQL filters).
+-- Requires ENABLE_TEMPLATE_PROCESSING. Safe to re-run.
+
+-- Step 1: routed datasets
+INSERT INTO tables (
+  table_name, schema, database_id, sql, is_sqllab_view,
+  filter_select_enabled, main_dttm_col,
+  created_on, changed_on, uuid
+)
+SELECT
+  d.table_name || '_routed',
+  'ineco_marts',
+  d.database_id,
+  'SELECT * FROM {{ rollup_table(''' || d.table_name || ''', columns=columns, groupby=groupby, metrics=metrics, '
+    || 'filter=filter, from_dttm=from_dttm, to_dttm=to_dttm, time_grain=time_grain) }}',
+  false,
+  true,
+  'date',
+  NOW(),
+  NOW(),
+  gen_random_uuid()
+FROM tables d
+WHERE d.table_name IN ('fact_sessions', 'fact_conversions') AND d.schema = 'ineco_marts'
+AND NOT EXISTS (
+  SELECT 1 FROM tables t WHERE t.table_name = d.table_name || '_routed'
+);
+
+-- Routed datasets created before the macro received the time grain
+UPDATE tables r
+SET sql = 'SELECT * FROM {{ rollup_table(''' || d.table_name || ''', columns=columns, groupby=groupby, metrics=metrics, '
+    || 'filter=filter, from_dttm=from_dttm, to_dttm=to_dttm, time_grain=time_grain) }}',
+    changed_on = NOW()
+FROM tables d
+WHERE r.table_name = d.table_name || '_routed'
+AND d.table_name IN ('fact_sessions', 'fact_conversions') AND d.schema = 'ineco_marts'
+AND r.sql NOT LIKE '%time_grain=time_grain%';
+
+-- Step 2: same columns and saved metrics as the fact datasets
+INSERT INTO table_columns (table_id, column_name, verbose_name, is_dttm, type, groupby, filterable,
+                           expression, description, created_on, changed_on, uuid)
+SELECT r.id, c.column_name, c.verbose_name, c.is_dttm, c.type, c.groupby, c.filterable,
+       c.expression, c.description, NOW(), NOW(), gen_random_uuid()
+FROM tables r
+JOIN tables d ON r.table_name = d.table_name || '_routed' AND d.schema = 'ineco_marts'
+JOIN table_columns c ON c.table_id = d.id
+WHERE r.table_name IN ('fact_sessions_routed', 'fact_conversions_routed')
+AND NOT EXISTS (
+  SELECT 1 FROM table_columns tc
+  WHERE tc.table_id = r.id AND tc.column_name = c.column_name
+);
+
+INSERT INTO sql_metrics (metric_name, verbose_name, metric_type, expression, d3format, description,
+                         table_id, created_on, changed_on, uuid)
+SELECT m.metric_name, m.verbose_name, m.metric_type, m.expression, m.d3format, m.description,
+       r.id, NOW(), NOW(), gen_random_uuid()
+FROM tables r
+JOIN tables d ON r.table_name = d.table_name || '_routed' AND d.schema = 'ineco_marts'
+JOIN sql_metrics m ON m.table_id = d.id
+WHERE r.table_name IN ('fact_sessions_routed', 'fact_conversions_routed')
+AND NOT EXISTS (
+  SELECT 1 FROM sql_metrics sm
+  WHERE sm.table_id = r.id AND sm.metric_name = m.metric_name
+);
+
+-- Step 3: point the fact charts at the routed datasets
+UPDATE slices s
+SET datasource_id = r.id,
+    params = REPLACE(s.params, '"' || d.id || '__table"', '"' || r.id || '__table"'),
+    changed_on = NOW()
+FROM tables d
+JOIN tables r ON r.table_name = d.table_name || '_routed'
+WHERE d.table_name IN ('fact_sessions', 'fact_conversions') AND d.schema = 'ineco_marts'
+AND s.datasource_type = 'table' AND s.datasource_id = d.id;
+
+-- Check which charts were moved
+-- SELECT s.id, s.slice_name, t.table_name FROM slices s JOIN tables t ON t.id = s.datasource_id
+-- WHERE t.table_name LIKE '%_routed' ORDER BY s.id;
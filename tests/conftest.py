@@ -0,0 +1,8 @@
+"""Put bigquery/ and scripts/ on the path, as the scripts themselves do."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('bigquery', 'scripts'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
@@ -0,0 +1,44 @@
+"""transform_data() of scripts/load_bank_data.py: NULLs, not 'nan' strings or aborted loads."""
+
+import pandas as pd
+
+from load_bank_data import _integer, transform_data
+
+
+def export(**columns) -> pd.DataFrame:
+    rows = len(next(iter(columns.values())))
+    base = {'Event _date': ['2025-03-01'] * rows, 'Client_code': [1234567.0] * rows,
+            'LOAN_COUNT': [1] * rows, 'CARD_COUNT': [0] * rows}
+    return pd.DataFrame({**base, **columns})
+
+
+def test_integer_non_finite_values_become_null():
+    result = _integer(pd.Series(['inf', '-inf', '1e400', float('inf'), '2.9', '-1.5', 'x', None]))
+    assert str(result.dtype) == 'Int64'
+    assert result.isna().tolist() == [True, True, True, True, False, False, True, True]
+    assert result.dropna().tolist() == [2, -1]
+
+
+def test_non_finite_counts_do_not_abort_the_transform():
+    df = transform_data(export(LOAN_COUNT=['inf', '-inf', 3], CARD_COUNT=[1e400, 2, None]))
+    assert df['loan_count'].tolist() == [0, 0, 3]
+    assert df['card_count'].tolist() == [0, 2, 0]
+
+
+def test_missing_text_stays_null():
+    df = transform_data(export(**{'Acquired Source': ['google', None], 'Client_code': [1234567.0, None]}))
+    assert df['client_code'].tolist()[0] == '1234567'
+    assert df['client_code'].isna().tolist() == [False, True]
+    assert df['acquired_source'].isna().tolist() == [False, True]
+
+
+def test_unparseable_dates_are_null():
+    df = transform_data(export(**{'Event _date': ['2025-03-01', 'not a date']}))
+    assert df['event_date'].isna().tolist() == [False, True]
+
+
+def test_synthetic_export_keeps_gaps_null():
+    from benchmark_transform import check_null_handling, null_handling, synthetic_export
+
+    source = synthetic_export(2_000)
+    check_null_handling(null_handling(source, transform_data(source)))
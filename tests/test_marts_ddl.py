@@ -0,0 +1,22 @@
+"""The checked-in bigquery/marts DDL matches what refresh_marts.py builds."""
+
+import os
+
+import pytest
+
+from refresh_marts import FACT_CLUSTERING, GENERATED_DDL, MARTS_SQL_DIR, generated_ddl
+
+
+@pytest.mark.parametrize('table_name', sorted(GENERATED_DDL))
+def test_checked_in_ddl_is_current(table_name):
+    with open(os.path.join(MARTS_SQL_DIR, f"{table_name}.sql")) as f:
+        assert f.read() == generated_ddl(table_name), \
+            f"bigquery/marts/{table_name}.sql is stale: run python3 bigquery/refresh_marts.py --write-ddl"
+
+
+@pytest.mark.parametrize('fact_name', ['fact_sessions', 'fact_conversions'])
+def test_fact_ddl_has_the_surrogate_key_layout(fact_name):
+    sql = generated_ddl(fact_name)
+    assert f"CLUSTER BY {', '.join(FACT_CLUSTERING)}" in sql
+    assert 'ch.channel_key, cp.campaign_key, g.geo_key' in sql
+    assert 'HLL_COUNT.INIT' in sql
@@ -0,0 +1,70 @@
+"""mutate_sql() of bigquery/query_guard.py: which predicates count as a partition filter."""
+
+import pytest
+
+import query_guard
+from query_guard import PartitionFilterRequired, mutate_sql
+
+WINDOW = 'DATE_SUB(CURRENT_DATE'
+
+
+def windowed(sql: str) -> bool:
+    return WINDOW in mutate_sql(sql)
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM ineco_marts.fact_sessions",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date IS NOT NULL",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date <> '2026-01-01'",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date >= '2026-01-01' OR channel_key = 'x'",
+    "SELECT * FROM ineco_staging.stg_events_clean WHERE event_name = 'page_view'",
+])
+def test_scan_without_range_filter_gets_window(sql):
+    assert windowed(sql)
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date >= '2026-01-01'",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE '2026-01-01' <= date AND sessions > 0",
+    "SELECT * FROM ineco_marts.fact_sessions f WHERE f.date BETWEEN '2026-01-01' AND '2026-01-31'",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date IN ('2026-01-01', '2026-01-02')",
+    "SELECT * FROM ineco_marts.fact_sessions WHERE date = '2026-01-01' OR date = '2026-02-01'",
+    "SELECT * FROM ineco_staging.stg_events WHERE _PARTITIONDATE > '2026-01-01'",
+])
+def test_range_or_equality_filter_passes(sql):
+    assert mutate_sql(sql) == sql
+
+
+def test_filter_on_another_tables_date_does_not_count():
+    sql = ("SELECT * FROM ineco_marts.fact_sessions s JOIN ineco_marts.fact_conversions c "
+           "ON s.channel_key = c.channel_key WHERE c.date >= '2026-01-01'")
+    mutated = mutate_sql(sql)
+    assert f's.date >= {WINDOW}' in mutated
+    assert f'c.date >= {WINDOW}' not in mutated
+
+
+def test_cte_filtered_inside_passes():
+    sql = ("WITH recent AS (SELECT * FROM ineco_marts.fact_sessions WHERE date >= '2026-01-01') "
+           "SELECT channel_key, SUM(sessions) FROM recent GROUP BY channel_key")
+    assert mutate_sql(sql) == sql
+
+
+def test_cte_filtered_by_outer_query_passes():
+    for where in ("date >= '2026-01-01'", "recent.date >= '2026-01-01'"):
+        sql = f"WITH recent AS (SELECT * FROM ineco_marts.fact_sessions) SELECT * FROM recent WHERE {where}"
+        assert mutate_sql(sql) == sql
+
+
+def test_cte_without_filter_gets_window_inside():
+    sql = ("WITH recent AS (SELECT * FROM ineco_marts.fact_sessions) "
+           "SELECT * FROM recent WHERE date IS NOT NULL")
+    mutated = mutate_sql(sql)
+    assert f'fact_sessions.date >= {WINDOW}' in mutated
+
+
+def test_reject_mode_raises(monkeypatch):
+    monkeypatch.setattr(query_guard, 'PARTITION_FILTER_MODE', 'reject')
+    with pytest.raises(PartitionFilterRequired, match='fact_sessions'):
+        mutate_sql("SELECT * FROM ineco_marts.fact_sessions WHERE date IS NOT NULL")
+    sql = "SELECT * FROM ineco_marts.fact_sessions WHERE date >= '2026-01-01'"
+    assert mutate_sql(sql) == sql